@@ -37,6 +37,7 @@ test
 """
 
 from authorize.client import AuthorizeClient
-from authorize.data import Address, CreditCard
-from authorize.exceptions import AuthorizeConnectionError, AuthorizeError, \
-    AuthorizeInvalidError, AuthorizeResponseError
+from authorize.data import Address, CreditCard, Money
+from authorize.exceptions import AuthorizeCircuitOpenError, \
+    AuthorizeConnectionError, AuthorizeError, AuthorizeInvalidError, \
+    AuthorizeResponseError
@@ -1,22 +1,105 @@
-from decimal import Decimal
 from six import text_type
 from six.moves.urllib.parse import urlencode
 from datetime import datetime
 from ssl import SSLError
 
 from suds import WebFault
+from suds.cache import NoCache
 from suds.client import Client
-from authorize.data import Address, CreditCard
+from authorize.data import Address, CreditCard, Money
 
+from authorize import hedging, timing, tracing
+from authorize.apis import streaming
 from authorize.apis.transaction import parse_response
+from authorize.breaker import CircuitBreaker
 from authorize.exceptions import AuthorizeConnectionError, \
     AuthorizeError, AuthorizeResponseError, AuthorizeInvalidError
+from authorize.limiter import RateLimiter
+from authorize.scheduler import Scheduler
+from authorize.transport import default_transport, SudsTransport
+from authorize.validation import validate
 
 PROD_URL = 'https://api.authorize.net/soap/v1/Service.asmx?WSDL'
 TEST_URL = 'https://apitest.authorize.net/soap/v1/Service.asmx?WSDL'
+# The path of the service on servers given by a custom base URL
+SERVICE_PATH = '/soap/v1/Service.asmx'
+
+# Operations that only read data, and so are safe to send twice
+READ_ONLY_SERVICES = frozenset(['GetCustomerProfile',
+    'GetCustomerProfileIds'])
+
+# Billing fields of a payment profile, and their names in exported records
+BILL_TO_FIELDS = [
+    ('firstName', 'first_name'),
+    ('lastName', 'last_name'),
+    ('company', 'company'),
+    ('address', 'street'),
+    ('city', 'city'),
+    ('state', 'state'),
+    ('zip', 'zip_code'),
+    ('country', 'country'),
+    ('phoneNumber', 'phone_number'),
+]
+
+
+def profile_record(profile, payments, get):
+    """
+    Returns a customer profile as a dictionary of plain strings, with a list
+    of its ``payments``. ``get(item, name)`` returns a field of the profile
+    or of one of its payments, or ``None`` if it isn't set.
+    """
+    def text(item, name):
+        value = get(item, name)
+        return None if value is None else text_type(value)
+
+    record = {
+        'profile_id': text(profile, 'customerProfileId'),
+        'merchant_customer_id': text(profile, 'merchantCustomerId'),
+        'description': text(profile, 'description'),
+        'email': text(profile, 'email'),
+        'payments': [],
+    }
+    for payment in payments:
+        card = get(get(payment, 'payment'), 'creditCard')
+        bill_to = get(payment, 'billTo')
+        entry = {
+            'payment_id': text(payment, 'customerPaymentProfileId'),
+            'number': text(card, 'cardNumber'),
+            'expiration': text(card, 'expirationDate'),
+        }
+        for field, name in BILL_TO_FIELDS:
+            entry[name] = text(bill_to, field)
+        record['payments'].append(entry)
+    return record
+
+
+def _soap_field(item, name):
+    return None if item is None else getattr(item, name, None)
+
+
+def _payment_info(email, number, bill_to):
+    # Builds the result of retrieve_saved_payment from the profile's email,
+    # the masked card number and a dictionary of the billing fields
+    kwargs = {
+        'street': bill_to.get('address'),
+        'city': bill_to.get('city'),
+        'state': bill_to.get('state'),
+        'zip_code': bill_to.get('zip'),
+        'country': bill_to.get('country')}
+    kwargs = dict(
+        [(key, text_type(value)) for key, value in kwargs.items() if value])
+    return {
+        'email': email,
+        'number': text_type(number),
+        'first_name': text_type(bill_to.get('firstName', '')),
+        'last_name': text_type(bill_to.get('lastName', '')),
+        'address': Address(**kwargs),
+    }
 
 
 class CustomerAPI(object):
+    endpoint = 'cim'
+
     def __init__(self, login_id, transaction_key, debug=True, test=False):
         self.url = TEST_URL if debug else PROD_URL
         self.login_id = login_id
@@ -27,12 +110,31 @@ class CustomerAPI(object):
             'x_delim_data': 'TRUE',
             'x_delim_char': ';',
         })
+        self.breaker = CircuitBreaker(self.endpoint, enabled=False)
+        self.limiter = RateLimiter()
+        self.scheduler = Scheduler()
+        self.transport = None
+        self.location = None
+        self.hedger = None
+        # Whether the hot operations read their replies with the streaming
+        # parser instead of suds
+        self.streaming = False
 
     @property
     def client(self):
         # Lazy instantiation of SOAP client, which hits the WSDL url
         if not hasattr(self, '_client'):
-            self._client = Client(self.url)
+            options = {'plugins': [tracing.PhasePlugin()]}
+            if self.location is not None:
+                # Overrides the service address given in the WSDL
+                options['location'] = self.location
+            if self.transport is not None:
+                # Skip the WSDL cache so the transport sees every request
+                options['transport'] = SudsTransport(self.transport)
+                options['cache'] = NoCache()
+            else:
+                options['transport'] = SudsTransport(default_transport())
+            self._client = Client(self.url, **options)
         return self._client
 
     @property
@@ -47,20 +149,55 @@ class CustomerAPI(object):
     def _make_call(self, service, *args):
         # Provides standard API call error handling
         method = getattr(self.client.service, service)
-        try:
-            response = method(self.client_auth, *args)
-        except (WebFault, SSLError) as e:
-            raise AuthorizeConnectionError('Error contacting SOAP API.')
-        if response.resultCode != 'Ok':
-            error = response.messages[0][0]
-            e = AuthorizeResponseError('%s: %s' % (error.code, error.text))
-            e.full_response = {
-                'response_code': error.code,
-                'response_text': error.text,
-            }
-            raise e
+        with timing.timed(self.endpoint, service):
+            with tracing.span(self.endpoint, service), \
+                    self.scheduler.slot(self.login_id), \
+                    self.limiter.slot(self.endpoint, service), \
+                    self.breaker.guard():
+                tracing.mark('wait')
+                try:
+                    if self.hedger and service in READ_ONLY_SERVICES:
+                        response = hedging.call(self, service, method,
+                            self.client_auth, *args)
+                    else:
+                        response = method(self.client_auth, *args)
+                except (WebFault, SSLError) as e:
+                    raise AuthorizeConnectionError(
+                        'Error contacting SOAP API.')
+            if response.resultCode != 'Ok':
+                error = response.messages[0][0]
+                e = AuthorizeResponseError(
+                    '%s: %s' % (error.code, error.text))
+                e.full_response = {
+                    'response_code': error.code,
+                    'response_text': error.text,
+                }
+                raise e
         return response
 
+    def _stream(self, service, *args, **options):
+        # Calls a hot operation, reading only the given parts of its reply
+        return streaming.call(self, service, args,
+            hedge=service in READ_ONLY_SERVICES, **options)
+
+    def _send(self, service, *args):
+        # Calls an operation whose reply holds nothing but its result
+        if self.streaming:
+            self._stream(service, *args)
+        else:
+            self._make_call(service, *args)
+
+    def _transact(self, transaction):
+        # Creates a saved card transaction, returning its parsed response
+        args = (transaction, self.transaction_options)
+        if self.streaming:
+            direct_response = self._stream('CreateCustomerProfileTransaction',
+                *args, fields=['directResponse'])['directResponse']
+        else:
+            direct_response = self._make_call(
+                'CreateCustomerProfileTransaction', *args).directResponse
+        return parse_response(direct_response)
+
     def create_saved_profile(self, internal_id, payments=None, email=None):
         """
         Creates a user profile to which you can attach saved payments.
@@ -77,6 +214,16 @@ class CustomerAPI(object):
                 'ArrayOfCustomerPaymentProfileType')
             payment_array.CustomerPaymentProfileType = payments
             profile.paymentProfiles = payment_array
+        if self.streaming:
+            result = self._stream('CreateCustomerProfile', profile, 'none',
+                fields=['customerProfileId'],
+                lists=['customerPaymentProfileIdList'])
+            profile_id = int(result['customerProfileId'])
+            payment_ids = None
+            if payments:
+                payment_ids = [int(payment_id) for payment_id
+                    in result['customerPaymentProfileIdList']]
+            return profile_id, payment_ids
         response = self._make_call('CreateCustomerProfile', profile, 'none')
         profile_id = response.customerProfileId
         payment_ids = None
@@ -128,7 +275,11 @@ class CustomerAPI(object):
 
         # If a profile id is provided, create saved payment on that profile
         # Otherwise, return an object for a later call to create_saved_profile
-        if profile_id:
+        if profile_id and self.streaming:
+            return int(self._stream('CreateCustomerPaymentProfile',
+                profile_id, payment_profile, 'none',
+                fields=['customerPaymentProfileId'])['customerPaymentProfileId'])
+        elif profile_id:
             response = self._make_call('CreateCustomerPaymentProfile',
                 profile_id, payment_profile, 'none')
             return response.customerPaymentProfileId
@@ -137,13 +288,23 @@ class CustomerAPI(object):
 
     def retrieve_saved_payment(self, profile_id, payment_id):
         payment_id = int(payment_id)
+        if self.streaming:
+            result = self._stream('GetCustomerProfile', profile_id,
+                payment_id=payment_id)
+            saved_payment = result.get('payment')
+            if not saved_payment:
+                raise AuthorizeError(
+                    "Payment ID does not exist for this profile.")
+            email = result.get('email')
+            if email is not None:
+                email = text_type(email)
+            return _payment_info(email, saved_payment['number'],
+                saved_payment['billTo'])
         profile = self._make_call(
             'GetCustomerProfile', profile_id).profile
-        payment_info = {}
         email = None
         if hasattr(profile, 'email'):
             email = text_type(profile.email)
-        payment_info['email'] = email
         saved_payment = None
         for payment in profile.paymentProfiles[0]:
             if payment.customerPaymentProfileId == payment_id:
@@ -151,21 +312,30 @@ class CustomerAPI(object):
                 break
         if not saved_payment:
             raise AuthorizeError("Payment ID does not exist for this profile.")
-        payment_info['number'] = text_type(
-            saved_payment.payment.creditCard.cardNumber)
         data = saved_payment.billTo
-        payment_info['first_name'] = text_type(getattr(data, 'firstName', ''))
-        payment_info['last_name'] = text_type(getattr(data, 'lastName', ''))
-        kwargs = {
-            'street': getattr(data, 'address', None),
-            'city': getattr(data, 'city', None),
-            'state': getattr(data, 'state', None),
-            'zip_code': getattr(data, 'zip', None),
-            'country': getattr(data, 'country', None)}
-        kwargs = dict(
-            [(key, text_type(value)) for key, value in kwargs.items() if value])
-        payment_info['address'] = Address(**kwargs)
-        return payment_info
+        bill_to = dict((field, getattr(data, field))
+            for field, _ in BILL_TO_FIELDS if hasattr(data, field))
+        return _payment_info(email,
+            saved_payment.payment.creditCard.cardNumber, bill_to)
+
+    def list_profile_ids(self):
+        """Returns the ids of every customer profile, as strings."""
+        if self.streaming:
+            return self._stream('GetCustomerProfileIds',
+                lists=['ids']).get('ids', [])
+        response = self._make_call('GetCustomerProfileIds')
+        ids = getattr(getattr(response, 'ids', None), 'long', None) or []
+        return [text_type(profile_id) for profile_id in ids]
+
+    def retrieve_profile(self, profile_id):
+        """
+        Returns a customer profile and its saved payments as a dictionary,
+        in the format of :func:`profile_record`.
+        """
+        profile = self._make_call('GetCustomerProfile', profile_id).profile
+        payments = getattr(getattr(profile, 'paymentProfiles', None),
+            'CustomerPaymentProfileMaskedType', None) or []
+        return profile_record(profile, payments, _soap_field)
 
     def update_saved_payment(self, profile_id, payment_id, **kwargs):
         payment_profile = self.client.factory.create(
@@ -199,7 +369,7 @@ class CustomerAPI(object):
         payment_profile = self._address_to_profile(
             kwargs['address'], payment_profile)
 
-        self._make_call(
+        self._send(
             'UpdateCustomerPaymentProfile', profile_id,
             payment_profile, 'none')
 
@@ -208,60 +378,47 @@ class CustomerAPI(object):
         profile = self.client.factory.create('CustomerProfileExType')
         profile.email = kwargs['email']
         profile.customerProfileId = profile_id
-        self._make_call('UpdateCustomerProfile', profile)
+        self._send('UpdateCustomerProfile', profile)
 
     def delete_saved_profile(self, profile_id):
-        self._make_call('DeleteCustomerProfile', profile_id)
+        self._send('DeleteCustomerProfile', profile_id)
 
     def delete_saved_payment(self, profile_id, payment_id):
-        self._make_call('DeleteCustomerPaymentProfile',
+        self._send('DeleteCustomerPaymentProfile',
             profile_id, payment_id)
 
     def auth(self, profile_id, payment_id, amount, cvv=None):
-        if cvv is not None:
-            try:
-                int(cvv)
-            except ValueError:
-                raise AuthorizeInvalidError("CVV Must be a number.")
+        validate('cim.AUTH_ONLY', amount=amount, cvv=cvv)
         transaction = self.client.factory.create('ProfileTransactionType')
         auth = self.client.factory.create('ProfileTransAuthOnlyType')
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+        amount = Money.parse(amount)
         auth.amount = str(amount)
         auth.customerProfileId = profile_id
         auth.customerPaymentProfileId = payment_id
         auth.cardCode = cvv
         transaction.profileTransAuthOnly = auth
-        response = self._make_call('CreateCustomerProfileTransaction',
-            transaction, self.transaction_options)
-        return parse_response(response.directResponse)
+        return self._transact(transaction)
 
     def capture(self, profile_id, payment_id, amount, cvv=None):
-        if cvv is not None:
-            try:
-                int(cvv)
-            except ValueError:
-                raise AuthorizeInvalidError("CVV Must be a number.")
+        validate('cim.AUTH_CAPTURE', amount=amount, cvv=cvv)
         transaction = self.client.factory.create('ProfileTransactionType')
         capture = self.client.factory.create('ProfileTransAuthCaptureType')
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+        amount = Money.parse(amount)
         capture.amount = str(amount)
         capture.customerProfileId = profile_id
         capture.customerPaymentProfileId = payment_id
         capture.cardCode = cvv
         transaction.profileTransAuthCapture = capture
-        response = self._make_call('CreateCustomerProfileTransaction',
-            transaction, self.transaction_options)
-        return parse_response(response.directResponse)
+        return self._transact(transaction)
 
     def credit(self, profile_id, payment_id, amount):
         # Creates an "unlinked credit" (as opposed to refunding a previous transaction)
+        validate('cim.CREDIT', amount=amount)
         transaction = self.client.factory.create('ProfileTransactionType')
         credit = self.client.factory.create('ProfileTransRefundType')
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+        amount = Money.parse(amount)
         credit.amount = str(amount)
         credit.customerProfileId = profile_id
         credit.customerPaymentProfileId = payment_id
         transaction.profileTransRefund = credit
-        response = self._make_call('CreateCustomerProfileTransaction',
-            transaction, self.transaction_options)
-        return parse_response(response.directResponse)
+        return self._transact(transaction)
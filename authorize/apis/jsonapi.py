@@ -0,0 +1,380 @@
+from collections import OrderedDict
+from datetime import datetime
+import json
+
+from six.moves.urllib.parse import urlencode
+from six.moves.urllib.request import Request, urlopen
+
+from authorize import hedging, timing, tracing, wirelog
+from authorize.apis.customer import profile_record, READ_ONLY_SERVICES
+from authorize.apis.recurring import validate_subscription
+from authorize.apis.transaction import parse_response
+from authorize.breaker import CircuitBreaker
+from authorize.data import Address, CreditCard, Money
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeError, AuthorizeInvalidError, AuthorizeResponseError
+from authorize.limiter import RateLimiter
+from authorize.scheduler import Scheduler
+from authorize.validation import validate
+
+
+PROD_URL = 'https://api.authorize.net/xml/v1/request.api'
+TEST_URL = 'https://apitest.authorize.net/xml/v1/request.api'
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def request_name(service):
+    """
+    Returns the JSON API request name for the SOAP ``service`` of the same
+    name, such as ``createCustomerProfileRequest`` for
+    ``CreateCustomerProfile``.
+    """
+    if not service.startswith('ARB'):
+        service = service[0].lower() + service[1:]
+    return service + 'Request'
+
+
+def _object(*fields):
+    # The API reads requests in the order of its schema, so objects keep the
+    # order of their fields; fields set to None are left out
+    return OrderedDict((k, v) for k, v in fields if v is not None)
+
+
+def _amount(value):
+    return str(Money.parse(value))
+
+
+def _bill_to(first_name, last_name, address):
+    fields = [('firstName', first_name), ('lastName', last_name)]
+    if address:
+        fields += [
+            ('address', address.street),
+            ('city', address.city),
+            ('state', address.state),
+            ('zip', address.zip_code),
+            ('country', address.country),
+        ]
+    return _object(*[(k, v) for k, v in fields if v])
+
+
+def _field(item, name):
+    return None if item is None else item.get(name)
+
+
+def _credit_card(credit_card):
+    return _object(
+        ('cardNumber', credit_card.card_number),
+        ('expirationDate', '{0.exp_year}-{0.exp_month:0>2}'.format(
+            credit_card)),
+        ('cardCode', credit_card.cvv),
+    )
+
+
+class JSONAPI(object):
+    """
+    The request handling shared by the JSON backends, which send the same
+    requests as the SOAP services to Authorize.net's JSON API. Requests are
+    encoded with the standard library's ``json`` module, so there is no WSDL
+    to fetch and parse before the first call.
+    """
+    def __init__(self, login_id, transaction_key, debug=True, test=False):
+        self.url = TEST_URL if debug else PROD_URL
+        self.login_id = login_id
+        self.transaction_key = transaction_key
+        self.breaker = CircuitBreaker(self.endpoint, enabled=False)
+        self.limiter = RateLimiter()
+        self.scheduler = Scheduler()
+        self.transport = None
+        self.hedger = None
+
+    def _send(self, body):
+        # Posts the request, using urlopen unless a transport is installed
+        wirelog.capture('request', body)
+        if self.transport is None:
+            resource = urlopen(Request(self.url, body, JSON_HEADERS))
+            try:
+                data = resource.read()
+            finally:
+                resource.close()
+        else:
+            reply = self.transport.send(self.url, body, JSON_HEADERS)
+            data = reply.body
+            if reply.code != 200:
+                wirelog.capture('response', data)
+                raise IOError('HTTP {0}'.format(reply.code))
+        wirelog.capture('response', data)
+        return data
+
+    def _make_call(self, service, *fields):
+        with timing.timed(self.endpoint, service), \
+                tracing.span(self.endpoint, service):
+            body = json.dumps({request_name(service): _object(
+                ('merchantAuthentication', _object(
+                    ('name', self.login_id),
+                    ('transactionKey', self.transaction_key),
+                )), *fields)}, separators=(',', ':')).encode('utf-8')
+            tracing.mark('build')
+            with self.scheduler.slot(self.login_id), \
+                    self.limiter.slot(self.endpoint, service), \
+                    self.breaker.guard():
+                tracing.mark('wait')
+                try:
+                    if self.hedger and service in READ_ONLY_SERVICES:
+                        response = hedging.call(self, service, self._send,
+                            body)
+                    else:
+                        response = self._send(body)
+                except IOError as e:
+                    raise AuthorizeConnectionError(e)
+            tracing.mark('network')
+            try:
+                # Responses start with a byte order mark
+                response = json.loads(response.decode('utf-8-sig'))
+                messages = response['messages']
+            except (ValueError, KeyError, TypeError):
+                raise AuthorizeConnectionError(
+                    'Invalid response from the JSON API.')
+            tracing.mark('parse')
+            if messages.get('resultCode') != 'Ok':
+                error = messages['message'][0]
+                e = AuthorizeResponseError(
+                    '%s: %s' % (error['code'], error['text']))
+                e.full_response = {
+                    'response_code': error['code'],
+                    'response_text': error['text'],
+                }
+                raise e
+        return response
+
+
+class JSONCustomerAPI(JSONAPI):
+    """
+    Saved payments through the JSON API, with the same methods as
+    :class:`CustomerAPI <authorize.apis.customer.CustomerAPI>`.
+    """
+    endpoint = 'cim'
+
+    def __init__(self, login_id, transaction_key, debug=True, test=False):
+        JSONAPI.__init__(self, login_id, transaction_key, debug, test)
+        self.transaction_options = urlencode({
+            'x_version': '3.1',
+            'x_test_request': 'Y' if test else 'F',
+            'x_delim_data': 'TRUE',
+            'x_delim_char': ';',
+        })
+
+    def create_saved_profile(self, internal_id, payments=None, email=None):
+        """
+        Creates a user profile with any saved payments, as generated by
+        create_saved_payment. Returns the user profile id and the ids of the
+        saved payments.
+        """
+        profile = _object(
+            ('merchantCustomerId', internal_id),
+            ('email', email),
+            ('paymentProfiles', payments or None),
+        )
+        response = self._make_call('CreateCustomerProfile',
+            ('profile', profile), ('validationMode', 'none'))
+        payment_ids = None
+        if payments:
+            payment_ids = response['customerPaymentProfileIdList']
+        return response['customerProfileId'], payment_ids
+
+    def create_saved_payment(self, credit_card, address=None, profile_id=None):
+        """
+        Creates a payment profile, attached to the profile with
+        ``profile_id`` if given. Otherwise it is returned, to be passed to
+        create_saved_profile.
+        """
+        payment_profile = _object(
+            ('customerType', 'individual'),
+            ('billTo', _bill_to(credit_card.first_name,
+                credit_card.last_name, address)),
+            ('payment', _object(('creditCard', _credit_card(credit_card)))),
+        )
+        if profile_id:
+            response = self._make_call('CreateCustomerPaymentProfile',
+                ('customerProfileId', profile_id),
+                ('paymentProfile', payment_profile),
+                ('validationMode', 'none'))
+            return response['customerPaymentProfileId']
+        return payment_profile
+
+    def retrieve_saved_payment(self, profile_id, payment_id):
+        profile = self._make_call('GetCustomerProfile',
+            ('customerProfileId', profile_id))['profile']
+        payment_info = {'email': profile.get('email')}
+        for payment in profile.get('paymentProfiles', []):
+            if payment.get('customerPaymentProfileId') == str(payment_id):
+                break
+        else:
+            raise AuthorizeError("Payment ID does not exist for this profile.")
+        payment_info['number'] = payment['payment']['creditCard']['cardNumber']
+        data = payment.get('billTo', {})
+        payment_info['first_name'] = data.get('firstName', '')
+        payment_info['last_name'] = data.get('lastName', '')
+        kwargs = {
+            'street': data.get('address'),
+            'city': data.get('city'),
+            'state': data.get('state'),
+            'zip_code': data.get('zip'),
+            'country': data.get('country')}
+        kwargs = dict(
+            [(key, value) for key, value in kwargs.items() if value])
+        payment_info['address'] = Address(**kwargs)
+        return payment_info
+
+    def list_profile_ids(self):
+        """Returns the ids of every customer profile, as strings."""
+        return self._make_call('GetCustomerProfileIds').get('ids', [])
+
+    def retrieve_profile(self, profile_id):
+        """
+        Returns a customer profile and its saved payments as a dictionary,
+        in the format of :func:`~authorize.apis.customer.profile_record`.
+        """
+        profile = self._make_call('GetCustomerProfile',
+            ('customerProfileId', profile_id))['profile']
+        return profile_record(profile, profile.get('paymentProfiles', []),
+            _field)
+
+    def update_saved_payment(self, profile_id, payment_id, **kwargs):
+        # Authorize.net uses this constant to indicate that we want to keep
+        # the existing expiration date.
+        expiration = 'XXXX'
+        if kwargs['exp_month'] and kwargs['exp_year']:
+            exp = CreditCard.exp_time(kwargs['exp_month'], kwargs['exp_year'])
+            if exp <= datetime.now():
+                raise AuthorizeInvalidError('This credit card has expired.')
+            expiration = '{0}-{1:0>2}'.format(kwargs['exp_year'],
+                kwargs['exp_month'])
+        payment_profile = _object(
+            ('customerType', 'individual'),
+            ('billTo', _bill_to(kwargs['first_name'], kwargs['last_name'],
+                kwargs['address'])),
+            ('payment', _object(('creditCard', _object(
+                ('cardNumber', kwargs['number']),
+                ('expirationDate', expiration),
+            )))),
+            ('customerPaymentProfileId', payment_id),
+        )
+        self._make_call('UpdateCustomerPaymentProfile',
+            ('customerProfileId', profile_id),
+            ('paymentProfile', payment_profile),
+            ('validationMode', 'none'))
+
+        if not kwargs['email']:
+            return
+        self._make_call('UpdateCustomerProfile', ('profile', _object(
+            ('email', kwargs['email']),
+            ('customerProfileId', profile_id),
+        )))
+
+    def delete_saved_profile(self, profile_id):
+        self._make_call('DeleteCustomerProfile',
+            ('customerProfileId', profile_id))
+
+    def delete_saved_payment(self, profile_id, payment_id):
+        self._make_call('DeleteCustomerPaymentProfile',
+            ('customerProfileId', profile_id),
+            ('customerPaymentProfileId', payment_id))
+
+    def _transact(self, kind, profile_id, payment_id, amount, cvv=None):
+        transaction = _object(
+            ('amount', _amount(amount)),
+            ('customerProfileId', profile_id),
+            ('customerPaymentProfileId', payment_id),
+            ('cardCode', cvv),
+        )
+        response = self._make_call('CreateCustomerProfileTransaction',
+            ('transaction', _object((kind, transaction))),
+            ('extraOptions', self.transaction_options))
+        return parse_response(response['directResponse'])
+
+    def auth(self, profile_id, payment_id, amount, cvv=None):
+        validate('cim.AUTH_ONLY', amount=amount, cvv=cvv)
+        return self._transact('profileTransAuthOnly', profile_id, payment_id,
+            amount, cvv)
+
+    def capture(self, profile_id, payment_id, amount, cvv=None):
+        validate('cim.AUTH_CAPTURE', amount=amount, cvv=cvv)
+        return self._transact('profileTransAuthCapture', profile_id,
+            payment_id, amount, cvv)
+
+    def credit(self, profile_id, payment_id, amount):
+        # Creates an "unlinked credit" (as opposed to refunding a previous
+        # transaction)
+        validate('cim.CREDIT', amount=amount)
+        return self._transact('profileTransRefund', profile_id, payment_id,
+            amount)
+
+
+class JSONRecurringAPI(JSONAPI):
+    """
+    Recurring payments through the JSON API, with the same methods as
+    :class:`RecurringAPI <authorize.apis.recurring.RecurringAPI>`.
+    """
+    endpoint = 'arb'
+
+    def create_subscription(self, credit_card, amount, start,
+            days=None, months=None, occurrences=None, trial_amount=None,
+            trial_occurrences=None):
+        """
+        Creates a recurring subscription payment on the CreditCard provided,
+        returning the subscription id. See
+        :meth:`RecurringAPI.create_subscription
+        <authorize.apis.recurring.RecurringAPI.create_subscription>` for the
+        options.
+        """
+        length, unit = validate_subscription(credit_card, amount, start,
+            days, months, occurrences, trial_amount, trial_occurrences)
+        if occurrences is None:
+            occurrences = 9999  # That's what they say to do in the docs
+        trial = trial_amount and trial_occurrences
+        subscription = _object(
+            ('paymentSchedule', _object(
+                ('interval', _object(('length', length), ('unit', unit))),
+                ('startDate', start.strftime('%Y-%m-%d')),
+                ('totalOccurrences', occurrences),
+                ('trialOccurrences', trial_occurrences if trial else None),
+            )),
+            ('amount', _amount(amount)),
+            ('trialAmount', _amount(trial_amount) if trial else None),
+            ('payment', _object(('creditCard', _credit_card(credit_card)))),
+            ('billTo', _object(
+                ('firstName', credit_card.first_name),
+                ('lastName', credit_card.last_name),
+            )),
+        )
+        response = self._make_call('ARBCreateSubscription',
+            ('subscription', subscription))
+        return response['subscriptionId']
+
+    def update_subscription(self, subscription_id, amount=None, start=None,
+            occurrences=None, trial_amount=None, trial_occurrences=None):
+        """
+        Updates an existing recurring subscription payment. Only the
+        provided fields are updated.
+        """
+        validate('arb.ARBUpdateSubscription', amount=amount, start=start,
+            occurrences=occurrences, trial_amount=trial_amount,
+            trial_occurrences=trial_occurrences)
+        schedule = _object(
+            ('startDate', start.strftime('%Y-%m-%d') if start else None),
+            ('totalOccurrences', occurrences or None),
+            ('trialOccurrences', trial_occurrences or None),
+        )
+        subscription = _object(
+            ('paymentSchedule', schedule or None),
+            ('amount', _amount(amount) if amount else None),
+            ('trialAmount', _amount(trial_amount) if trial_amount else None),
+        )
+        self._make_call('ARBUpdateSubscription',
+            ('subscriptionId', subscription_id),
+            ('subscription', subscription))
+
+    def delete_subscription(self, subscription_id):
+        """Deletes an existing recurring subscription payment."""
+        self._make_call('ARBCancelSubscription',
+            ('subscriptionId', subscription_id))
@@ -1,29 +1,75 @@
-from datetime import date
-from decimal import Decimal
 from ssl import SSLError
 
 from suds import WebFault
+from suds.cache import NoCache
 from suds.client import Client
 
+from authorize import timing, tracing
+from authorize.apis import streaming
+from authorize.breaker import CircuitBreaker
+from authorize.data import Money
 from authorize.exceptions import AuthorizeConnectionError, \
-    AuthorizeInvalidError, AuthorizeResponseError
+    AuthorizeResponseError
+from authorize.limiter import RateLimiter
+from authorize.scheduler import Scheduler
+from authorize.transport import default_transport, SudsTransport
+from authorize.validation import validate
 
 
 PROD_URL = 'https://api.authorize.net/soap/v1/Service.asmx?WSDL'
 TEST_URL = 'https://apitest.authorize.net/soap/v1/Service.asmx?WSDL'
+# The path of the service on servers given by a custom base URL
+SERVICE_PATH = '/soap/v1/Service.asmx'
+
+
+def validate_subscription(credit_card, amount, start, days=None,
+        months=None, occurrences=None, trial_amount=None,
+        trial_occurrences=None):
+    """
+    Checks the options of a new subscription, raising AuthorizeInvalidError
+    if they aren't allowed. Returns the length and unit of the interval,
+    ``'days'`` or ``'months'``.
+    """
+    validate('arb.ARBCreateSubscription', credit_card=credit_card,
+        amount=amount, start=start, days=days, months=months,
+        occurrences=occurrences, trial_amount=trial_amount,
+        trial_occurrences=trial_occurrences)
+    if days:
+        return int(days), 'days'
+    return int(months), 'months'
 
 
 class RecurringAPI(object):
+    endpoint = 'arb'
+
     def __init__(self, login_id, transaction_key, debug=True, test=False):
         self.url = TEST_URL if debug else PROD_URL
         self.login_id = login_id
         self.transaction_key = transaction_key
+        self.breaker = CircuitBreaker(self.endpoint, enabled=False)
+        self.limiter = RateLimiter()
+        self.scheduler = Scheduler()
+        self.transport = None
+        self.location = None
+        # Whether the hot operations read their replies with the streaming
+        # parser instead of suds
+        self.streaming = False
 
     @property
     def client(self):
         # Lazy instantiation of SOAP client, which hits the WSDL url
         if not hasattr(self, '_client'):
-            self._client = Client(self.url)
+            options = {'plugins': [tracing.PhasePlugin()]}
+            if self.location is not None:
+                # Overrides the service address given in the WSDL
+                options['location'] = self.location
+            if self.transport is not None:
+                # Skip the WSDL cache so the transport sees every request
+                options['transport'] = SudsTransport(self.transport)
+                options['cache'] = NoCache()
+            else:
+                options['transport'] = SudsTransport(default_transport())
+            self._client = Client(self.url, **options)
         return self._client
 
     @property
@@ -38,15 +84,29 @@ class RecurringAPI(object):
     def _make_call(self, service, *args):
         # Provides standard API call error handling
         method = getattr(self.client.service, service)
-        try:
-            response = method(self.client_auth, *args)
-        except (WebFault, SSLError) as e:
-            raise AuthorizeConnectionError(e)
-        if response.resultCode != 'Ok':
-            error = response.messages[0][0]
-            raise AuthorizeResponseError('%s: %s' % (error.code, error.text))
+        with timing.timed(self.endpoint, service):
+            with tracing.span(self.endpoint, service), \
+                    self.scheduler.slot(self.login_id), \
+                    self.limiter.slot(self.endpoint, service), \
+                    self.breaker.guard():
+                tracing.mark('wait')
+                try:
+                    response = method(self.client_auth, *args)
+                except (WebFault, SSLError) as e:
+                    raise AuthorizeConnectionError(e)
+            if response.resultCode != 'Ok':
+                error = response.messages[0][0]
+                raise AuthorizeResponseError(
+                    '%s: %s' % (error.code, error.text))
         return response
 
+    def _send(self, service, *args):
+        # Calls an operation whose reply holds nothing but its result
+        if self.streaming:
+            streaming.call(self, service, args)
+        else:
+            self._make_call(service, *args)
+
     def create_subscription(self, credit_card, amount, start,
             days=None, months=None, occurrences=None, trial_amount=None,
             trial_occurrences=None):
@@ -60,7 +120,7 @@ class RecurringAPI(object):
 
         ``amount``
             The amount to charge every occurrence, either as an int, float,
-            or Decimal.
+            Decimal or Money.
 
         ``start``
             The date to start the subscription, as a date object.
@@ -88,10 +148,12 @@ class RecurringAPI(object):
             should last for. (Either both trial arguments should be provided,
             or neither.)
         """
+        length, unit = validate_subscription(credit_card, amount, start,
+            days, months, occurrences, trial_amount, trial_occurrences)
         subscription = self.client.factory.create('ARBSubscriptionType')
 
         # Add the basic amount and payment fields
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+        amount = Money.parse(amount)
         subscription.amount = str(amount)
         payment_type = self.client.factory.create('PaymentType')
         credit_card_type = self.client.factory.create('CreditCardType')
@@ -101,39 +163,13 @@ class RecurringAPI(object):
         credit_card_type.cardCode = credit_card.cvv
         payment_type.creditCard = credit_card_type
         subscription.payment = payment_type
-        if not (credit_card.first_name and credit_card.last_name):
-            raise AuthorizeInvalidError('Subscriptions require first name '
-                'and last name to be provided with the credit card.')
         subscription.billTo.firstName = credit_card.first_name
         subscription.billTo.lastName = credit_card.last_name
 
         # Add the fields for the payment schedule
-        if (days and months) or not (days or months):
-            raise AuthorizeInvalidError('Please provide either the months or '
-                'days argument to define the subscription interval.')
-        if days:
-            try:
-                days = int(days)
-                assert days >= 7 and days <= 365
-            except (AssertionError, ValueError):
-                raise AuthorizeInvalidError('The interval days must be an '
-                    'integer value between 7 and 365.')
-            subscription.paymentSchedule.interval.unit = \
-                self.client.factory.create('ARBSubscriptionUnitEnum').days
-            subscription.paymentSchedule.interval.length = days
-        elif months:
-            try:
-                months = int(months)
-                assert months >= 1 and months <= 12
-            except (AssertionError, ValueError):
-                raise AuthorizeInvalidError('The interval months must be an '
-                    'integer value between 1 and 12.')
-            subscription.paymentSchedule.interval.unit = \
-                self.client.factory.create('ARBSubscriptionUnitEnum').months
-            subscription.paymentSchedule.interval.length = months
-        if start < date.today():
-            raise AuthorizeInvalidError('The start date for the subscription '
-                'may not be in the past.')
+        subscription.paymentSchedule.interval.unit = getattr(
+            self.client.factory.create('ARBSubscriptionUnitEnum'), unit)
+        subscription.paymentSchedule.interval.length = length
         subscription.paymentSchedule.startDate = start.strftime('%Y-%m-%d')
         if occurrences is None:
             occurrences = 9999  # That's what they say to do in the docs
@@ -142,14 +178,13 @@ class RecurringAPI(object):
         # If a trial period has been specified, add those fields
         if trial_amount and trial_occurrences:
             subscription.paymentSchedule.trialOccurrences = trial_occurrences
-            trial_amount = Decimal(str(trial_amount))
-            trial_amount = trial_amount.quantize(Decimal('0.01'))
+            trial_amount = Money.parse(trial_amount)
             subscription.trialAmount = str(trial_amount)
-        elif trial_amount or trial_occurrences:
-            raise AuthorizeInvalidError('To indicate a trial period, you '
-                'must provide both a trial amount and occurrences.')
 
         # Make the API call to create the subscription
+        if self.streaming:
+            return int(streaming.call(self, 'ARBCreateSubscription',
+                (subscription,), fields=['subscriptionId'])['subscriptionId'])
         response = self._make_call('ARBCreateSubscription', subscription)
         return response.subscriptionId
 
@@ -167,7 +202,7 @@ class RecurringAPI(object):
 
         ``amount``
             The updated amount to charge every occurrence, either as an int,
-            float, or Decimal.
+            float, Decimal or Money.
 
         ``start``
             The updated date to start the subscription, as a date object. This
@@ -186,29 +221,27 @@ class RecurringAPI(object):
             only be updated if you have not begun charging at the regular
             price.
         """
+        validate('arb.ARBUpdateSubscription', amount=amount, start=start,
+            occurrences=occurrences, trial_amount=trial_amount,
+            trial_occurrences=trial_occurrences)
         subscription = self.client.factory.create('ARBSubscriptionType')
 
         # Add the basic subscription updates
         if amount:
-            amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+            amount = Money.parse(amount)
             subscription.amount = str(amount)
-        if start and start < date.today():
-            raise AuthorizeInvalidError('The start date for the subscription '
-                'may not be in the past.')
         if start:
             subscription.paymentSchedule.startDate = start.strftime('%Y-%m-%d')
         if occurrences:
             subscription.paymentSchedule.totalOccurrences = occurrences
         if trial_amount:
-            trial_amount = Decimal(str(trial_amount))
-            trial_amount = trial_amount.quantize(Decimal('0.01'))
+            trial_amount = Money.parse(trial_amount)
             subscription.trialAmount = str(trial_amount)
         if trial_occurrences:
             subscription.paymentSchedule.trialOccurrences = trial_occurrences
 
         # Make the API call to update the subscription
-        self._make_call('ARBUpdateSubscription', subscription_id,
-            subscription)
+        self._send('ARBUpdateSubscription', subscription_id, subscription)
 
     def delete_subscription(self, subscription_id):
         """
@@ -218,4 +251,4 @@ class RecurringAPI(object):
             The subscription ID returned from the original create_subscription
             call for the subscription you want to delete.
         """
-        self._make_call('ARBCancelSubscription', subscription_id)
+        self._send('ARBCancelSubscription', subscription_id)
@@ -0,0 +1,247 @@
+import re
+from datetime import datetime, timedelta
+from xml.etree.ElementTree import iterparse, ParseError
+from xml.sax.saxutils import escape
+
+from six import BytesIO, text_type
+from six.moves.urllib.request import Request, urlopen
+
+from authorize import tracing
+from authorize.breaker import CircuitBreaker
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeResponseError
+from authorize.limiter import RateLimiter
+from authorize.scheduler import Scheduler
+
+
+PROD_URL = 'https://api.authorize.net/xml/v1/request.api'
+TEST_URL = 'https://apitest.authorize.net/xml/v1/request.api'
+# The path of the API on servers given by a custom base URL
+XML_PATH = '/xml/v1/request.api'
+XML_NS = 'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
+XML_HEADERS = {'Content-Type': 'text/xml; charset=utf-8'}
+
+# The largest page size and settlement date range the API allows
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_DAYS = 31
+
+# Field names matching those returned by parse_response; other fields are
+# converted from camel case
+FIELD_NAMES = {
+    'transId': 'transaction_id',
+    'settleAmount': 'amount',
+    'transactionType': 'transaction_type',
+    'responseCode': 'response_code',
+    'responseReasonCode': 'response_reason_code',
+    'responseReasonDescription': 'response_reason_text',
+    'authCode': 'authorization_code',
+    'AVSResponse': 'avs_response',
+    'cardCodeResponse': 'cvv_response',
+    'transactionStatus': 'status',
+    'submitTimeUTC': 'submitted',
+    'submitTimeLocal': 'submitted_local',
+    'settlementTimeUTC': 'settled',
+    'settlementTimeLocal': 'settled_local',
+}
+_CAMEL_RE = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+
+# The names worked out so far, by full tag
+_names = {}
+
+
+def field_name(tag):
+    """Returns the Python name for a response element's ``tag``."""
+    name = _names.get(tag)
+    if name is None:
+        local = tag.rsplit('}', 1)[-1]
+        name = FIELD_NAMES.get(local) or _CAMEL_RE.sub('_', local).lower()
+        _names[tag] = name
+    return name
+
+
+def element_to_dict(element):
+    """
+    Converts a response element into a dictionary of strings, with nested
+    dictionaries for nested elements and lists for repeated ones.
+    """
+    result = {}
+    for child in element:
+        name = field_name(child.tag)
+        value = element_to_dict(child) if len(child) else (child.text or '')
+        if name in result:
+            if not isinstance(result[name], list):
+                result[name] = [result[name]]
+            result[name].append(value)
+        else:
+            result[name] = value
+    return result
+
+
+def _xml(name, value):
+    if isinstance(value, list):
+        content = ''.join(_xml(k, v) for k, v in value)
+    else:
+        content = escape(text_type(value))
+    return '<{0}>{1}</{0}>'.format(name, content)
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class ReportingAPI(object):
+    """
+    The Transaction Details API. The list methods are generators that fetch
+    one page of results at a time and parse it as it streams in, so only the
+    current page is ever held in memory. A page's call keeps its place with
+    the scheduler, rate limiter and circuit breaker only until the page has
+    been parsed, so the items can be used to make other calls.
+    """
+    endpoint = 'reporting'
+
+    def __init__(self, login_id, transaction_key, debug=True, test=False):
+        self.url = TEST_URL if debug else PROD_URL
+        self.login_id = login_id
+        self.transaction_key = transaction_key
+        self.breaker = CircuitBreaker(self.endpoint, enabled=False)
+        self.limiter = RateLimiter()
+        self.scheduler = Scheduler()
+        self.transport = None
+
+    def _open(self, request, fields):
+        # Sends the request, returning a file-like object of the response
+        with tracing.span(self.endpoint, request):
+            body = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<{0} xmlns="{1}">{2}{3}</{0}>'
+            ).format(request, XML_NS, _xml('merchantAuthentication', [
+                ('name', self.login_id),
+                ('transactionKey', self.transaction_key),
+            ]), ''.join(_xml(k, v) for k, v in fields)).encode('utf-8')
+            tracing.mark('build')
+            try:
+                if self.transport is None:
+                    return urlopen(Request(self.url, body, XML_HEADERS))
+                reply = self.transport.send(self.url, body, XML_HEADERS)
+                if reply.code != 200:
+                    raise IOError('HTTP {0}'.format(reply.code))
+                return BytesIO(reply.body)
+            finally:
+                tracing.mark('network')
+
+    def _fetch(self, request, fields, item_tag):
+        # Returns the item_tag elements of the response as dictionaries.
+        # The slots and the breaker are held while the page is fetched and
+        # parsed, so a response cut short or garbled counts as a failed
+        # call, but are given up before the caller sees any item.
+        with self.scheduler.slot(self.login_id), \
+                self.limiter.slot(self.endpoint, request), \
+                self.breaker.guard():
+            try:
+                resource = self._open(request, fields)
+            except IOError as e:
+                raise AuthorizeConnectionError(e)
+            try:
+                return list(self._items(resource, item_tag))
+            except (IOError, ParseError) as e:
+                raise AuthorizeConnectionError(e)
+            finally:
+                resource.close()
+
+    def _items(self, resource, item_tag):
+        item_tag = '{{{0}}}{1}'.format(XML_NS, item_tag)
+        messages_tag = '{{{0}}}messages'.format(XML_NS)
+        depth = 0
+        parser = iterparse(resource, events=('start', 'end'))
+        for event, element in parser:
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    root = element
+                continue
+            depth -= 1
+            if element.tag == messages_tag and depth == 1:
+                self._check(element)
+            elif element.tag == item_tag:
+                yield element_to_dict(element)
+                element.clear()
+                if depth == 2:
+                    # Drop finished items from their list element
+                    for parent in root:
+                        parent.clear()
+
+    def _check(self, messages):
+        response = element_to_dict(messages)
+        if response.get('result_code') == 'Ok':
+            return
+        message = response.get('message') or {}
+        if isinstance(message, list):
+            message = message[0]
+        e = AuthorizeResponseError('{0}: {1}'.format(message.get('code'),
+            message.get('text')))
+        e.full_response = {
+            'response_code': message.get('code'),
+            'response_text': message.get('text'),
+        }
+        raise e
+
+    def _pages(self, request, fields, item_tag, page_size):
+        page = 1
+        while True:
+            count = 0
+            paging = [('limit', page_size), ('offset', page)]
+            for item in self._fetch(request, fields + [('paging', paging)],
+                    item_tag):
+                count += 1
+                yield item
+            if count < page_size:
+                return
+            page += 1
+
+    def settled_batches(self, first, last, statistics=False):
+        """
+        Yields the batches settled from the date ``first`` to the date
+        ``last`` inclusive, fetching them a month at a time.
+        """
+        first, last = _date(first), _date(last)
+        while first <= last:
+            end = min(last, first + timedelta(days=MAX_BATCH_DAYS - 1))
+            fields = [
+                ('includeStatistics', 'true' if statistics else 'false'),
+                ('firstSettlementDate',
+                    first.strftime('%Y-%m-%dT00:00:00Z')),
+                ('lastSettlementDate', end.strftime('%Y-%m-%dT23:59:59Z')),
+            ]
+            for batch in self._fetch('getSettledBatchListRequest', fields,
+                    'batch'):
+                yield batch
+            first = end + timedelta(days=1)
+
+    def batch_transactions(self, batch_id, page_size=MAX_PAGE_SIZE):
+        """Yields the transactions in the settled batch ``batch_id``."""
+        fields = [
+            ('batchId', batch_id),
+            ('sorting', [('orderBy', 'submitTimeUTC'),
+                ('orderDescending', 'false')]),
+        ]
+        return self._pages('getTransactionListRequest', fields,
+            'transaction', page_size)
+
+    def unsettled_transactions(self, page_size=MAX_PAGE_SIZE):
+        """Yields the transactions that have not been settled yet."""
+        fields = [
+            ('sorting', [('orderBy', 'submitTimeUTC'),
+                ('orderDescending', 'false')]),
+        ]
+        return self._pages('getUnsettledTransactionListRequest', fields,
+            'transaction', page_size)
+
+    def transaction_details(self, transaction_id):
+        """Returns the full details of a transaction as a dictionary."""
+        for transaction in self._fetch('getTransactionDetailsRequest',
+                [('transId', transaction_id)], 'transaction'):
+            return transaction
+        raise AuthorizeResponseError('No details returned for transaction '
+            '{0}.'.format(transaction_id))
@@ -0,0 +1,179 @@
+"""
+A streaming path for the CIM and ARB operations this library calls most.
+suds builds a tree of objects for every element of a reply, which for a
+customer with many saved cards is a lot of work to read a handful of fields.
+Here suds still builds the request, but the reply is read with an
+incremental parser that keeps only the fields asked for, discards each
+element once it has been looked at, and stops reading as soon as it has
+everything. Other operations, and APIs with ``streaming`` turned off, keep
+using suds.
+"""
+from xml.etree.ElementTree import iterparse, ParseError
+
+from six import BytesIO
+
+from authorize import hedging, timing, tracing, wirelog
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeResponseError
+from authorize.transport import default_transport
+
+
+# The depth of the children of an operation's result element, below the
+# envelope, body, response and result elements
+_RESULT_DEPTH = 4
+# The depth of the payment profiles in a GetCustomerProfile result, below
+# its profile and paymentProfiles elements
+_PAYMENT_DEPTH = _RESULT_DEPTH + 2
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(element, *path):
+    for name in path:
+        for child in element:
+            if _local(child.tag) == name:
+                element = child
+                break
+        else:
+            return None
+    return element.text
+
+
+def _payment(element):
+    payment = {
+        'number': _child_text(element, 'payment', 'creditCard',
+            'cardNumber'),
+        'billTo': {},
+    }
+    for child in element:
+        if _local(child.tag) == 'billTo':
+            payment['billTo'] = dict((_local(field.tag), field.text)
+                for field in child)
+    return payment
+
+
+def read_result(source, fields=(), lists=(), payment_id=None):
+    """
+    Reads a SOAP reply from ``source``, a file object, and returns a
+    dictionary of its ``resultCode``, the ``code`` and ``text`` of its first
+    message, and each of ``fields`` and ``lists`` found among the children of
+    the result: the text of each of ``fields`` and a list of the texts of the
+    items of each of ``lists``.
+
+    For a ``GetCustomerProfile`` reply, ``payment_id`` asks for the profile's
+    ``email`` and the ``payment`` profile with that id, as a dictionary of
+    its card ``number`` and ``billTo`` fields.
+
+    Reading stops once everything asked for has been found. A SOAP fault is
+    raised as an ``IOError``.
+    """
+    result = {}
+    wanted = set(fields) | set(lists) | set(['resultCode', 'messages'])
+    if payment_id is not None:
+        wanted.add('payment')
+    depth = 0
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        name = _local(element.tag)
+        if depth == _RESULT_DEPTH:
+            if name == 'resultCode':
+                result['resultCode'] = element.text
+            elif name == 'messages':
+                result['code'] = _child_text(element,
+                    'MessagesTypeMessage', 'code')
+                result['text'] = _child_text(element,
+                    'MessagesTypeMessage', 'text')
+            elif name in lists:
+                result[name] = [item.text for item in element]
+            elif name in fields:
+                result[name] = element.text
+            else:
+                element.clear()
+                continue
+            wanted.discard(name)
+            element.clear()
+        elif depth == _PAYMENT_DEPTH - 1 and name == 'email' and \
+                payment_id is not None:
+            result['email'] = element.text
+        elif depth == _PAYMENT_DEPTH and \
+                name == 'CustomerPaymentProfileMaskedType':
+            if _child_text(element, 'customerPaymentProfileId') == \
+                    str(payment_id):
+                result['payment'] = _payment(element)
+                wanted.discard('payment')
+            element.clear()
+        elif depth == 2 and name == 'Fault':
+            raise IOError('SOAP fault: {0}'.format(
+                _child_text(element, 'faultstring')))
+        else:
+            continue
+        if not wanted:
+            break
+    return result
+
+
+def _post(api, method, body, options):
+    # Sends the request and reads the reply, to the end if it is an error
+    location = api.location or method.location
+    headers = {
+        'Content-Type': 'text/xml; charset=utf-8',
+        'SOAPAction': method.soap.action,
+    }
+    transport = api.transport or default_transport()
+    wirelog.capture('request', body)
+    reply = transport.send(location, body, headers)
+    wirelog.capture('response', reply.body)
+    if reply.code != 200:
+        raise IOError('HTTP {0}'.format(reply.code))
+    tracing.mark('network')
+    try:
+        return read_result(BytesIO(reply.body), **options)
+    except ParseError as e:
+        raise IOError(e)
+
+
+def call(api, service, args, hedge=False, **options):
+    """
+    Calls ``service`` with ``args`` through ``api``, a
+    :class:`CustomerAPI <authorize.apis.customer.CustomerAPI>` or
+    :class:`RecurringAPI <authorize.apis.recurring.RecurringAPI>`, with the
+    same rate limiting, circuit breaking and error handling as its
+    ``_make_call``, returning the dictionary made by :func:`read_result`
+    with the given options. Read only calls may ``hedge`` through the API's
+    hedger.
+    """
+    method = getattr(api.client.service, service).method
+    hedger = getattr(api, 'hedger', None) if hedge else None
+    with timing.timed(api.endpoint, service):
+        with tracing.span(api.endpoint, service), \
+                api.scheduler.slot(api.login_id), \
+                api.limiter.slot(api.endpoint, service), \
+                api.breaker.guard():
+            tracing.mark('wait')
+            envelope = method.binding.input.get_message(method,
+                (api.client_auth,) + args, {})
+            body = envelope.plain().encode('utf-8')
+            tracing.mark('build')
+            try:
+                if hedger:
+                    result = hedging.call(api, service, _post, api, method,
+                        body, options)
+                else:
+                    result = _post(api, method, body, options)
+            except IOError as e:
+                raise AuthorizeConnectionError(e)
+        tracing.mark('parse')
+        if result.get('resultCode') != 'Ok':
+            e = AuthorizeResponseError(
+                '%s: %s' % (result.get('code'), result.get('text')))
+            e.full_response = {
+                'response_code': result.get('code'),
+                'response_text': result.get('text'),
+            }
+            raise e
+    return result
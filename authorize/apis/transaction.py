@@ -1,14 +1,21 @@
-from decimal import Decimal
-from six import PY2, b, text_type
-from six.moves.urllib.parse import urlencode
+from six import PY2, b, binary_type, text_type
+from six.moves.urllib.parse import quote_plus, urlencode
 from six.moves.urllib.request import urlopen
 
+from authorize import timing, tracing, wirelog
+from authorize.breaker import CircuitBreaker
+from authorize.data import Money
 from authorize.exceptions import AuthorizeConnectionError, \
     AuthorizeResponseError
+from authorize.limiter import RateLimiter
+from authorize.scheduler import Scheduler
+from authorize.validation import validate
 
 
 PROD_URL = 'https://secure.authorize.net/gateway/transact.dll'
 TEST_URL = 'https://test.authorize.net/gateway/transact.dll'
+# The path of the gateway on servers given by a custom base URL
+AIM_PATH = '/gateway/transact.dll'
 RESPONSE_FIELDS = {
     0: 'response_code',
     2: 'response_reason_code',
@@ -21,7 +28,16 @@ RESPONSE_FIELDS = {
     38: 'cvv_response',
 }
 
+# Fields drawn from a small set of values, shared between responses rather
+# than kept as a new string in each one
+INTERNED_FIELDS = frozenset(['response_code', 'response_reason_code',
+    'response_reason_text', 'avs_response', 'transaction_type',
+    'cvv_response'])
+# Caps the shared strings in case a gateway sends unexpected values
+MAX_INTERNED = 10000
+
 DEFAULT_CHARSET = 'iso-8859-1'
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
 
 
 def get_content_charset(resource):
@@ -35,35 +51,73 @@ def get_content_charset(resource):
         return resource.headers.get_content_charset(failobj=DEFAULT_CHARSET)
 
 
+_interned = {}
+
+
+def intern_value(value):
+    """
+    Returns the shared copy of ``value``, a string from a gateway response,
+    so the many responses of a bulk run don't each hold their own copy.
+    """
+    try:
+        return _interned[value]
+    except KeyError:
+        if len(_interned) < MAX_INTERNED:
+            _interned[value] = value
+        return value
+
+
 def parse_response(response):
     response = response.split(';')
     fields = {}
     for index, name in RESPONSE_FIELDS.items():
-        fields[name] = response[index]
+        if name in INTERNED_FIELDS:
+            fields[name] = intern_value(response[index])
+        else:
+            fields[name] = response[index]
     return fields
 
 
-def safe_unicode_to_str(string):
-    try:
-        return str(string)
-    except UnicodeEncodeError:
-        return string.encode('utf-8')
-
-
-def convert_params_to_byte_str(params):
-    converted_params = {}
-    for key, value in params.items():
-        if isinstance(key, text_type):
-            key = safe_unicode_to_str(key)
-        if isinstance(value, text_type):
-            value = safe_unicode_to_str(value)
-        converted_params[key] = value
-    return converted_params
+def quote_value(value):
+    """URL-encodes a single key or value as bytes, using UTF-8 for text."""
+    if isinstance(value, text_type):
+        value = value.encode('utf-8')
+    elif not isinstance(value, binary_type):
+        value = b(str(value))
+    return b(quote_plus(value))
+
+
+# Encoded '&key=' prefixes, filled in as keys are first seen
+_encoded_keys = {}
+
+
+def encode_fields(fields):
+    """
+    URL-encodes ``fields``, a dictionary or a sequence of ``(key, value)``
+    pairs, as bytes with each pair preceded by ``&`` so the result can be
+    appended to an encoded request. Pairs with a value of ``None`` are left
+    out.
+    """
+    if isinstance(fields, dict):
+        fields = fields.items()
+    parts = []
+    for key, value in fields:
+        if value is None:
+            continue
+        prefix = _encoded_keys.get(key)
+        if prefix is None:
+            prefix = _encoded_keys[key] = b'&' + quote_value(key) + b'='
+        parts.append(prefix)
+        parts.append(quote_value(value))
+    return b''.join(parts)
 
 
 class TransactionAPI(object):
+    endpoint = 'aim'
+
     def __init__(self, login_id, transaction_key, debug=True, test=False):
         self.url = TEST_URL if debug else PROD_URL
+        self.login_id = login_id
         self.base_params = {
             'x_login': login_id,
             'x_tran_key': transaction_key,
@@ -72,79 +126,101 @@ class TransactionAPI(object):
             'x_delim_data': 'TRUE',
             'x_delim_char': ';',
         }
-
-    def _make_call(self, params):
-        params = convert_params_to_byte_str(params)
-        params = urlencode(params)
-        try:
-            resource = urlopen(self.url, data=b(params))
-            response = resource.read().decode(
+        # The credentials and options are the same for every call, so they
+        # are encoded once and each call only encodes its own fields
+        self._prefix = b(urlencode(sorted(self.base_params.items())))
+        self.breaker = CircuitBreaker(self.endpoint, enabled=False)
+        self.limiter = RateLimiter()
+        self.scheduler = Scheduler()
+        self.transport = None
+
+    def _send(self, body):
+        # Posts the request, using urlopen unless a transport is installed
+        wirelog.capture('request', body)
+        if self.transport is None:
+            resource = urlopen(self.url, data=body)
+            text = resource.read().decode(
                 get_content_charset(resource) or DEFAULT_CHARSET)
-        except IOError as e:
-            raise AuthorizeConnectionError(e)
-        fields = parse_response(response)
-        if fields['response_code'] != '1':
-            e = AuthorizeResponseError(
-                '{0} full_response={1!r}'.format(
-                    fields['response_reason_text'], fields
+        else:
+            reply = self.transport.send(self.url, body, FORM_HEADERS)
+            if reply.code != 200:
+                wirelog.capture('response', reply.body)
+                raise IOError('HTTP {0}'.format(reply.code))
+            text = reply.text()
+        wirelog.capture('response', text)
+        return text
+
+    def _make_call(self, operation, fields):
+        with timing.timed(self.endpoint, operation), \
+                tracing.span(self.endpoint, operation):
+            body = self._prefix + encode_fields(fields)
+            if operation:
+                body += b'&x_type=' + b(operation)
+            tracing.mark('build')
+            with self.scheduler.slot(self.login_id), \
+                    self.limiter.slot(self.endpoint, operation), \
+                    self.breaker.guard():
+                tracing.mark('wait')
+                try:
+                    response = self._send(body)
+                except IOError as e:
+                    raise AuthorizeConnectionError(e)
+            tracing.mark('network')
+            fields = parse_response(response)
+            tracing.mark('parse')
+            if fields['response_code'] != '1':
+                e = AuthorizeResponseError(
+                    '{0} full_response={1!r}'.format(
+                        fields['response_reason_text'], fields
+                    )
                 )
-            )
-            e.full_response = fields
-            raise e
+                e.full_response = fields
+                raise e
         return fields
 
-    def _add_params(self, params, credit_card=None, address=None, email=None):
+    def _add_params(self, fields, credit_card=None, address=None, email=None):
+        # Appends to a list of (key, value) pairs; None values are skipped
+        # when the fields are encoded
         if credit_card:
-            params.update({
-                'x_card_num': credit_card.card_number,
-                'x_exp_date': credit_card.expiration.strftime('%m-%Y'),
-                'x_card_code': credit_card.cvv,
-                'x_first_name': credit_card.first_name,
-                'x_last_name': credit_card.last_name,
-            })
-
+            fields.append(('x_card_num', credit_card.card_number))
+            fields.append(('x_exp_date',
+                credit_card.expiration.strftime('%m-%Y')))
+            fields.append(('x_card_code', credit_card.cvv))
+            fields.append(('x_first_name', credit_card.first_name))
+            fields.append(('x_last_name', credit_card.last_name))
         if email:
-            params['x_email'] = email
-
+            fields.append(('x_email', email))
         if address:
-            params.update({
-                'x_address': address.street,
-                'x_city': address.city,
-                'x_state': address.state,
-                'x_zip': address.zip_code,
-                'x_country': address.country,
-            })
-        for key, value in list(params.items()):
-            if value is None:
-                del params[key]
-        return params
+            fields.append(('x_address', address.street))
+            fields.append(('x_city', address.city))
+            fields.append(('x_state', address.state))
+            fields.append(('x_zip', address.zip_code))
+            fields.append(('x_country', address.country))
+        return fields
 
     def auth(self, amount, credit_card, address=None, email=None):
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
-        params = self.base_params.copy()
-        params = self._add_params(params, credit_card, address, email)
-        params['x_type'] = 'AUTH_ONLY'
-        params['x_amount'] = str(amount)
-        return self._make_call(params)
+        validate('aim.AUTH_ONLY', amount=amount)
+        amount = Money.parse(amount)
+        fields = self._add_params([('x_amount', str(amount))],
+            credit_card, address, email)
+        return self._make_call('AUTH_ONLY', fields)
 
     def capture(self, amount, credit_card, address=None, email=None):
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
-        params = self.base_params.copy()
-        params = self._add_params(params, credit_card, address, email)
-        params['x_type'] = 'AUTH_CAPTURE'
-        params['x_amount'] = str(amount)
-        return self._make_call(params)
+        validate('aim.AUTH_CAPTURE', amount=amount)
+        amount = Money.parse(amount)
+        fields = self._add_params([('x_amount', str(amount))],
+            credit_card, address, email)
+        return self._make_call('AUTH_CAPTURE', fields)
 
     def settle(self, transaction_id, amount=None):
         # Amount is not required -- if provided, settles for a lower amount
         # than the original auth; if not, settles the full amount authed.
-        params = self.base_params.copy()
-        params['x_type'] = 'PRIOR_AUTH_CAPTURE'
-        params['x_trans_id'] = transaction_id
+        validate('aim.PRIOR_AUTH_CAPTURE', amount=amount)
+        fields = [('x_trans_id', transaction_id)]
         if amount:
-            amount = Decimal(str(amount)).quantize(Decimal('0.01'))
-            params['x_amount'] = str(amount)
-        return self._make_call(params)
+            amount = Money.parse(amount)
+            fields.append(('x_amount', str(amount)))
+        return self._make_call('PRIOR_AUTH_CAPTURE', fields)
 
     def credit(self, card_num, transaction_id, amount):
         # Authorize.net can do unlinked credits (not tied to a previous
@@ -159,16 +235,14 @@ class TransactionAPI(object):
         #   charge amount.
         # - The credit must be submitted within 120 days of the original
         #   transaction being settled.
-        params = self.base_params.copy()
-        params['x_type'] = 'CREDIT'
-        params['x_trans_id'] = transaction_id
-        params['x_card_num'] = str(card_num)
-        amount = Decimal(str(amount)).quantize(Decimal('0.01'))
-        params['x_amount'] = str(amount)
-        return self._make_call(params)
+        validate('aim.CREDIT', amount=amount)
+        amount = Money.parse(amount)
+        fields = [
+            ('x_trans_id', transaction_id),
+            ('x_card_num', str(card_num)),
+            ('x_amount', str(amount)),
+        ]
+        return self._make_call('CREDIT', fields)
 
     def void(self, transaction_id):
-        params = self.base_params.copy()
-        params['x_type'] = 'VOID'
-        params['x_trans_id'] = transaction_id
-        return self._make_call(params)
+        return self._make_call('VOID', [('x_trans_id', transaction_id)])
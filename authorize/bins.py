@@ -0,0 +1,318 @@
+"""
+BIN ranges tell a card's brand, whether it is a credit, debit or prepaid
+card and the country that issued it from the first digits of its number,
+without a call to Authorize.net or a BIN service::
+
+    >>> from authorize.bins import default_index
+    >>> default_index().lookup('5424000000000015')
+    <BinInfo mc funding=None country=None>
+
+The ranges come from a CSV file with a header row and the columns ``start``
+and ``end``, the first digits of the first and last card numbers in the
+range, ``brand``, ``funding`` (``credit``, ``debit`` or ``prepaid``),
+``country`` (a two letter code) and ``lengths``, the valid card number
+lengths such as ``16`` or ``13-19``. Where ranges overlap, the narrowest
+one wins, so a file can give a whole brand and then the details of
+individual issuers' ranges within it.
+
+This library ships the ranges of the major brands, which
+:attr:`CreditCard.card_type <authorize.data.CreditCard.card_type>` uses.
+For funding types and countries, compile a BIN file from your acquirer or
+BIN data provider once and share it between processes::
+
+    >>> from authorize.bins import BinIndex, compile_csv, set_default_index
+    >>> compile_csv('issuer_bins.csv', '/var/lib/myapp/bins.idx')
+    >>> set_default_index(BinIndex.open('/var/lib/myapp/bins.idx'))
+
+A compiled index is a sorted table of fixed size, non-overlapping ranges
+searched in place, so opening one is instant and the memory mapped file is
+shared by every process that opens it.
+"""
+import csv
+import io
+import json
+import mmap
+import os
+import pkgutil
+import re
+import struct
+import threading
+
+from six import PY2
+
+
+# The number of leading digits of a card number that ranges are keyed by
+KEY_DIGITS = 8
+
+_MAGIC = b'AUTHBIN1'
+# The magic string and the length of the JSON header that follows it
+_PREAMBLE = struct.Struct('<8sI')
+# The first and last keys of a range, its brand and funding as indexes into
+# the header's lists, its shortest and longest card numbers, and country
+_RECORD = struct.Struct('<IIBBBB2s')
+_LOW = struct.Struct('<I')
+_NO_COUNTRY = b'\0\0'
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class BinInfo(object):
+    """
+    What a BIN range says about a card: its ``brand``, such as ``'visa'``
+    or ``'mc'``, its ``funding`` and ``country`` if known, or ``None``, and
+    the ``min_length`` and ``max_length`` of its card numbers.
+    """
+    __slots__ = ('brand', 'funding', 'country', 'min_length', 'max_length')
+
+    def __init__(self, brand, funding=None, country=None, min_length=12,
+            max_length=19):
+        self.brand = brand
+        self.funding = funding
+        self.country = country
+        self.min_length = min_length
+        self.max_length = max_length
+
+    def __repr__(self):
+        return '<BinInfo {0.brand} funding={0.funding} ' \
+            'country={0.country}>'.format(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, BinInfo):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __ne__(self, other):
+        if not isinstance(other, BinInfo):
+            return NotImplemented
+        return self._fields() != other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def _fields(self):
+        return (self.brand, self.funding, self.country, self.min_length,
+            self.max_length)
+
+    def valid_length(self, number):
+        """Returns whether ``number`` has a valid length for the range."""
+        return self.min_length <= len(number) <= self.max_length
+
+
+def _key(number):
+    digits = re.sub(r'\D', '', str(number))[:KEY_DIGITS]
+    if not digits:
+        raise ValueError('{0!r} is not a card number.'.format(number))
+    return int(digits.ljust(KEY_DIGITS, '0'))
+
+
+def _parse_lengths(value):
+    low, _, high = (value or '12-19').partition('-')
+    return int(low), int(high or low)
+
+
+def _flatten(ranges):
+    # Splits overlapping (low, high, info) ranges into sorted,
+    # non-overlapping ones, each taking the narrowest range covering it;
+    # of equally narrow ranges, the last one given wins
+    ranges = sorted(((low, high, order, info) for order, (low, high, info)
+        in enumerate(ranges)), key=lambda r: r[0])
+    points = sorted(set([r[0] for r in ranges] + [r[1] + 1 for r in ranges]))
+    segments = []
+    active = []
+    j = 0
+    for start, stop in zip(points, points[1:]):
+        while j < len(ranges) and ranges[j][0] <= start:
+            active.append(ranges[j])
+            j += 1
+        active = [r for r in active if r[1] >= start]
+        if not active:
+            continue
+        best = min(active, key=lambda r: (r[1] - r[0], -r[2]))[3]
+        if segments and segments[-1][1] == start - 1 and \
+                segments[-1][2] is best:
+            segments[-1][1] = stop - 1
+        else:
+            segments.append([start, stop - 1, best])
+    return segments
+
+
+def compile_ranges(rows):
+    """
+    Compiles ``rows``, dictionaries with the columns of a BIN range file,
+    into the bytes of an index.
+    """
+    ranges = []
+    for row in rows:
+        start, end = row['start'].strip(), row['end'].strip()
+        info = BinInfo(row['brand'].strip(),
+            (row.get('funding') or '').strip() or None,
+            (row.get('country') or '').strip().upper() or None,
+            *_parse_lengths((row.get('lengths') or '').strip()))
+        ranges.append((int(start.ljust(KEY_DIGITS, '0')),
+            int(end.ljust(KEY_DIGITS, '9')), info))
+    segments = _flatten(ranges)
+    brands = sorted(set(s[2].brand for s in segments))
+    fundings = sorted(set(s[2].funding for s in segments if s[2].funding))
+    header = json.dumps({'brands': brands, 'fundings': fundings,
+        'count': len(segments)}, sort_keys=True).encode('utf-8')
+    # Pads the header so the records start on a four byte boundary
+    header += b' ' * (-(_PREAMBLE.size + len(header)) % 4)
+    parts = [_PREAMBLE.pack(_MAGIC, len(header)), header]
+    for low, high, info in segments:
+        funding = fundings.index(info.funding) + 1 if info.funding else 0
+        country = info.country.encode('ascii') if info.country \
+            else _NO_COUNTRY
+        parts.append(_RECORD.pack(low, high, brands.index(info.brand),
+            funding, info.min_length, info.max_length, country))
+    return b''.join(parts)
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _read_csv(data):
+    # Compiles the bytes of a BIN range file. Python 2's csv module only
+    # reads bytes, so there each row is decoded once it has been parsed.
+    if PY2:
+        rows = (dict((_decode(name), _decode(value))
+            for name, value in row.items())
+            for row in csv.DictReader(io.BytesIO(data)))
+    else:
+        rows = csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''))
+    return compile_ranges(rows)
+
+
+def compile_csv(source, target):
+    """
+    Compiles the BIN range file at ``source`` into an index file at
+    ``target`` for :meth:`BinIndex.open`.
+    """
+    with open(source, 'rb') as f:
+        data = _read_csv(f.read())
+    temporary = target + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.rename(temporary, target)
+
+
+class BinIndex(object):
+    """
+    A compiled table of BIN ranges, searched in place. ``data`` is the
+    compiled index, as bytes or a memory map; use :meth:`open` or
+    :meth:`from_csv` to create one.
+    """
+    def __init__(self, data):
+        magic, length = _PREAMBLE.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError('Not a BIN index.')
+        header = json.loads(
+            data[_PREAMBLE.size:_PREAMBLE.size + length].decode('utf-8'))
+        self._data = data
+        self._start = _PREAMBLE.size + length
+        self._count = header['count']
+        self._brands = header['brands']
+        self._fundings = [None] + header['fundings']
+        # Decoded ranges, shared by every card in the same range
+        self._infos = {}
+
+    @classmethod
+    def open(cls, path):
+        """Memory maps the index file at ``path``."""
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_csv(cls, path):
+        """Compiles the BIN range file at ``path`` into a new index."""
+        with open(path, 'rb') as f:
+            return cls(_read_csv(f.read()))
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Closes the memory map of an index from :meth:`open`."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def _search(self, key, lo=0):
+        # Returns the position of the last range starting at or before key
+        data, start, size = self._data, self._start, _RECORD.size
+        hi = self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _LOW.unpack_from(data, start + mid * size)[0] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def _info(self, position, key):
+        if position < 0:
+            return None
+        cached = self._infos.get(position)
+        if cached is None:
+            low, high, brand, funding, min_length, max_length, country = \
+                _RECORD.unpack_from(self._data,
+                    self._start + position * _RECORD.size)
+            if country == _NO_COUNTRY:
+                country = None
+            elif not PY2:
+                country = country.decode('ascii')
+            cached = self._infos[position] = (high, BinInfo(
+                self._brands[brand], self._fundings[funding], country,
+                min_length, max_length))
+        high, info = cached
+        return info if key <= high else None
+
+    def lookup(self, number):
+        """
+        Returns the :class:`BinInfo` of the range holding ``number``, a card
+        number or its first six or more digits, or ``None`` if it is in no
+        range.
+        """
+        key = _key(number)
+        return self._info(self._search(key), key)
+
+    def lookup_many(self, numbers):
+        """
+        Looks up each of ``numbers``, returning a list of the results in the
+        same order. The numbers are searched in sorted order, each search
+        starting from the last, so large batches cost little more than a
+        pass over the table.
+        """
+        keys = [_key(number) for number in numbers]
+        results = [None] * len(keys)
+        position = -1
+        for index in sorted(range(len(keys)), key=keys.__getitem__):
+            key = keys[index]
+            position = self._search(key, max(position, 0))
+            results[index] = self._info(position, key)
+        return results
+
+
+def default_index():
+    """
+    Returns the index used by :class:`CreditCard
+    <authorize.data.CreditCard>`, compiling the ranges shipped with this
+    library the first time unless another index has been installed.
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                data = pkgutil.get_data('authorize', 'bin_ranges.csv')
+                _default = BinIndex(_read_csv(data))
+    return _default
+
+
+def set_default_index(index):
+    """
+    Installs ``index`` as the index used by :class:`CreditCard
+    <authorize.data.CreditCard>`. Pass ``None`` to go back to the ranges
+    shipped with this library.
+    """
+    global _default
+    _default = index
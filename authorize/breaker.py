@@ -0,0 +1,209 @@
+"""
+Circuit breakers stop the client from piling requests onto an Authorize.net
+endpoint that is failing. Each API (AIM transactions, CIM saved payments and
+ARB recurring payments) has its own breaker, which watches the outcome and
+latency of the most recent calls.
+
+When too many recent calls have failed to reach the gateway, or have been too
+slow, the breaker opens and further calls fail immediately with an
+:class:`AuthorizeCircuitOpenError
+<authorize.exceptions.AuthorizeCircuitOpenError>` instead of waiting on a
+timeout. After ``reset_timeout`` seconds the breaker lets a few probe calls
+through; if they succeed it closes again, otherwise it stays open.
+
+Only connection problems count as failures. An error response from the
+gateway, such as a declined card, means the endpoint is working.
+
+The breakers are off unless the client is given ``breaker_options``, even
+an empty dictionary for the defaults::
+
+    >>> client = AuthorizeClient('285tUPuS', '58JKJ4T95uee75wd',
+    ...     breaker_options={'failure_rate': 0.2})
+"""
+from collections import deque
+import threading
+import time
+from timeit import default_timer
+
+from authorize.exceptions import AuthorizeCircuitOpenError, \
+    AuthorizeConnectionError, AuthorizeError
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """
+    A circuit breaker for the endpoint called ``name``.
+
+    ``window``
+        The number of most recent calls used to compute failure rates.
+
+    ``minimum_calls``
+        The breaker won't open until at least this many calls are in the
+        window.
+
+    ``failure_rate``
+        The fraction of failed calls in the window that opens the breaker.
+
+    ``slow_call_duration``
+        Calls taking longer than this many seconds count as slow. Set to
+        ``None`` to ignore latency.
+
+    ``slow_call_rate``
+        The fraction of slow calls in the window that opens the breaker.
+
+    ``reset_timeout``
+        The number of seconds the breaker stays open before probing.
+
+    ``half_open_calls``
+        The number of probe calls that must succeed to close the breaker.
+
+    ``enabled``
+        Set to ``False`` to let every call through without watching it.
+    """
+    def __init__(self, name, window=50, minimum_calls=10, failure_rate=0.5,
+            slow_call_duration=None, slow_call_rate=0.8, reset_timeout=30,
+            half_open_calls=3, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.minimum_calls = minimum_calls
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes = 0
+        self._probe_successes = 0
+        self._times_opened = 0
+        self._rejected = 0
+
+    def __repr__(self):
+        return '<CircuitBreaker {0.name} {0.state}>'.format(self)
+
+    @property
+    def state(self):
+        """The current state: ``'closed'``, ``'open'`` or ``'half-open'``."""
+        with self._lock:
+            self._check_reset()
+            return self._state
+
+    def guard(self):
+        """
+        Returns a context manager to wrap a single gateway call in. Raises
+        :class:`AuthorizeCircuitOpenError
+        <authorize.exceptions.AuthorizeCircuitOpenError>` if the breaker is
+        open.
+        """
+        if not self.enabled:
+            return _NULL_GUARD
+        with self._lock:
+            self._check_reset()
+            if self._state == OPEN or (self._state == HALF_OPEN and
+                    self._probes >= self.half_open_calls):
+                self._rejected += 1
+                raise AuthorizeCircuitOpenError('The circuit breaker for '
+                    'the {0} API is open.'.format(self.name))
+            if self._state == HALF_OPEN:
+                self._probes += 1
+        return _Guard(self)
+
+    def record(self, duration, failed):
+        """Records the outcome of a call that was let through."""
+        slow = self.slow_call_duration is not None and \
+            duration > self.slow_call_duration
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._close()
+                return
+            self._outcomes.append((failed, slow))
+            if self._state == CLOSED and self._should_open():
+                self._open()
+
+    def stats(self):
+        """
+        Returns a dictionary describing the breaker for metrics: its
+        ``state``, the ``calls``, ``failures`` and ``slow_calls`` in the
+        window, how many ``times_opened`` and how many calls were
+        ``rejected`` while open.
+        """
+        with self._lock:
+            self._check_reset()
+            return {
+                'name': self.name,
+                'state': self._state,
+                'calls': len(self._outcomes),
+                'failures': sum(1 for failed, _ in self._outcomes if failed),
+                'slow_calls': sum(1 for _, slow in self._outcomes if slow),
+                'times_opened': self._times_opened,
+                'rejected': self._rejected,
+            }
+
+    def reset(self):
+        """Closes the breaker and forgets recent calls."""
+        with self._lock:
+            self._close()
+
+    def _should_open(self):
+        calls = len(self._outcomes)
+        if calls < self.minimum_calls:
+            return False
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        return (failures >= self.failure_rate * calls or
+            slow_calls >= self.slow_call_rate * calls)
+
+    def _check_reset(self):
+        if self._state == OPEN and \
+                time.time() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._times_opened += 1
+
+    def _close(self):
+        self._state = CLOSED
+        self._opened_at = None
+        self._outcomes.clear()
+
+
+class _Guard(object):
+    def __init__(self, breaker):
+        self.breaker = breaker
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Error responses from the gateway mean the endpoint is up
+        failed = exc_type is not None and (
+            issubclass(exc_type, AuthorizeConnectionError) or
+            not issubclass(exc_type, AuthorizeError))
+        self.breaker.record(default_timer() - self.start, failed)
+        return False
+
+
+class _NullGuard(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_GUARD = _NullGuard()
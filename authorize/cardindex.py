@@ -0,0 +1,209 @@
+"""
+Card indexes keep a card that is saved again from being saved twice. Each
+saved card is remembered under a fingerprint of its number and expiration
+date, an HMAC keyed with a secret of yours, so the index never holds a card
+number and its fingerprints are useless to anyone without the key. Pass an
+index to the :class:`AuthorizeClient <authorize.client.AuthorizeClient>`
+and :meth:`AuthorizeCreditCard.save
+<authorize.client.AuthorizeCreditCard.save>` consults it::
+
+    >>> from authorize.cardindex import SQLiteCardIndex
+    >>> index = SQLiteCardIndex('/var/lib/shop/cards.db', key=CARD_SECRET)
+    >>> client = AuthorizeClient('285tUPuS', '58JKJ4T95uee75wd',
+    ...     card_index=index)
+    >>> client.card(cc).save(customer_id=42).uid
+    '7713982|6743206'
+    >>> client.card(cc).save(customer_id=42).uid
+    '7713982|6743206'
+
+A card already saved for the same customer returns the saved card it was
+saved as, without calling Authorize.net. A new card for a customer with a
+saved card is added to that customer's profile rather than getting a
+profile of its own, and that profile keeps the email it was first saved
+with. Cards saved without a customer id are neither looked up nor
+remembered, so cards of different anonymous customers are never mixed up.
+When the same card is saved twice at once, both saves may reach
+Authorize.net, but only the first to be indexed is kept; the other copy is
+deleted again and both return the same saved card.
+
+The index only knows about cards saved through it. Cards deleted with
+:meth:`AuthorizeSavedCard.delete
+<authorize.client.AuthorizeSavedCard.delete>` are dropped from it, but cards
+deleted some other way must be dropped with :meth:`CardIndex.discard`.
+Keep the key as secret as your transaction key, and never change it, or
+every card will look new.
+"""
+import hashlib
+import hmac
+import sqlite3
+import threading
+
+from six import text_type
+
+
+def _customer(customer_id):
+    return '' if customer_id is None else text_type(customer_id)
+
+
+class CardIndex(object):
+    """
+    Base class for card indexes, fingerprinting cards with ``key``, a
+    secret string. Subclasses implement ``find``, ``profile``, ``add``,
+    ``discard`` and ``discard_profile``.
+    """
+    def __init__(self, key):
+        if not key:
+            raise ValueError('A card index needs a secret key.')
+        if isinstance(key, text_type):
+            key = key.encode('utf-8')
+        self._key = key
+
+    def fingerprint(self, credit_card):
+        """
+        Returns the fingerprint of the number and expiration date of
+        ``credit_card``.
+        """
+        # The expiration is normalised, so '1' and '01' are the same month
+        card = '{0}|{1.year}-{1.month:0>2}'.format(credit_card.card_number,
+            credit_card.expiration)
+        return hmac.new(self._key, card.encode('utf-8'),
+            hashlib.sha256).hexdigest()
+
+    def find(self, fingerprint, customer_id):
+        """
+        Returns the uid of the card with ``fingerprint`` saved for
+        ``customer_id``, or ``None``.
+        """
+        raise NotImplementedError
+
+    def profile(self, customer_id):
+        """
+        Returns the id of the profile holding the cards of ``customer_id``,
+        or ``None``.
+        """
+        raise NotImplementedError
+
+    def add(self, fingerprint, customer_id, uid):
+        """
+        Remembers the saved card ``uid`` of ``customer_id``, unless a card
+        with ``fingerprint`` was remembered for them first, and returns the
+        uid of the card remembered.
+        """
+        raise NotImplementedError
+
+    def discard(self, uid):
+        """Forgets the saved card ``uid``."""
+        raise NotImplementedError
+
+    def discard_profile(self, profile_id):
+        """Forgets the profile ``profile_id`` and all of its cards."""
+        raise NotImplementedError
+
+
+class MemoryCardIndex(CardIndex):
+    """Keeps the index in memory, for a single process."""
+    def __init__(self, key):
+        super(MemoryCardIndex, self).__init__(key)
+        self._cards = {}
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def find(self, fingerprint, customer_id):
+        return self._cards.get((fingerprint, _customer(customer_id)))
+
+    def profile(self, customer_id):
+        return self._profiles.get(_customer(customer_id))
+
+    def add(self, fingerprint, customer_id, uid):
+        with self._lock:
+            uid = self._cards.setdefault(
+                (fingerprint, _customer(customer_id)), uid)
+            if customer_id is not None:
+                self._profiles.setdefault(_customer(customer_id),
+                    uid.split('|')[0])
+            return uid
+
+    def discard(self, uid):
+        with self._lock:
+            for key, value in list(self._cards.items()):
+                if value == uid:
+                    del self._cards[key]
+
+    def discard_profile(self, profile_id):
+        profile_id = text_type(profile_id)
+        with self._lock:
+            for key, value in list(self._cards.items()):
+                if value.split('|')[0] == profile_id:
+                    del self._cards[key]
+            for key, value in list(self._profiles.items()):
+                if value == profile_id:
+                    del self._profiles[key]
+
+
+class SQLiteCardIndex(CardIndex):
+    """
+    Keeps the index in an SQLite database at ``path``, so processes on the
+    same machine share it.
+    """
+    def __init__(self, path, key):
+        super(SQLiteCardIndex, self).__init__(key)
+        self.path = path
+        self._local = threading.local()
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS authorize_cards ('
+            'fingerprint TEXT, customer TEXT, profile TEXT, uid TEXT, '
+            'PRIMARY KEY (fingerprint, customer))')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS authorize_card_profiles ('
+            'customer TEXT PRIMARY KEY, profile TEXT)')
+
+    @property
+    def _connection(self):
+        # SQLite connections can't be shared between threads
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = sqlite3.connect(self.path,
+                isolation_level=None)
+        return self._local.connection
+
+    def find(self, fingerprint, customer_id):
+        row = self._connection.execute(
+            'SELECT uid FROM authorize_cards '
+            'WHERE fingerprint = ? AND customer = ?',
+            (fingerprint, _customer(customer_id))).fetchone()
+        return row and row[0]
+
+    def profile(self, customer_id):
+        if customer_id is None:
+            return None
+        row = self._connection.execute(
+            'SELECT profile FROM authorize_card_profiles WHERE customer = ?',
+            (_customer(customer_id),)).fetchone()
+        return row and row[0]
+
+    def add(self, fingerprint, customer_id, uid):
+        profile_id = uid.split('|')[0]
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Whichever process adds the card first wins
+            connection.execute(
+                'INSERT OR IGNORE INTO authorize_cards VALUES (?, ?, ?, ?)',
+                (fingerprint, _customer(customer_id), profile_id, uid))
+            if customer_id is not None:
+                connection.execute('INSERT OR IGNORE INTO '
+                    'authorize_card_profiles VALUES (?, ?)',
+                    (_customer(customer_id), profile_id))
+            return self.find(fingerprint, customer_id)
+        finally:
+            connection.execute('COMMIT')
+
+    def discard(self, uid):
+        self._connection.execute(
+            'DELETE FROM authorize_cards WHERE uid = ?', (uid,))
+
+    def discard_profile(self, profile_id):
+        profile_id = text_type(profile_id)
+        for table in ('authorize_cards', 'authorize_card_profiles'):
+            self._connection.execute(
+                'DELETE FROM {0} WHERE profile = ?'.format(table),
+                (profile_id,))
@@ -18,9 +18,20 @@ Authorize.net_.
 """
 from uuid import uuid4
 
-from authorize.apis.customer import CustomerAPI
+from authorize import timing
+from authorize.apis.customer import CustomerAPI, SERVICE_PATH
+from authorize.apis.jsonapi import JSONCustomerAPI, JSONRecurringAPI
 from authorize.apis.recurring import RecurringAPI
-from authorize.apis.transaction import TransactionAPI
+from authorize.apis.reporting import ReportingAPI, XML_PATH
+from authorize.apis.transaction import AIM_PATH, TransactionAPI
+from authorize.breaker import CircuitBreaker
+from authorize.exceptions import AuthorizeResponseError
+from authorize.idempotency import MemoryJournal, request_fingerprint
+from authorize.tracing import traced
+
+
+# The code of Authorize.net's error for a record that doesn't exist
+NOT_FOUND = 'E00040'
 
 
 class AuthorizeClient(object):
@@ -35,16 +46,133 @@ class AuthorizeClient(object):
     depending on debug mode. The ``test`` option determines whether to run
     the standard API in test mode, which should generally be left ``False``,
     even in development and staging environments.
+
+    The ``journal`` option takes an idempotency journal from
+    :mod:`authorize.idempotency` that remembers the responses of operations
+    given an ``idempotency_key``. It defaults to an in-memory journal; pass a
+    shared journal to detect duplicates across processes.
+
+    To stop calling an Authorize.net API that is failing, pass
+    ``breaker_options`` to protect each API with a
+    :class:`CircuitBreaker <authorize.breaker.CircuitBreaker>`. The
+    dictionary is passed as keyword arguments to each breaker to tune its
+    thresholds; pass an empty one for the defaults. Without it, calls are
+    never cut off.
+
+    To pace calls to Authorize.net, pass a
+    :class:`RateLimiter <authorize.limiter.RateLimiter>` as ``limiter``. It
+    is shared by all three APIs, and by any other clients given the same
+    limiter.
+
+    To share a fixed number of calls in flight between the clients of
+    several merchant accounts, pass the same
+    :class:`Scheduler <authorize.scheduler.Scheduler>` as ``scheduler`` to
+    each. Calls made inside a :func:`priority(BATCH)
+    <authorize.scheduler.priority>` block then wait behind interactive ones,
+    and each merchant gets its fair share.
+
+    To keep cards that are saved again from piling up as new profiles, pass
+    a :mod:`card index <authorize.cardindex>` as ``card_index``.
+
+    Slow saved card lookups can be hedged by passing a
+    :class:`Hedger <authorize.hedging.Hedger>` as ``hedger``. Only read-only
+    operations are ever hedged.
+
+    The ``transport`` option takes a
+    :class:`Transport <authorize.transport.Transport>` that sends the HTTP
+    requests of all three APIs, such as the recording and replay transports
+    in :mod:`authorize.replay`.
+
+    To talk to a server other than Authorize.net's, such as the
+    :mod:`emulator <authorize.emulator>`, pass its ``base_url``, for example
+    ``'http://localhost:8080'``. The APIs are then expected at the same paths
+    as on Authorize.net's servers.
+
+    Saved cards and recurring payments use Authorize.net's SOAP services by
+    default. Pass ``backend='json'`` to use its JSON API instead, which
+    avoids fetching and parsing the WSDL and is cheaper per call. With the
+    SOAP services, pass ``streaming=True`` to read the replies of the most
+    used operations with the :mod:`streaming parser
+    <authorize.apis.streaming>`, which keeps only the fields this library
+    needs and stops reading once it has them.
+
+    Bulk runs holding on to many transactions can save memory with a lean
+    mode: pass ``response_fields``, a sequence of the keys of each
+    transaction's ``full_response`` to keep, such as
+    ``('transaction_id', 'amount')``. Other keys are dropped, as is each
+    transaction's ``timing``, and ``full_response`` is ``None`` if no keys
+    are kept.
     """
-    def __init__(self, login_id, transaction_key, debug=True, test=False):
+    def __init__(self, login_id, transaction_key, debug=True, test=False,
+            journal=None, breaker_options=None, limiter=None, hedger=None,
+            transport=None, base_url=None, response_fields=None,
+            backend='soap', streaming=False, scheduler=None,
+            card_index=None):
         self.login_id = login_id
         self.transaction_key = transaction_key
         self.debug = debug
         self.test = test
+        self.journal = journal if journal is not None else MemoryJournal()
+        self.response_fields = response_fields
+        self.card_index = card_index
         self._transaction = TransactionAPI(login_id, transaction_key,
             debug, test)
-        self._recurring = RecurringAPI(login_id, transaction_key, debug, test)
-        self._customer = CustomerAPI(login_id, transaction_key, debug, test)
+        if backend == 'soap':
+            self._recurring = RecurringAPI(login_id, transaction_key, debug,
+                test)
+            self._customer = CustomerAPI(login_id, transaction_key, debug,
+                test)
+        elif backend == 'json':
+            self._recurring = JSONRecurringAPI(login_id, transaction_key,
+                debug, test)
+            self._customer = JSONCustomerAPI(login_id, transaction_key,
+                debug, test)
+        else:
+            raise ValueError("The backend must be 'soap' or 'json', not "
+                '{0!r}.'.format(backend))
+        self.backend = backend
+        self._reporting = ReportingAPI(login_id, transaction_key, debug, test)
+        if breaker_options is not None:
+            for api in self._apis:
+                api.breaker = CircuitBreaker(api.breaker.name,
+                    **breaker_options)
+        if limiter is not None:
+            for api in self._apis:
+                api.limiter = limiter
+        if scheduler is not None:
+            for api in self._apis:
+                api.scheduler = scheduler
+        self._customer.hedger = hedger
+        if backend == 'soap':
+            self._customer.streaming = self._recurring.streaming = streaming
+        for api in self._apis:
+            api.transport = transport
+        if base_url is not None:
+            base_url = base_url.rstrip('/')
+            self._transaction.url = base_url + AIM_PATH
+            self._reporting.url = base_url + XML_PATH
+            for api in (self._customer, self._recurring):
+                if backend == 'json':
+                    api.url = base_url + XML_PATH
+                else:
+                    api.location = base_url + SERVICE_PATH
+                    api.url = api.location + '?WSDL'
+
+    @property
+    def _apis(self):
+        return (self._transaction, self._customer, self._recurring,
+            self._reporting)
+
+    @property
+    def breakers(self):
+        """
+        A dictionary of the
+        :class:`CircuitBreaker <authorize.breaker.CircuitBreaker>` instances
+        protecting each API, keyed by ``'aim'``, ``'cim'``, ``'arb'`` and
+        ``'reporting'``. They are disabled unless the client was given
+        ``breaker_options``.
+        """
+        return dict((api.breaker.name, api.breaker) for api in self._apis)
 
     def card(self, credit_card, address=None, email=None):
         """
@@ -86,6 +214,87 @@ class AuthorizeClient(object):
         """
         return AuthorizeRecurring(self, uid)
 
+    def settled_batches(self, first, last, statistics=False):
+        """
+        Returns an iterator over the settlement batches from the date
+        ``first`` to the date ``last`` inclusive. Each batch is a dictionary
+        with its ``batch_id``, ``settled`` time and ``settlement_state``, and
+        its ``statistics`` if requested.
+        """
+        return self._reporting.settled_batches(first, last,
+            statistics=statistics)
+
+    def batch_transactions(self, batch_id):
+        """
+        Returns an iterator over the transactions settled in a batch. Each
+        transaction is a dictionary with the same keys as the
+        ``full_response`` of a transaction where they overlap, such as
+        ``transaction_id`` and ``amount``, plus its ``status``,
+        ``submitted`` time, ``invoice_number`` and so on. Results are fetched
+        a page at a time as the iterator is consumed.
+        """
+        return self._reporting.batch_transactions(batch_id)
+
+    def settled_transactions(self, first, last):
+        """
+        Returns an iterator over every transaction settled from the date
+        ``first`` to the date ``last`` inclusive, each with its ``batch_id``
+        added.
+        """
+        for batch in self.settled_batches(first, last):
+            for transaction in self.batch_transactions(batch['batch_id']):
+                transaction['batch_id'] = batch['batch_id']
+                yield transaction
+
+    def unsettled_transactions(self):
+        """
+        Returns an iterator over the transactions that have not been settled
+        yet, in the same format as :meth:`batch_transactions`.
+        """
+        return self._reporting.unsettled_transactions()
+
+    def saved_profile_ids(self):
+        """
+        Returns the ids of every customer profile saved on Authorize.net, as
+        strings.
+        """
+        return self._customer.list_profile_ids()
+
+    def saved_profile(self, profile_id):
+        """
+        Returns a saved customer profile as a dictionary with its
+        ``profile_id``, ``merchant_customer_id``, ``description``, ``email``
+        and a list of its ``payments``. Each payment has its ``payment_id``,
+        masked card ``number`` and ``expiration``, and its billing name and
+        address in the fields of an :class:`Address
+        <authorize.data.Address>`, such as ``first_name`` and ``zip_code``.
+        """
+        return self._customer.retrieve_profile(profile_id)
+
+    def _transact(self, operation, idempotency_key, method, *args, **kwargs):
+        # Runs a transaction through the journal, returning it with its
+        # response and the timing of the gateway call, if one was made
+        with timing.collect() as timings:
+            response = self._execute(operation, idempotency_key, method,
+                *args, **kwargs)
+        transaction = self.transaction(response['transaction_id'])
+        if self.response_fields is None:
+            transaction.full_response = response
+            transaction.timing = timings[-1] if timings else None
+        else:
+            transaction.full_response = dict((key, response[key])
+                for key in self.response_fields if key in response) or None
+        return transaction
+
+    def _execute(self, operation, idempotency_key, method, *args, **kwargs):
+        # Runs a money-moving API call through the idempotency journal
+        if idempotency_key is None:
+            return method(*args, **kwargs)
+        key = '{0}:{1}:{2}'.format(self.login_id, operation, idempotency_key)
+        fingerprint = request_fingerprint(self.transaction_key, args, kwargs)
+        return self.journal.execute(key, lambda: method(*args, **kwargs),
+            fingerprint)
+
 
 class AuthorizeCreditCard(object):
     """
@@ -96,6 +305,8 @@ class AuthorizeCreditCard(object):
     Any operation performed on this instance returns another instance you can
     work with, such as a transaction, saved card, or recurring payment.
     """
+    __slots__ = ('_client', 'credit_card', 'address', 'email')
+
     def __init__(self, client, credit_card, address=None, email=None):
         self._client = client
         self.credit_card = credit_card
@@ -106,40 +317,94 @@ class AuthorizeCreditCard(object):
         return '<AuthorizeCreditCard {0.credit_card.card_type} ' \
             '{0.credit_card.safe_number}>'.format(self)
 
-    def auth(self, amount):
+    @traced('AuthorizeCreditCard.auth')
+    def auth(self, amount, idempotency_key=None):
         """
         Authorize a transaction against this card for the specified amount.
         This verifies the amount is available on the card and reserves it.
         Returns an
         :class:`AuthorizeTransaction <authorize.client.AuthorizeTransaction>`
         instance representing the transaction.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._transaction.auth(
+        return self._client._transact('auth', idempotency_key,
+            self._client._transaction.auth,
             amount, self.credit_card, self.address, self.email)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
 
-    def capture(self, amount):
+    @traced('AuthorizeCreditCard.capture')
+    def capture(self, amount, idempotency_key=None):
         """
         Capture a transaction immediately on this card for the specified
         amount. Returns an
         :class:`AuthorizeTransaction <authorize.client.AuthorizeTransaction>`
         instance representing the transaction.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._transaction.capture(
+        return self._client._transact('capture', idempotency_key,
+            self._client._transaction.capture,
             amount, self.credit_card, self.address, self.email)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
 
-    def save(self):
+    @traced('AuthorizeCreditCard.save')
+    def save(self, customer_id=None):
         """
         Saves the credit card on Authorize.net's servers so you can create
         transactions at a later date. Returns an
         :class:`AuthorizeSavedCard <authorize.client.AuthorizeSavedCard>`
         instance that you can save or use.
-        """
+
+        If the client has a :mod:`card index <authorize.cardindex>`, a card
+        already saved for the same ``customer_id``, your own id for the
+        customer, is returned as it was saved, and a new card for a customer
+        with saved cards is added to the same profile. That profile keeps
+        the email it was saved with, so this card's email is ignored. Cards
+        saved without a ``customer_id`` always get a profile of their own.
+        """
+        index = self._client.card_index
+        if index is None or customer_id is None:
+            return self._save_profile()
+        fingerprint = index.fingerprint(self.credit_card)
+        uid = index.find(fingerprint, customer_id)
+        if uid is not None:
+            return self._client.saved_card(uid)
+        profile_id = index.profile(customer_id)
+        saved_card = None
+        if profile_id is not None:
+            try:
+                payment_id = self._client._customer.create_saved_payment(
+                    self.credit_card, address=self.address,
+                    profile_id=profile_id)
+            except AuthorizeResponseError as e:
+                # The profile was deleted behind the index's back
+                response = getattr(e, 'full_response', None) or {}
+                if response.get('response_code') != NOT_FOUND:
+                    raise
+                index.discard_profile(profile_id)
+            else:
+                saved_card = self._client.saved_card(
+                    '{0}|{1}'.format(profile_id, payment_id))
+        created = saved_card is None
+        if created:
+            saved_card = self._save_profile()
+        uid = index.add(fingerprint, customer_id, saved_card.uid)
+        if uid != saved_card.uid:
+            # The card was saved at the same time elsewhere and indexed
+            # first, so this copy goes again
+            if created:
+                self._client._customer.delete_saved_profile(
+                    saved_card._profile_id)
+            else:
+                self._client._customer.delete_saved_payment(
+                    saved_card._profile_id, saved_card._payment_id)
+            saved_card = self._client.saved_card(uid)
+        return saved_card
+
+    def _save_profile(self):
         unique_id = uuid4().hex[:20]
         payment = self._client._customer.create_saved_payment(
             self.credit_card, address=self.address)
@@ -148,6 +413,7 @@ class AuthorizeCreditCard(object):
         uid = '{0}|{1}'.format(profile_id, payment_ids[0])
         return self._client.saved_card(uid)
 
+    @traced('AuthorizeCreditCard.recurring')
     def recurring(self, amount, start, days=None, months=None,
             occurrences=None, trial_amount=None, trial_occurrences=None):
         """
@@ -204,15 +470,32 @@ class AuthorizeTransaction(object):
 
     Additionally, if you need to access the full raw result of the transaction
     it is stored in the ``full_response`` attribute on the class.
+
+    The ``timing`` attribute holds the phase by phase
+    :class:`CallTiming <authorize.timing.CallTiming>` of the call to
+    Authorize.net that created the transaction. It is ``None`` if no call
+    was made, such as when the result came from the idempotency journal.
     """
+    __slots__ = ('_client', 'uid', 'full_response', 'timing')
+
     def __init__(self, client, uid):
         self._client = client
         self.uid = uid
+        self.timing = None
 
     def __repr__(self):
         return '<AuthorizeTransaction {0.uid}>'.format(self)
 
-    def settle(self, amount=None):
+    @traced('AuthorizeTransaction.details')
+    def details(self):
+        """
+        Fetches the full details of this transaction from the reporting API,
+        returned as a dictionary.
+        """
+        return self._client._reporting.transaction_details(self.uid)
+
+    @traced('AuthorizeTransaction.settle')
+    def settle(self, amount=None, idempotency_key=None):
         """
         Settles this transaction if it is a previous authorization. If no
         ``amount`` is specified, the full amount will be settled; if a lower
@@ -220,13 +503,16 @@ class AuthorizeTransaction(object):
         ``amount`` is given, it will result in an error. Returns an
         :class:`AuthorizeTransaction <authorize.client.AuthorizeTransaction>`
         instance representing the settlement transaction.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._transaction.settle(self.uid, amount=amount)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
+        return self._client._transact('settle', idempotency_key,
+            self._client._transaction.settle, self.uid, amount=amount)
 
-    def credit(self, card_number, amount):
+    @traced('AuthorizeTransaction.credit')
+    def credit(self, card_number, amount, idempotency_key=None):
         """
         Creates a credit (refund) back on the original transaction. The
         ``card_number`` should be the last four digits of the credit card
@@ -249,24 +535,28 @@ class AuthorizeTransaction(object):
           original amount charged.
         * The credit transaction must be submitted within 120 days of the date
           the original transaction was settled.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._transaction.credit(
-            card_number, self.uid, amount)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
+        return self._client._transact('credit', idempotency_key,
+            self._client._transaction.credit, card_number, self.uid, amount)
 
-    def void(self):
+    @traced('AuthorizeTransaction.void')
+    def void(self, idempotency_key=None):
         """
         Voids a previous authorization that has not yet been settled. Returns
         an
         :class:`AuthorizeTransaction <authorize.client.AuthorizeTransaction>`
         instance representing the void transaction.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._transaction.void(self.uid)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
+        return self._client._transact('void', idempotency_key,
+            self._client._transaction.void, self.uid)
 
 
 class AuthorizeSavedCard(object):
@@ -290,41 +580,62 @@ class AuthorizeSavedCard(object):
     method.
     """
 
+    __slots__ = ('_client', 'uid')
+
     def __init__(self, client, uid):
+        if uid.count('|') != 1:
+            raise ValueError('Saved card uids have the form '
+                '"profile_id|payment_id", not {0!r}'.format(uid))
         self._client = client
         self.uid = uid
-        self._profile_id, self._payment_id = uid.split('|')
+
+    # The ids are split out of the uid when needed rather than kept, so
+    # saved cards hold one string instead of three
+    @property
+    def _profile_id(self):
+        return self.uid.split('|')[0]
+
+    @property
+    def _payment_id(self):
+        return self.uid.split('|')[1]
 
     def __repr__(self):
         return '<AuthorizeSavedCard {0.uid}>'.format(self)
 
-    def auth(self, amount, cvv=None):
+    @traced('AuthorizeSavedCard.auth')
+    def auth(self, amount, cvv=None, idempotency_key=None):
         """
         Authorize a transaction against this card for the specified amount.
         This verifies the amount is available on the card and reserves it.
         Returns an
         :class:`AuthorizeTransaction <authorize.client.AuthorizeTransaction>`
         instance representing the transaction.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._customer.auth(
+        return self._client._transact('saved_auth', idempotency_key,
+            self._client._customer.auth,
             self._profile_id, self._payment_id, amount, cvv)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
 
-    def capture(self, amount, cvv=None):
+    @traced('AuthorizeSavedCard.capture')
+    def capture(self, amount, cvv=None, idempotency_key=None):
         """
         Capture a transaction immediately on this card for the specified
         amount. Returns an
         :class:`AuthorizeTransaction <authorize.client.AuthorizeTransaction>`
         instance representing the transaction.
+
+        If an ``idempotency_key`` is given and an operation with the same key
+        has already succeeded, the stored result is returned instead of
+        contacting Authorize.net again.
         """
-        response = self._client._customer.capture(
+        return self._client._transact('saved_capture', idempotency_key,
+            self._client._customer.capture,
             self._profile_id, self._payment_id, amount, cvv)
-        transaction = self._client.transaction(response['transaction_id'])
-        transaction.full_response = response
-        return transaction
 
+    @traced('AuthorizeSavedCard.update')
     def update(self, **kwargs):
         """
         Updates information about a saved card. You can use this to change the
@@ -370,6 +681,7 @@ class AuthorizeSavedCard(object):
         self._client._customer.update_saved_payment(
             self._profile_id, self._payment_id, **settings)
 
+    @traced('AuthorizeSavedCard.get_payment_info')
     def get_payment_info(self):
         """
         Retrieves information about a card. It will return a dictionary
@@ -386,12 +698,15 @@ class AuthorizeSavedCard(object):
         return self._client._customer.retrieve_saved_payment(
             self._profile_id, self._payment_id)
 
+    @traced('AuthorizeSavedCard.delete')
     def delete(self):
         """
         Removes this saved card from the Authorize.net database.
         """
         self._client._customer.delete_saved_payment(
             self._profile_id, self._payment_id)
+        if self._client.card_index is not None:
+            self._client.card_index.discard(self.uid)
 
 
 class AuthorizeRecurring(object):
@@ -406,6 +721,8 @@ class AuthorizeRecurring(object):
     want to make changes to an existing recurring payment or to cancel a
     recurring payment, this provides the interface.
     """
+    __slots__ = ('_client', 'uid')
+
     def __init__(self, client, uid):
         self._client = client
         self.uid = uid
@@ -413,6 +730,7 @@ class AuthorizeRecurring(object):
     def __repr__(self):
         return '<AuthorizeRecurring {0.uid}>'.format(self)
 
+    @traced('AuthorizeRecurring.update')
     def update(self, amount=None, start=None, occurrences=None,
             trial_amount=None, trial_occurrences=None):
         """
@@ -448,6 +766,7 @@ class AuthorizeRecurring(object):
             amount=amount, start=start, occurrences=occurrences,
             trial_amount=trial_amount, trial_occurrences=trial_occurrences)
 
+    @traced('AuthorizeRecurring.delete')
     def delete(self):
         """
         Cancels any future charges from this recurring payment.
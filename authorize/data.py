@@ -1,15 +1,22 @@
 """
-This module provides the data structures for describing credit cards and
-addresses for use in executing charges.
+This module provides the data structures for describing credit cards,
+addresses and amounts for use in executing charges.
 """
 
 import calendar
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import functools
 import re
 
+from six import integer_types, string_types
+
+from authorize.bins import default_index
 from authorize.exceptions import AuthorizeInvalidError
 
 
+# Deprecated, kept for code importing it: the card type patterns used
+# before card brands were looked up in authorize.bins
 CARD_TYPES = {
     'visa': r'4\d{12}(\d{3})?$',
     'amex': r'37\d{13}$',
@@ -18,6 +25,9 @@ CARD_TYPES = {
     'diners': r'(30[0-5]\d{11}|(36|38)\d{12})$'
 }
 
+# Amounts in dollars with at most two places of cents, such as '12.5'
+_AMOUNT_RE = re.compile(r'\s*(-?)(\d+)(?:\.(\d{0,2})0*)?\s*$')
+
 
 class CreditCard(object):
     """
@@ -86,16 +96,28 @@ class CreditCard(object):
         mask = '*' * (len(self.card_number) - 4)
         return '{0}{1}'.format(mask, self.card_number[-4:])
 
+    @property
+    def bin_info(self):
+        """
+        The :class:`BinInfo <authorize.bins.BinInfo>` of the card's BIN
+        range, telling its brand and, if the installed BIN index knows them,
+        its funding type and issuing country, or ``None`` if the number is in
+        no known range.
+        """
+        return default_index().lookup(self.card_number)
+
     @property
     def card_type(self):
         """
         The credit card issuer, such as Visa or American Express, which is
-        determined from the credit card number. Recognizes Visa, American
-        Express, MasterCard, Discover, and Diners Club.
+        determined from the credit card number by :mod:`authorize.bins`.
+        Recognizes Visa (``'visa'``), MasterCard (``'mc'``), American
+        Express (``'amex'``), Discover, Diners Club, JCB, UnionPay, Maestro
+        and Mir.
         """
-        for card_type, card_type_re in CARD_TYPES.items():
-            if re.match(card_type_re, self.card_number):
-                return card_type
+        info = self.card_number and self.bin_info
+        if info and info.valid_length(self.card_number):
+            return info.brand
 
 
 class Address(object):
@@ -114,3 +136,153 @@ class Address(object):
     def __repr__(self):
         return '<Address {0.street}, {0.city}, {0.state} {0.zip_code}>' \
             .format(self)
+
+
+def to_cents(amount):
+    """
+    Returns ``amount`` in dollars, given as a :class:`Money` instance, an
+    int, a float, a Decimal or a string, as an int number of cents. Raises
+    :class:`AuthorizeInvalidError
+    <authorize.exceptions.AuthorizeInvalidError>` rather than rounding an
+    amount with fractions of a cent.
+    """
+    if isinstance(amount, Money):
+        return amount.cents
+    if isinstance(amount, integer_types) and not isinstance(amount, bool):
+        return amount * 100
+    if isinstance(amount, string_types):
+        match = _AMOUNT_RE.match(amount)
+        if match is not None:
+            sign, dollars, cents = match.groups()
+            cents = int(dollars) * 100 + int((cents or '').ljust(2, '0'))
+            return -cents if sign else cents
+    elif isinstance(amount, float):
+        # A float is exact to well under a cent for any real amount, so it
+        # is taken as the nearest whole number of cents if it is one
+        if amount == amount and abs(amount) < 1e13:
+            cents = round(amount * 100)
+            if abs(amount * 100 - cents) < 1e-3:
+                return int(cents)
+        raise AuthorizeInvalidError(
+            '{0!r} is not an amount in whole cents.'.format(amount))
+    if isinstance(amount, (Decimal,) + string_types):
+        try:
+            cents = Decimal(amount) * 100
+            if cents == cents.to_integral_value():
+                return int(cents)
+        except (InvalidOperation, OverflowError, ValueError):
+            pass
+    raise AuthorizeInvalidError(
+        '{0!r} is not an amount in whole cents.'.format(amount))
+
+
+@functools.total_ordering
+class Money(object):
+    """
+    An amount of money, held as an int number of ``cents``. Money instances
+    are immutable, can be added, subtracted and compared with each other,
+    and convert to the gateway's form with ``str``::
+
+        >>> str(Money(1250))
+        '12.50'
+        >>> Money.parse('9.99') + Money.parse(10)
+        <Money 19.99>
+
+    Every method taking an amount accepts a Money instance as well as an
+    int, float, Decimal or string number of dollars.
+    """
+    __slots__ = ('cents',)
+
+    def __init__(self, cents):
+        if not isinstance(cents, integer_types) or isinstance(cents, bool):
+            raise TypeError('Money takes a whole number of cents, not '
+                '{0!r}.'.format(cents))
+        object.__setattr__(self, 'cents', cents)
+
+    @classmethod
+    def parse(cls, amount):
+        """
+        Returns ``amount`` as Money, accepting any type :func:`to_cents`
+        does.
+        """
+        if isinstance(amount, cls):
+            return amount
+        return cls(to_cents(amount))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Money is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Money is immutable.')
+
+    def __str__(self):
+        if self.cents < 0:
+            return '-%d.%02d' % divmod(-self.cents, 100)
+        return '%d.%02d' % divmod(self.cents, 100)
+
+    def __repr__(self):
+        return '<Money {0}>'.format(self)
+
+    def __reduce__(self):
+        return Money, (self.cents,)
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __eq__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.cents == other.cents
+
+    def __ne__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.cents != other.cents
+
+    def __lt__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.cents < other.cents
+
+    def __bool__(self):
+        return self.cents != 0
+    __nonzero__ = __bool__
+
+    def __add__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.cents + other.cents)
+
+    def __sub__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.cents - other.cents)
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def to_decimal(self):
+        """Returns the amount in dollars as a Decimal."""
+        return Decimal(self.cents).scaleb(-2)
+
+
+def total(amounts):
+    """
+    Returns the sum of ``amounts``, any iterable of amounts accepted by
+    :func:`to_cents`, as Money. The sum is kept in int cents, so totalling
+    a bulk job's amounts creates no intermediate objects.
+    """
+    return Money(sum(to_cents(amount) for amount in amounts))
+
+
+def mismatches(left, right):
+    """
+    Compares two parallel iterables of amounts and returns the indexes at
+    which they differ, with the index of each unpaired amount if one runs
+    out first.
+    """
+    left = [to_cents(amount) for amount in left]
+    right = [to_cents(amount) for amount in right]
+    indexes = [i for i, (a, b) in enumerate(zip(left, right)) if a != b]
+    return indexes + list(range(min(len(left), len(right)),
+        max(len(left), len(right))))
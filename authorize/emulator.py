@@ -0,0 +1,184 @@
+"""
+A local HTTP server emulating Authorize.net, for CI and performance tests
+that can't use the sandbox. It serves the transaction API at
+``/gateway/transact.dll``, the CIM and ARB SOAP services, with their WSDL,
+at ``/soap/v1/Service.asmx``, and the same services through the JSON API at
+``/xml/v1/request.api``. Requests are answered by a
+:class:`Gateway <authorize.stub.Gateway>` that keeps transactions, saved
+profiles and subscriptions in memory, including settle and void state and
+duplicate transaction detection.
+
+Start it from the command line::
+
+    $ python -m authorize.emulator --port 8080 --latency 0.2 --error-rate 0.01
+
+and point a client at it with ``base_url``::
+
+    >>> client = AuthorizeClient('login', 'key', base_url='http://localhost:8080')
+
+Or run it inside a test with :func:`start_emulator`::
+
+    >>> server = start_emulator(latency=0.05)
+    >>> client = AuthorizeClient('login', 'key', base_url=server.base_url)
+    >>> # ...
+    >>> server.stop()
+
+Faults can be injected with these knobs, which may also be changed while the
+server runs:
+
+``latency``, ``jitter``
+    Every request is delayed by ``latency`` seconds plus a random extra of
+    up to ``jitter`` seconds.
+``error_rate``
+    The fraction of requests answered with ``503 Service Unavailable``.
+``drop_rate``
+    The fraction of requests whose connection is closed without a response.
+"""
+import argparse
+import random
+import socket
+import sys
+import threading
+import time
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from authorize.apis.customer import SERVICE_PATH
+from authorize.apis.reporting import XML_PATH
+from authorize.apis.transaction import AIM_PATH
+from authorize.stub import Gateway, service_wsdl
+
+
+WSDL_LOCATION = b'https://apitest.authorize.net/soap/v1/Service.asmx'
+
+
+class EmulatorServer(ThreadingMixIn, HTTPServer):
+    """
+    The emulator, listening on ``address``. Pass port 0 to pick a free port,
+    and read the chosen address back from :attr:`base_url`. Requests are
+    answered by ``gateway``, which defaults to a new
+    :class:`Gateway <authorize.stub.Gateway>`.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), gateway=None, latency=0,
+            jitter=0, error_rate=0, drop_rate=0):
+        HTTPServer.__init__(self, address, EmulatorHandler)
+        self.gateway = gateway if gateway is not None else Gateway()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.wsdl = service_wsdl().replace(WSDL_LOCATION,
+            (self.base_url + SERVICE_PATH).encode('ascii'))
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """The URL to pass to the client as ``base_url``."""
+        host, port = self.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        """Serves requests on a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops serving requests and closes the socket."""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AuthorizeEmulator/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == SERVICE_PATH and query.upper() == 'WSDL':
+            self._respond(200, 'text/xml; charset=utf-8', self.server.wsdl)
+        else:
+            self._respond(404, 'text/plain', b'Not found.')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        if random.random() < server.drop_rate:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if random.random() < server.error_rate:
+            self._respond(503, 'text/plain', b'Service unavailable.')
+            return
+        path = self.path.partition('?')[0]
+        if path == AIM_PATH:
+            response = server.gateway.handle_aim(body)
+            self._respond(200, 'text/plain; charset=utf-8',
+                response.encode('utf-8'))
+        elif path == SERVICE_PATH:
+            code, response = server.gateway.handle_soap(body)
+            self._respond(code, 'text/xml; charset=utf-8',
+                response.encode('utf-8'))
+        elif path == XML_PATH:
+            code, response = server.gateway.handle_json(body)
+            self._respond(code, 'application/json; charset=utf-8',
+                response.encode('utf-8'))
+        else:
+            self._respond(404, 'text/plain', b'Not found.')
+
+    def _respond(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_emulator(host='127.0.0.1', port=0, **options):
+    """
+    Starts an :class:`EmulatorServer` on a background thread and returns it.
+    The keyword arguments are passed to the server.
+    """
+    server = EmulatorServer((host, port), **options)
+    server.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m authorize.emulator',
+        description='Run a local Authorize.net emulator.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--drop-rate', type=float, default=0)
+    parser.add_argument('--duplicate-window', type=int, default=120)
+    args = parser.parse_args(argv)
+    server = EmulatorServer((args.host, args.port),
+        Gateway(duplicate_window=args.duplicate_window), args.latency,
+        args.jitter, args.error_rate, args.drop_rate)
+    print('Emulating Authorize.net at {0}'.format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,3 +12,11 @@ class AuthorizeResponseError(AuthorizeError):
 
 class AuthorizeInvalidError(AuthorizeError):
     """Invalid information provided."""
+
+
+class AuthorizeCircuitOpenError(AuthorizeConnectionError):
+    """Calls to the API are failing fast because its circuit breaker is open."""
+
+
+class AuthorizeQueueFullError(AuthorizeConnectionError):
+    """A call was turned away because too many calls are waiting their turn."""
@@ -0,0 +1,316 @@
+"""
+Exports every saved customer profile to a file, for backups, analytics or a
+move between gateway accounts. A :class:`ProfileExporter` lists the profile
+ids, fetches the profiles with a few worker threads and writes one record per
+profile, as returned by :meth:`AuthorizeClient.saved_profile
+<authorize.client.AuthorizeClient.saved_profile>`::
+
+    >>> exporter = ProfileExporter(client, 'profiles.jsonl.gz',
+    ...     concurrency=4, rate=5)
+    >>> exporter.run()
+    {'fetched': 1203, 'copied': 0, 'missing': 1}
+
+The format follows the file name: JSON Lines for ``.jsonl``, gzipped JSON
+Lines for ``.jsonl.gz`` and Parquet for ``.parquet``, which requires the
+``pyarrow`` package. Card numbers are masked by Authorize.net, so the export
+holds no full card numbers.
+
+Records are appended to ``PATH.partial`` as they arrive and only moved to
+``PATH`` once every profile is in, so an interrupted run, whether it was
+killed or stopped by a gateway error, picks up where it left off when run
+again. ``PATH.state`` remembers when the current run and the last finished
+snapshot started.
+
+Given a ``change_log`` of the profiles your application has changed, a file
+of records with a ``profile_id`` and a ``time`` in any format accepted by
+:func:`read_records <authorize.reconcile.read_records>`, later runs are
+incremental: profiles with no change since the last snapshot started are
+copied from it, and only new and changed profiles are fetched again.
+Profiles deleted from Authorize.net drop out of the next snapshot.
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+from six.moves import queue
+
+from authorize.client import AuthorizeClient, NOT_FOUND
+from authorize.exceptions import AuthorizeResponseError
+from authorize.limiter import AdaptiveConcurrency, Limit, RateLimiter
+from authorize.reconcile import parse_time, read_records
+from authorize.scheduler import BATCH, priority
+
+
+# Records written to a Parquet file in each row group
+BATCH_SIZE = 10000
+
+_PAYMENT_FIELDS = ['payment_id', 'number', 'expiration', 'first_name',
+    'last_name', 'company', 'street', 'city', 'state', 'zip_code', 'country',
+    'phone_number']
+_PROFILE_FIELDS = ['profile_id', 'merchant_customer_id', 'description',
+    'email']
+
+
+def read_profiles(path):
+    """Yields the profile records of an export, in any of its formats."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet
+        parquet = pyarrow.parquet.ParquetFile(path)
+        for index in range(parquet.num_row_groups):
+            for record in parquet.read_row_group(index).to_pylist():
+                yield record
+        return
+    if path.endswith('.gz'):
+        f = io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    else:
+        f = io.open(path, encoding='utf-8')
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _write_json(f, record):
+    line = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    f.write(line.encode('utf-8') + b'\n')
+
+
+def _atomic_write(path, data):
+    # Writes the file in full or not at all, even if the process dies
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temporary, path)
+
+
+class ProfileExporter(object):
+    """
+    Exports the profiles saved with ``client`` to ``path``, fetching up to
+    ``concurrency`` profiles at once and at most ``rate`` profiles a second,
+    if given. ``change_log`` is the path of a file of changed profiles,
+    which makes runs after the first incremental.
+
+    Given a ``max_concurrency``, the number of profiles fetched at once
+    starts at ``concurrency`` and adapts, up to ``max_concurrency``, to how
+    quickly Authorize.net answers, using an :class:`AdaptiveConcurrency
+    <authorize.limiter.AdaptiveConcurrency>` kept as ``controller``.
+
+    Profiles are fetched at :data:`BATCH <authorize.scheduler.BATCH>`
+    priority, behind the interactive calls of a client given a
+    :class:`Scheduler <authorize.scheduler.Scheduler>`.
+    """
+    def __init__(self, client, path, concurrency=4, rate=None,
+            change_log=None, max_concurrency=None):
+        if path.endswith('.parquet'):
+            import pyarrow.parquet
+            self._pyarrow = pyarrow
+        elif not path.endswith(('.jsonl', '.jsonl.gz')):
+            raise ValueError('Export to a .jsonl, .jsonl.gz or .parquet '
+                'file, not {0!r}.'.format(path))
+        self.client = client
+        self.path = path
+        self.concurrency = concurrency
+        # A fixed concurrency is an adaptive one with no room to move
+        self.controller = AdaptiveConcurrency(concurrency,
+            minimum=1 if max_concurrency else concurrency,
+            maximum=max_concurrency or concurrency)
+        self.change_log = change_log
+        self.limiter = RateLimiter({'cim': Limit(rate=rate)} if rate else {})
+        self.partial_path = path + '.partial'
+        self.state_path = path + '.state'
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except IOError:
+            return {}
+
+    def _save_state(self, state):
+        _atomic_write(self.state_path,
+            json.dumps(state, sort_keys=True).encode('utf-8'))
+
+    def _resume(self):
+        # Returns the ids already in the staging file, first cutting off
+        # a record left half written when the last run was interrupted
+        done = set()
+        end = 0
+        with open(self.partial_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                done.add(json.loads(line.decode('utf-8'))['profile_id'])
+                end += len(line)
+        with open(self.partial_path, 'r+b') as f:
+            f.truncate(end)
+        return done
+
+    def _changed_since(self, started):
+        changed = set()
+        for record in read_records(self.change_log):
+            if parse_time(record['time']) >= started:
+                changed.add(str(record['profile_id']))
+        return changed
+
+    def run(self):
+        """
+        Runs or resumes the export, returning the number of profiles
+        ``fetched`` from Authorize.net, ``copied`` from the last snapshot
+        and found ``missing`` because they were deleted while the export ran.
+        """
+        state = self._load_state()
+        if 'running' in state and os.path.exists(self.partial_path):
+            done = self._resume()
+        else:
+            state['running'] = time.time()
+            self._save_state(state)
+            open(self.partial_path, 'wb').close()
+            done = set()
+        counts = {'fetched': 0, 'copied': 0, 'missing': 0}
+        ids = [i for i in self.client.saved_profile_ids() if i not in done]
+
+        with open(self.partial_path, 'ab') as partial:
+            previous = state.get('snapshot')
+            if self.change_log and previous is not None and \
+                    os.path.exists(self.path):
+                changed = self._changed_since(previous)
+                wanted = set(ids) - changed
+                for record in read_profiles(self.path):
+                    if record['profile_id'] in wanted:
+                        _write_json(partial, record)
+                        wanted.discard(record['profile_id'])
+                        counts['copied'] += 1
+                partial.flush()
+                ids = [i for i in ids if i in changed or i in wanted]
+            self._fetch(ids, partial, counts)
+
+        self._finish()
+        self._save_state({'snapshot': state['running']})
+        return counts
+
+    def _fetch(self, ids, partial, counts):
+        pending = queue.Queue()
+        for profile_id in ids:
+            pending.put(profile_id)
+        lock = threading.Lock()
+        errors = []
+
+        def work():
+            while not errors:
+                try:
+                    profile_id = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with self.limiter.slot('cim', 'GetCustomerProfile'), \
+                            self.controller.slot(), priority(BATCH):
+                        record = self.client.saved_profile(profile_id)
+                except AuthorizeResponseError as e:
+                    response = getattr(e, 'full_response', None) or {}
+                    if response.get('response_code') != NOT_FOUND:
+                        errors.append(e)
+                        return
+                    with lock:
+                        counts['missing'] += 1
+                    continue
+                except Exception as e:
+                    errors.append(e)
+                    return
+                with lock:
+                    # Each record is flushed whole, so a restart never
+                    # loses one it counted as done
+                    _write_json(partial, record)
+                    partial.flush()
+                    counts['fetched'] += 1
+
+        workers = [threading.Thread(target=work)
+            for _ in range(max(1, min(self.controller.maximum, len(ids))))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if errors:
+            raise errors[0]
+
+    def _finish(self):
+        if self.path.endswith('.jsonl'):
+            os.rename(self.partial_path, self.path)
+            return
+        temporary = self.path + '.tmp'
+        if self.path.endswith('.gz'):
+            with gzip.open(temporary, 'wb') as f, \
+                    open(self.partial_path, 'rb') as partial:
+                for line in partial:
+                    f.write(line)
+        else:
+            self._write_parquet(temporary)
+        os.rename(temporary, self.path)
+        os.remove(self.partial_path)
+
+    def _write_parquet(self, path):
+        pyarrow = self._pyarrow
+        payment = pyarrow.struct([(name, pyarrow.string())
+            for name in _PAYMENT_FIELDS])
+        schema = pyarrow.schema([(name, pyarrow.string())
+            for name in _PROFILE_FIELDS] +
+            [('payments', pyarrow.list_(payment))])
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            batch = []
+            for record in read_profiles(self.partial_path):
+                batch.append(record)
+                if len(batch) == BATCH_SIZE:
+                    writer.write_table(
+                        pyarrow.Table.from_pylist(batch, schema=schema))
+                    batch = []
+            if batch:
+                writer.write_table(
+                    pyarrow.Table.from_pylist(batch, schema=schema))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m authorize.export',
+        description='Export the customer profiles saved on Authorize.net.')
+    parser.add_argument('path',
+        help='the .jsonl, .jsonl.gz or .parquet file to write')
+    parser.add_argument('--login', default=os.environ.get(
+        'AUTHORIZE_LOGIN_ID'))
+    parser.add_argument('--key', default=os.environ.get(
+        'AUTHORIZE_TRANSACTION_KEY'))
+    parser.add_argument('--production', action='store_true',
+        help='export from the production gateway, not the sandbox')
+    parser.add_argument('--backend', choices=['soap', 'json'],
+        default='soap')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--max-concurrency', type=int,
+        help='adapt the concurrency up to this to the gateway\'s latency')
+    parser.add_argument('--rate', type=float,
+        help='profiles fetched per second (default: unlimited)')
+    parser.add_argument('--change-log', metavar='PATH',
+        help='file of changed profiles, for incremental exports')
+    args = parser.parse_args(argv)
+    if not (args.login and args.key):
+        parser.error('pass --login and --key, or set AUTHORIZE_LOGIN_ID '
+            'and AUTHORIZE_TRANSACTION_KEY')
+    client = AuthorizeClient(args.login, args.key,
+        debug=not args.production, backend=args.backend)
+    try:
+        exporter = ProfileExporter(client, args.path, args.concurrency,
+            args.rate, args.change_log, args.max_concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+    counts = exporter.run()
+    print('Fetched {fetched}, copied {copied}, missing {missing} '
+        'profiles.'.format(**counts))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
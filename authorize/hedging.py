@@ -0,0 +1,213 @@
+"""
+Request hedging trims the slow tail off read-only calls such as retrieving a
+saved card. A :class:`Hedger` sends the request and, if no response has come
+back after a delay taken from a percentile of recent latencies, sends an
+identical second request and returns whichever answers first. The slower
+response is discarded.
+
+Hedging is only ever applied to idempotent read operations, and the extra
+load it may add is capped by ``budget``: the number of hedged requests is
+kept to at most that fraction of all requests. Through :func:`call`, the
+second request also takes its own place with the API's rate limiter and
+scheduler, so it counts against their limits like any other request.
+
+Requests are sent from a small pool of worker threads, and a call that can't
+be hedged, because the budget is spent, is made in the calling thread. The
+phases and wire log bodies of whichever request answers first are reported
+as those of the call.
+"""
+from collections import deque
+import sys
+import threading
+from timeit import default_timer
+
+from six import reraise
+from six.moves.queue import Empty, Queue
+
+from authorize import scheduler, timing, tracing, wirelog
+
+
+def call(api, operation, func, *args):
+    """
+    Calls ``func`` with ``args`` for ``operation`` through the hedger of
+    ``api``. A second request first waits for its own slot with the API's
+    scheduler and rate limiter.
+    """
+    def primary():
+        return func(*args)
+
+    def hedge():
+        with api.scheduler.slot(api.login_id), \
+                api.limiter.slot(api.endpoint, operation):
+            return func(*args)
+    return api.hedger.run(primary, hedge)
+
+
+class Hedger(object):
+    """
+    Hedges calls after the ``percentile`` latency of the last ``window``
+    calls, but never sooner than ``min_delay`` seconds. Until ``min_samples``
+    latencies have been seen, ``initial_delay`` is used instead. ``budget``
+    is the largest fraction of extra requests hedging may add. Worker
+    threads left idle for ``idle_timeout`` seconds exit.
+    """
+    def __init__(self, percentile=95, min_delay=0.01, initial_delay=1.0,
+            budget=0.05, window=500, min_samples=20, idle_timeout=60):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+        self.idle_timeout = idle_timeout
+        self._tasks = Queue()
+        self._idle = 0
+        self.calls = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    @property
+    def delay(self):
+        """The number of seconds to wait before hedging a call."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        index = int(len(latencies) * self.percentile / 100.0)
+        return max(self.min_delay, latencies[min(index, len(latencies) - 1)])
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of ``calls``, ``hedges`` sent,
+        ``hedges_won`` and the current hedging ``delay``.
+        """
+        return {
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'hedges_won': self.hedges_won,
+            'delay': self.delay,
+        }
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls ``func`` with the given arguments, hedging it if it is slow,
+        and returns the first result. An error is only raised if every
+        request sent fails.
+        """
+        return self.run(lambda: func(*args, **kwargs))
+
+    def run(self, primary, hedge=None):
+        """
+        Calls ``primary`` and, if it is slow, ``hedge``, which defaults to
+        ``primary``, returning the first result.
+        """
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self._tokens + self.budget, 10.0)
+            can_hedge = self._tokens >= 1
+        if not can_hedge:
+            # No hedge could be sent, so there is nothing to wait beside
+            start = default_timer()
+            result = primary()
+            self._record(default_timer() - start)
+            return result
+        results = Queue()
+        context = (timing.current(), scheduler.current_priority())
+        self._start((results, False, primary, context))
+        pending = 1
+        timeout = self.delay
+        error = failed = None
+        while pending:
+            try:
+                is_hedge, ok, result, call, bodies = results.get(
+                    timeout=timeout)
+            except Empty:
+                # No response within the hedging delay
+                timeout = None
+                if self._can_hedge():
+                    pending += 1
+                    self._start((results, True, hedge or primary, context))
+                continue
+            pending -= 1
+            if ok:
+                _adopt(call, bodies)
+                if is_hedge:
+                    with self._lock:
+                        self.hedges_won += 1
+                return result
+            if error is None:
+                error, failed = result, (call, bodies)
+        _adopt(*failed)
+        reraise(*error)
+
+    def _can_hedge(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def _record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _start(self, task):
+        # Hands the task to an idle worker, or starts a new one
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+                self._tasks.put(task)
+                return
+        thread = threading.Thread(target=self._work, args=(task,),
+            name='authorize-hedger')
+        thread.daemon = True
+        thread.start()
+
+    def _work(self, task):
+        while True:
+            self._run(*task)
+            with self._lock:
+                self._idle += 1
+            try:
+                task = self._tasks.get(timeout=self.idle_timeout)
+            except Empty:
+                with self._lock:
+                    # A task may have been handed over as the wait ran out
+                    try:
+                        task = self._tasks.get_nowait()
+                    except Empty:
+                        self._idle -= 1
+                        return
+
+    def _run(self, results, is_hedge, func, context):
+        # Times the request on its own, so the phases of the request that
+        # answers first can be reported as the call's
+        parent, name = context
+        call = None
+        if parent is not None:
+            call = timing.CallTiming(parent.endpoint, parent.operation)
+        start = default_timer()
+        try:
+            with timing.attached(call), scheduler.priority(name):
+                result = func()
+        except BaseException:
+            # Even SystemExit and the like are handed to the caller, which
+            # would otherwise wait for an answer forever
+            results.put((is_hedge, False, sys.exc_info(), call,
+                wirelog.captured(call)))
+            return
+        self._record(default_timer() - start)
+        results.put((is_hedge, True, result, call, wirelog.captured(call)))
+
+
+def _adopt(call, bodies):
+    # Reports the phases and bodies of a request made in a worker thread as
+    # those of the call in progress
+    if call is None:
+        return
+    tracing.adopt(call.marks)
+    for kind, body in bodies.items():
+        wirelog.capture(kind, body)
@@ -0,0 +1,282 @@
+"""
+Idempotency journals let you safely retry money-moving operations. Pass an
+``idempotency_key`` to any charge, auth, settle, credit or void on the
+:class:`AuthorizeClient <authorize.client.AuthorizeClient>` objects and the
+journal will remember the gateway's response under that key. Repeating the
+operation with the same key returns the stored response instead of calling
+Authorize.net again, and a duplicate issued while the first call is still in
+flight waits for it to finish.
+
+Only successful responses are stored. If the gateway call raises an error,
+the key is released so the operation can be retried. Each response is stored
+with a fingerprint of the request that made it, so reusing a key for a
+different request, such as another amount or card, raises an
+:class:`AuthorizeInvalidError <authorize.exceptions.AuthorizeInvalidError>`
+rather than passing off the first response as the second's.
+
+Three journals are provided: :class:`MemoryJournal` for a single process,
+:class:`SQLiteJournal` for several processes on one machine, and
+:class:`StoreJournal` for a shared cache such as memcached.
+"""
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import time
+
+from six import text_type
+
+from authorize.data import Money
+from authorize.exceptions import AuthorizeError, AuthorizeInvalidError
+
+
+PENDING = '__pending__'
+# The key of a stored response holding the fingerprint of its request
+FINGERPRINT = '__fingerprint__'
+
+
+def _canonical(value):
+    # Amounts compare by value whatever their type, and cards and addresses
+    # by their fields
+    if value is None:
+        return ''
+    if hasattr(value, '__dict__'):
+        return '{' + ','.join('{0}={1}'.format(name, _canonical(field))
+            for name, field in sorted(vars(value).items())) + '}'
+    try:
+        return text_type(Money.parse(value))
+    except AuthorizeInvalidError:
+        return text_type(value)
+
+
+def request_fingerprint(secret, args, kwargs):
+    """
+    Returns a fingerprint of a call's ``args`` and ``kwargs``, an HMAC keyed
+    with ``secret`` so the journal holds nothing a card number could be
+    recovered from.
+    """
+    if isinstance(secret, text_type):
+        secret = secret.encode('utf-8')
+    request = '|'.join([_canonical(arg) for arg in args] +
+        ['{0}={1}'.format(name, _canonical(value))
+            for name, value in sorted(kwargs.items())])
+    return hmac.new(secret, request.encode('utf-8'),
+        hashlib.sha256).hexdigest()
+
+
+class Journal(object):
+    """
+    Base class for idempotency journals. Subclasses implement ``claim``,
+    ``record`` and ``release``.
+
+    ``ttl`` is the number of seconds a stored response is kept for, and
+    ``wait_timeout`` is the number of seconds a duplicate call will wait for
+    an in-flight call with the same key before giving up with an
+    :class:`AuthorizeError <authorize.exceptions.AuthorizeError>`. Journals
+    shared between processes treat a claim older than ``lock_timeout``
+    seconds as left behind by a process that died mid-call.
+    """
+    def __init__(self, ttl=86400, wait_timeout=30, lock_timeout=120):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = lock_timeout
+
+    def execute(self, key, call, fingerprint=None):
+        """
+        Returns the response stored under ``key``, or runs ``call`` and
+        stores its response if there is none. Given the ``fingerprint`` of
+        the request, raises an :class:`AuthorizeInvalidError
+        <authorize.exceptions.AuthorizeInvalidError>` if the stored response
+        was made by a different request.
+        """
+        response = self.claim(key)
+        if response is not None:
+            stored = response.pop(FINGERPRINT, None)
+            if fingerprint and stored and stored != fingerprint:
+                raise AuthorizeInvalidError('The idempotency key {0!r} was '
+                    'already used for a different request.'.format(key))
+            return response
+        try:
+            response = call()
+        except BaseException:
+            self.release(key)
+            raise
+        if fingerprint:
+            stored = dict(response)
+            stored[FINGERPRINT] = fingerprint
+        else:
+            stored = response
+        self.record(key, stored)
+        return response
+
+    def claim(self, key):
+        """
+        Returns the stored response for ``key`` if there is one. Otherwise
+        marks the key as in flight and returns ``None``, waiting first if
+        another call already holds the key.
+        """
+        raise NotImplementedError
+
+    def record(self, key, response):
+        """Stores the response for a claimed key."""
+        raise NotImplementedError
+
+    def release(self, key):
+        """Releases a claimed key without storing a response."""
+        raise NotImplementedError
+
+    def _timed_out(self, key):
+        return AuthorizeError('Timed out waiting for the in-flight request '
+            'with idempotency key {0!r}.'.format(key))
+
+
+class MemoryJournal(Journal):
+    """
+    Keeps responses in memory. Duplicates are only detected within the
+    current process. Expired responses are swept out every
+    ``sweep_interval`` seconds, when a response is recorded.
+    """
+    sweep_interval = 60
+
+    def __init__(self, ttl=86400, wait_timeout=30):
+        super(MemoryJournal, self).__init__(ttl, wait_timeout, None)
+        self._responses = {}
+        self._next_sweep = time.time() + self.sweep_interval
+        self._pending = set()
+        self._condition = threading.Condition()
+
+    def claim(self, key):
+        deadline = time.time() + self.wait_timeout
+        with self._condition:
+            while True:
+                entry = self._responses.get(key)
+                if entry is not None:
+                    expires, response = entry
+                    if expires > time.time():
+                        return dict(response)
+                    del self._responses[key]
+                if key not in self._pending:
+                    self._pending.add(key)
+                    return None
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise self._timed_out(key)
+                self._condition.wait(remaining)
+
+    def record(self, key, response):
+        now = time.time()
+        with self._condition:
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.sweep_interval
+                for expired in [k for k, (expires, _) in
+                        self._responses.items() if expires <= now]:
+                    del self._responses[expired]
+            self._responses[key] = (now + self.ttl, dict(response))
+            self._pending.discard(key)
+            self._condition.notify_all()
+
+    def release(self, key):
+        with self._condition:
+            self._pending.discard(key)
+            self._condition.notify_all()
+
+
+class SQLiteJournal(Journal):
+    """
+    Keeps responses in an SQLite database at ``path``, so processes on the
+    same machine share a journal.
+    """
+    poll_interval = 0.05
+
+    def __init__(self, path, ttl=86400, wait_timeout=30, lock_timeout=120):
+        super(SQLiteJournal, self).__init__(ttl, wait_timeout, lock_timeout)
+        self.path = path
+        self._local = threading.local()
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS authorize_journal ('
+            'key TEXT PRIMARY KEY, response TEXT, expires REAL)')
+
+    @property
+    def _connection(self):
+        # SQLite connections can't be shared between threads
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = sqlite3.connect(
+                self.path, timeout=self.wait_timeout, isolation_level=None)
+        return self._local.connection
+
+    def claim(self, key):
+        deadline = time.time() + self.wait_timeout
+        connection = self._connection
+        while True:
+            now = time.time()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(
+                    'SELECT response, expires FROM authorize_journal '
+                    'WHERE key = ?', (key,)).fetchone()
+                if row is None or row[1] <= now:
+                    connection.execute(
+                        'INSERT OR REPLACE INTO authorize_journal '
+                        'VALUES (?, ?, ?)',
+                        (key, PENDING, now + self.lock_timeout))
+                    return None
+                if row[0] != PENDING:
+                    return json.loads(row[0])
+            finally:
+                connection.execute('COMMIT')
+            if now >= deadline:
+                raise self._timed_out(key)
+            time.sleep(self.poll_interval)
+
+    def record(self, key, response):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO authorize_journal VALUES (?, ?, ?)',
+            (key, json.dumps(response), time.time() + self.ttl))
+
+    def release(self, key):
+        self._connection.execute(
+            'DELETE FROM authorize_journal WHERE key = ? AND response = ?',
+            (key, PENDING))
+
+    def purge(self):
+        """Removes expired responses from the database."""
+        self._connection.execute(
+            'DELETE FROM authorize_journal WHERE expires <= ?', (time.time(),))
+
+
+class StoreJournal(Journal):
+    """
+    Keeps responses in a shared key-value store, so every process and machine
+    using the same store shares a journal. The ``store`` must provide the
+    memcached-style methods ``get(key)``, ``add(key, value, timeout)`` (which
+    only stores the value if the key is absent and returns whether it did),
+    ``set(key, value, timeout)`` and ``delete(key)``. Django's cache framework
+    and most memcached clients work as-is.
+    """
+    poll_interval = 0.05
+
+    def __init__(self, store, ttl=86400, wait_timeout=30, lock_timeout=120,
+            prefix='authorize:journal:'):
+        super(StoreJournal, self).__init__(ttl, wait_timeout, lock_timeout)
+        self.store = store
+        self.prefix = prefix
+
+    def claim(self, key):
+        key = self.prefix + key
+        deadline = time.time() + self.wait_timeout
+        while True:
+            if self.store.add(key, PENDING, self.lock_timeout):
+                return None
+            value = self.store.get(key)
+            if value is not None and value != PENDING:
+                return json.loads(value)
+            if time.time() >= deadline:
+                raise self._timed_out(key)
+            time.sleep(self.poll_interval)
+
+    def record(self, key, response):
+        self.store.set(self.prefix + key, json.dumps(response), self.ttl)
+
+    def release(self, key):
+        self.store.delete(self.prefix + key)
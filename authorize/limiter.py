@@ -0,0 +1,343 @@
+"""
+Rate limiting keeps bulk jobs from bursting past Authorize.net's throttling.
+A :class:`RateLimiter` holds a set of :class:`Limit` objects, each combining
+a requests-per-second token bucket with a cap on the number of requests in
+flight. Limits are keyed either by API (``'aim'``, ``'cim'`` or ``'arb'``)
+or by API and operation, such as ``'aim.AUTH_CAPTURE'`` or
+``'cim.GetCustomerProfile'``. A call must pass every limit that matches it.
+
+Calls over a limit wait their turn rather than failing, so a bulk job simply
+slows down to the configured pace::
+
+    >>> from authorize.limiter import FileBackend, Limit, RateLimiter
+    >>> limiter = RateLimiter({
+    ...     'aim': Limit(rate=20, max_in_flight=10),
+    ...     'cim.GetCustomerProfile': Limit(rate=5),
+    ... }, backend=FileBackend('/dev/shm/authorize-limits'))
+    >>> client = AuthorizeClient('285tUPuS', '58JKJ4T95uee75wd',
+    ...     limiter=limiter)
+
+The default :class:`MemoryBackend` shares limits between the threads of one
+process. :class:`FileBackend` keeps the limiter state in small lock-protected
+files, so every process pointed at the same directory shares the limits.
+
+Rather than guessing how many requests a bulk job should keep in flight, an
+:class:`AdaptiveConcurrency` finds out: it lets more requests in while
+latency holds steady and backs off as soon as latency grows or the gateway
+starts refusing connections. The :class:`ProfileExporter
+<authorize.export.ProfileExporter>` uses one when given a
+``max_concurrency``.
+"""
+from collections import deque
+import errno
+import json
+import os
+import threading
+import time
+from timeit import default_timer
+
+from authorize.exceptions import AuthorizeConnectionError
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows)
+    fcntl = None
+
+
+class Limit(object):
+    """
+    A limit of ``rate`` requests per second, allowing bursts of up to
+    ``burst`` requests (defaulting to ``rate``), and of at most
+    ``max_in_flight`` concurrent requests. Either part may be ``None`` to
+    leave it unlimited.
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.max_in_flight = max_in_flight
+
+    def __repr__(self):
+        return '<Limit rate={0.rate} burst={0.burst} ' \
+            'max_in_flight={0.max_in_flight}>'.format(self)
+
+
+class RateLimiter(object):
+    """
+    Applies ``limits``, a dictionary mapping limit keys to :class:`Limit`
+    instances, using the given ``backend`` to keep track of them.
+    """
+    def __init__(self, limits=None, backend=None):
+        self.limits = dict(limits or {})
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    def slot(self, endpoint, operation=None):
+        """
+        Returns a context manager that waits until a call to ``operation`` on
+        the ``endpoint`` API is allowed, and holds its in-flight slot until
+        the block exits.
+        """
+        keys = [endpoint]
+        if operation:
+            keys.append('{0}.{1}'.format(endpoint, operation))
+        limits = [(key, self.limits[key]) for key in keys
+            if key in self.limits]
+        if not limits:
+            return _NULL_SLOT
+        return _Slot(self.backend, limits)
+
+
+class _Slot(object):
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = limits
+        self.entered = []
+
+    def __enter__(self):
+        try:
+            for key, limit in self.limits:
+                if limit.rate:
+                    delay = self.backend.reserve(key, limit)
+                    if delay > 0:
+                        time.sleep(delay)
+                if limit.max_in_flight:
+                    self.backend.enter(key, limit)
+                    self.entered.append(key)
+        except BaseException:
+            self._leave()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._leave()
+        return False
+
+    def _leave(self):
+        while self.entered:
+            self.backend.leave(self.entered.pop())
+
+
+class _NullSlot(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SLOT = _NullSlot()
+
+
+def _reserve(state, limit, now):
+    # Refills the bucket and reserves the next token, which may lie in the
+    # future; callers sleep until then so waiting calls are spaced smoothly.
+    tokens = state.get('tokens', limit.burst)
+    stamp = state.get('stamp', now)
+    tokens = min(limit.burst, tokens + (now - stamp) * limit.rate) - 1
+    state['tokens'] = tokens
+    state['stamp'] = now
+    return -tokens / float(limit.rate) if tokens < 0 else 0
+
+
+class MemoryBackend(object):
+    """Keeps limiter state in memory, shared by the threads of a process."""
+    def __init__(self):
+        self._states = {}
+        self._in_flight = {}
+        self._condition = threading.Condition()
+
+    def reserve(self, key, limit):
+        with self._condition:
+            state = self._states.setdefault(key, {})
+            return _reserve(state, limit, time.time())
+
+    def enter(self, key, limit):
+        with self._condition:
+            while self._in_flight.get(key, 0) >= limit.max_in_flight:
+                self._condition.wait()
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def leave(self, key):
+        with self._condition:
+            self._in_flight[key] -= 1
+            self._condition.notify_all()
+
+
+class FileBackend(object):
+    """
+    Keeps limiter state in one small file per limit in ``directory``, guarded
+    by an exclusive file lock so every process using the directory shares
+    the limits. Point it at a memory-backed filesystem such as ``/dev/shm``
+    to keep it fast. In-flight slots held by processes that have exited are
+    reclaimed automatically. Requires a POSIX system.
+    """
+    poll_interval = 0.01
+
+    def __init__(self, directory):
+        if fcntl is None:
+            raise NotImplementedError('FileBackend requires a POSIX system.')
+        self.directory = directory
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def reserve(self, key, limit):
+        with _LockedState(self._path(key)) as state:
+            return _reserve(state, limit, time.time())
+
+    def enter(self, key, limit):
+        pid = str(os.getpid())
+        while True:
+            with _LockedState(self._path(key)) as state:
+                in_flight = state.setdefault('in_flight', {})
+                for other in list(in_flight):
+                    if other != pid and not _is_running(int(other)):
+                        del in_flight[other]
+                if sum(in_flight.values()) < limit.max_in_flight:
+                    in_flight[pid] = in_flight.get(pid, 0) + 1
+                    return
+            time.sleep(self.poll_interval)
+
+    def leave(self, key):
+        pid = str(os.getpid())
+        with _LockedState(self._path(key)) as state:
+            in_flight = state.setdefault('in_flight', {})
+            in_flight[pid] = in_flight.get(pid, 1) - 1
+            if in_flight[pid] <= 0:
+                del in_flight[pid]
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{0}.limit'.format(key))
+
+
+class _LockedState(object):
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.file.seek(0)
+        content = self.file.read()
+        self.state = json.loads(content) if content else {}
+        return self.state
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.file.seek(0)
+                self.file.truncate()
+                self.file.write(json.dumps(self.state))
+                self.file.flush()
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        return False
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class AdaptiveConcurrency(object):
+    """
+    A cap on the number of requests in flight that adjusts itself, starting
+    at ``initial`` and staying between ``minimum`` and ``maximum``.
+
+    The baseline latency is the lowest of the last ``window`` calls. Each
+    call finishing within ``tolerance`` times the baseline raises the limit
+    by one over the limit, so by one for every limit's worth of calls. A
+    slower call, or one failing with an :class:`AuthorizeConnectionError
+    <authorize.exceptions.AuthorizeConnectionError>` (which includes
+    throttling, HTTP errors and an open circuit breaker), multiplies the
+    limit by ``backoff``. Only calls started since the last cut can cut the
+    limit again, so a burst of failures backs off once rather than once per
+    failure.
+    """
+    def __init__(self, initial=4, minimum=1, maximum=32, tolerance=2.0,
+            backoff=0.7, window=100):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.increases = 0
+        self.decreases = 0
+        self._limit = float(max(minimum, min(maximum, initial)))
+        self._in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<AdaptiveConcurrency limit={0}>'.format(self.limit)
+
+    @property
+    def limit(self):
+        """The number of requests currently allowed in flight."""
+        return int(self._limit)
+
+    def stats(self):
+        """
+        Returns a dictionary with the current ``limit``, the requests
+        ``in_flight``, the number of ``increases`` and ``decreases`` of the
+        limit and the ``baseline`` latency in seconds, or ``None``.
+        """
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'baseline': min(self._latencies) if self._latencies
+                    else None,
+            }
+
+    def slot(self):
+        """
+        Returns a context manager that waits until a request may start, and
+        times it until the block exits.
+        """
+        return _AdaptiveSlot(self)
+
+    def _enter(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return self.decreases
+
+    def _leave(self, generation, latency, failed):
+        with self._condition:
+            self._in_flight -= 1
+            if not failed:
+                self._latencies.append(latency)
+                slow = latency > min(self._latencies) * self.tolerance
+            if failed or slow:
+                if generation == self.decreases:
+                    self._limit = max(self.minimum,
+                        self._limit * self.backoff)
+                    self.decreases += 1
+            else:
+                before = self.limit
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                if self.limit > before:
+                    self.increases += 1
+            self._condition.notify_all()
+
+
+class _AdaptiveSlot(object):
+    def __init__(self, controller):
+        self.controller = controller
+
+    def __enter__(self):
+        self.generation = self.controller._enter()
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.controller._leave(self.generation, default_timer() - self.start,
+            isinstance(exc_value, AuthorizeConnectionError))
+        return False
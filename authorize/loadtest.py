@@ -0,0 +1,380 @@
+"""
+Load tests measure how many operations per second a single
+:class:`AuthorizeClient <authorize.client.AuthorizeClient>` sustains, and how
+its latency degrades as concurrency grows. Run them from the command line::
+
+    $ python -m authorize.loadtest --mix auth=4,capture=4,saved_capture=2 \\
+        --concurrency 8 --duration 30
+
+The operations are ``auth`` and ``capture`` on a card, ``save`` to save a
+card, ``saved_capture`` on a saved card and ``recurring`` to create a
+subscription, mixed by the given weights.
+
+By default, operations run back to back on ``--concurrency`` threads. Pass
+``--rate`` to start operations at a fixed rate instead; latencies are then
+measured from when each operation was due to start, so time spent queued
+behind a saturated client counts against it.
+
+The ``--endpoint`` is one of:
+
+``stub``
+    The in-process :mod:`stub gateway <authorize.stub>`, the default, with
+    duplicate detection turned off since every operation uses the same card.
+    Pass ``--stub-latency`` to simulate network round trips.
+``sandbox``
+    The Authorize.net sandbox, using ``--login`` and ``--key``.
+``production``
+    The live gateway, which charges real cards. It also requires
+    ``--allow-production``.
+``replay:PATH``
+    Responses replayed from a recording made with
+    :mod:`authorize.replay`, at ``--replay-speed``.
+``http://HOST:PORT``
+    Any other base URL, such as an :mod:`emulator <authorize.emulator>`.
+
+The report gives the throughput, the p50, p95, p99 and maximum latency
+overall and per operation, and a breakdown of the errors, as text or, with
+``--json``, as JSON.
+"""
+import argparse
+from datetime import date, timedelta
+import json
+import os
+import random
+import sys
+import threading
+import time
+from timeit import default_timer
+
+from six.moves.queue import Queue
+
+from authorize.client import AuthorizeClient
+from authorize.data import CreditCard, Money
+from authorize.replay import ReplayTransport
+from authorize.stub import Gateway, StubTransport
+
+
+DEFAULT_MIX = 'auth=4,capture=4,save=1,saved_capture=2,recurring=1'
+
+
+def _credit_card():
+    return CreditCard('4111111111111111', date.today().year + 3, 12, '123',
+        'Load', 'Test')
+
+
+def _amount():
+    # Random amounts keep the sandbox's duplicate detection out of the way
+    return Money(random.randint(100, 99999))
+
+
+def _recurring(client, saved_card):
+    start = date.today() + timedelta(days=1)
+    return client.card(_credit_card()).recurring(_amount(), start, months=1)
+
+
+OPERATIONS = {
+    'auth': lambda client, saved_card:
+        client.card(_credit_card()).auth(_amount()),
+    'capture': lambda client, saved_card:
+        client.card(_credit_card()).capture(_amount()),
+    'save': lambda client, saved_card: client.card(_credit_card()).save(),
+    'saved_capture': lambda client, saved_card:
+        client.saved_card(saved_card).capture(_amount()),
+    'recurring': _recurring,
+}
+
+
+def parse_mix(text):
+    """
+    Parses a mix such as ``'auth=3,capture=1'`` into a list of
+    ``(operation, weight)`` pairs. A missing weight counts as 1.
+    """
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation {0!r}; choose from {1}.'
+                .format(name, ', '.join(sorted(OPERATIONS))))
+        weight = float(weight) if weight else 1.0
+        if weight < 0:
+            raise ValueError('Weights may not be negative.')
+        mix.append((name, weight))
+    if not sum(weight for name, weight in mix):
+        raise ValueError('The mix needs at least one positive weight.')
+    return mix
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank ``percent`` percentile of sorted values."""
+    if not values:
+        return None
+    index = max(int(round(len(values) * percent / 100.0)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def _error_name(error):
+    response = getattr(error, 'full_response', None) or {}
+    text = response.get('response_reason_text') or \
+        response.get('response_text') or str(error)
+    return '{0}: {1}'.format(type(error).__name__, text[:80])
+
+
+class LoadTest(object):
+    """
+    Drives ``client`` with operations chosen from ``mix``, a list of
+    ``(operation, weight)`` pairs, on ``concurrency`` threads. With a
+    ``rate``, operations start at that many per second; otherwise each
+    thread runs them back to back. The test ends after ``duration`` seconds
+    or once ``requests`` operations have started, whichever comes first.
+    """
+    def __init__(self, client, mix, concurrency=4, rate=None, duration=10,
+            requests=None):
+        self.client = client
+        self.mix = mix
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+        self._names = [name for name, weight in mix]
+        self._weights = [weight for name, weight in mix]
+        self._lock = threading.Lock()
+        self._started = 0
+        self.saved_card = None
+
+    def setup(self):
+        """
+        Loads the SOAP clients, if used, and saves the card used by
+        ``saved_capture``, so neither is measured.
+        """
+        if self.client.backend == 'soap':
+            self.client._customer.client
+            self.client._recurring.client
+        if 'saved_capture' in self._names:
+            self.saved_card = self.client.card(_credit_card()).save().uid
+
+    def run(self):
+        """Runs the load test and returns its :class:`Report`."""
+        self.setup()
+        self.results = []
+        self._started = 0
+        self._start = default_timer()
+        self._deadline = self._start + self.duration
+        if self.rate:
+            queue = Queue()
+            workers = [self._thread(self._worker, queue)
+                for i in range(self.concurrency)]
+            self._dispatch(queue)
+        else:
+            workers = [self._thread(self._loop)
+                for i in range(self.concurrency)]
+        for worker in workers:
+            worker.join()
+        elapsed = default_timer() - self._start
+        return Report(self.results, elapsed, self.concurrency, self.rate)
+
+    def _thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _claim(self):
+        # Counts a new operation, or returns False when the test is over
+        with self._lock:
+            if self.requests is not None and self._started >= self.requests:
+                return False
+            self._started += 1
+            return True
+
+    def _loop(self):
+        while default_timer() < self._deadline and self._claim():
+            self._call(default_timer())
+
+    def _dispatch(self, queue):
+        interval = 1.0 / self.rate
+        due = self._start
+        while due < self._deadline and self._claim():
+            delay = due - default_timer()
+            if delay > 0:
+                time.sleep(delay)
+            queue.put(due)
+            due += interval
+        for i in range(self.concurrency):
+            queue.put(None)
+
+    def _worker(self, queue):
+        while True:
+            due = queue.get()
+            if due is None:
+                return
+            self._call(due)
+
+    def _call(self, start):
+        name = self._choose()
+        error = None
+        try:
+            OPERATIONS[name](self.client, self.saved_card)
+        except Exception as e:
+            error = _error_name(e)
+        latency = default_timer() - start
+        with self._lock:
+            self.results.append((name, latency, error))
+
+    def _choose(self):
+        point = random.uniform(0, sum(self._weights))
+        for name, weight in zip(self._names, self._weights):
+            point -= weight
+            if point <= 0:
+                return name
+        return self._names[-1]
+
+
+class Report(object):
+    """
+    The results of a load test: a list of ``(operation, latency, error)``
+    tuples and the ``elapsed`` seconds the test ran for.
+    """
+    def __init__(self, results, elapsed, concurrency=None, rate=None):
+        self.results = results
+        self.elapsed = elapsed
+        self.concurrency = concurrency
+        self.rate = rate
+
+    def _summary(self, results):
+        latencies = sorted(latency * 1000 for name, latency, e in results)
+        errors = sum(1 for name, latency, error in results if error)
+        return {
+            'requests': len(results),
+            'errors': errors,
+            'throughput': len(results) / self.elapsed if self.elapsed else 0,
+            'latency_ms': dict(
+                [('p{0}'.format(p), percentile(latencies, p))
+                    for p in (50, 95, 99)] +
+                [('max', latencies[-1] if latencies else None)]),
+        }
+
+    def to_dict(self):
+        """Returns the report as a dictionary, ready to dump as JSON."""
+        report = self._summary(self.results)
+        report['elapsed'] = self.elapsed
+        report['concurrency'] = self.concurrency
+        report['rate'] = self.rate
+        names = sorted(set(name for name, latency, e in self.results))
+        report['operations'] = dict((name, self._summary(
+            [r for r in self.results if r[0] == name])) for name in names)
+        breakdown = {}
+        for name, latency, error in self.results:
+            if error:
+                breakdown[error] = breakdown.get(error, 0) + 1
+        report['error_breakdown'] = breakdown
+        return report
+
+    def format(self):
+        """Returns the report as text."""
+        report = self.to_dict()
+        lines = [
+            '{0} requests in {1:.2f}s ({2:.1f}/s), {3} errors'.format(
+                report['requests'], report['elapsed'], report['throughput'],
+                report['errors']),
+            '',
+            '{0:<15}{1:>9}{2:>8}{3:>9}{4:>10}{5:>10}{6:>10}{7:>10}'.format(
+                'operation', 'requests', 'errors', 'req/s', 'p50 ms',
+                'p95 ms', 'p99 ms', 'max ms'),
+        ]
+        rows = sorted(report['operations'].items()) + [('total', report)]
+        for name, summary in rows:
+            latency = summary['latency_ms']
+            lines.append(
+                '{0:<15}{1:>9}{2:>8}{3:>9.1f}{4:>10}{5:>10}{6:>10}{7:>10}'
+                .format(name, summary['requests'], summary['errors'],
+                    summary['throughput'], *[_ms(latency[key])
+                        for key in ('p50', 'p95', 'p99', 'max')]))
+        if report['error_breakdown']:
+            lines.extend(['', 'errors:'])
+            for error, count in sorted(report['error_breakdown'].items(),
+                    key=lambda item: -item[1]):
+                lines.append('{0:>9}  {1}'.format(count, error))
+        return '\n'.join(lines)
+
+
+def _ms(value):
+    return '-' if value is None else '{0:.1f}'.format(value)
+
+
+def make_client(endpoint, login_id, transaction_key, stub_latency=0,
+        replay_speed=None, backend='soap'):
+    """
+    Returns an :class:`AuthorizeClient` for a load test ``endpoint``, using
+    the given ``backend`` for saved cards and recurring payments.
+    """
+    if endpoint == 'stub':
+        return AuthorizeClient(login_id, transaction_key,
+            transport=StubTransport(Gateway(duplicate_window=0),
+                latency=stub_latency), backend=backend)
+    if endpoint == 'sandbox':
+        return AuthorizeClient(login_id, transaction_key, backend=backend)
+    if endpoint == 'production':
+        return AuthorizeClient(login_id, transaction_key, debug=False,
+            backend=backend)
+    if endpoint.startswith('replay:'):
+        transport = ReplayTransport(endpoint[len('replay:'):],
+            speed=replay_speed)
+        return AuthorizeClient(login_id, transaction_key, transport=transport,
+            backend=backend)
+    if endpoint.startswith(('http://', 'https://')):
+        return AuthorizeClient(login_id, transaction_key, base_url=endpoint,
+            backend=backend)
+    raise ValueError('Unknown endpoint {0!r}.'.format(endpoint))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m authorize.loadtest',
+        description='Load test an AuthorizeClient.')
+    parser.add_argument('--endpoint', default='stub',
+        help='stub, sandbox, production, replay:PATH or a base URL '
+            '(default: stub)')
+    parser.add_argument('--login',
+        default=os.environ.get('AUTHORIZE_LOGIN_ID', 'login'))
+    parser.add_argument('--key',
+        default=os.environ.get('AUTHORIZE_TRANSACTION_KEY', 'key'))
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+        help='weighted operations (default: {0})'.format(DEFAULT_MIX))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float,
+        help='operations started per second (default: back to back)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--requests', type=int,
+        help='stop after this many operations')
+    parser.add_argument('--stub-latency', type=float, default=0)
+    parser.add_argument('--replay-speed', type=float)
+    parser.add_argument('--backend', choices=['soap', 'json'],
+        default='soap', help='API for saved cards and recurring payments '
+            '(default: soap)')
+    parser.add_argument('--allow-production', action='store_true')
+    parser.add_argument('--json', metavar='PATH',
+        help="write the report as JSON to PATH, or '-' for stdout")
+    args = parser.parse_args(argv)
+    if args.endpoint == 'production' and not args.allow_production:
+        parser.error('the production endpoint charges real cards; pass '
+            '--allow-production to use it')
+    try:
+        mix = parse_mix(args.mix)
+        client = make_client(args.endpoint, args.login, args.key,
+            args.stub_latency, args.replay_speed, args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    report = LoadTest(client, mix, args.concurrency, args.rate,
+        args.duration, args.requests).run()
+    if args.json == '-':
+        json.dump(report.to_dict(), sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return 0
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report.to_dict(), f, indent=2, sort_keys=True)
+    print(report.format())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
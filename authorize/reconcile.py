@@ -0,0 +1,400 @@
+"""
+Reconciliation matches the transactions Authorize.net settled against the
+records in your own ledger. Feed it the settled transactions, for example
+from :meth:`AuthorizeClient.settled_transactions
+<authorize.client.AuthorizeClient.settled_transactions>` or a file read with
+:func:`read_records`, and your ledger records::
+
+    >>> transactions = client.settled_transactions(date(2017, 5, 1),
+    ...     date(2017, 5, 31))
+    >>> for result in reconcile(transactions, read_records('ledger.csv')):
+    ...     if result.status != MATCHED:
+    ...         print(result)
+
+Both sides are dictionaries using the same keys as a transaction's
+``full_response``: ``transaction_id`` and ``amount``, plus an optional
+``invoice_number`` and a time, ``submitted`` for gateway transactions and
+``time`` for ledger records, as a datetime or an ISO 8601 string. A gateway
+transaction is matched to a ledger record by transaction id, then by invoice
+number, and failing those by an equal amount within ``tolerance`` seconds.
+
+The ledger is loaded into hash indexes, and the gateway transactions are then
+streamed through them, so results come out as each transaction is read: a
+:data:`MATCHED` or :data:`AMOUNT_MISMATCH` result for each match and
+:data:`EXTRA` for transactions missing from the ledger. Once the gateway
+transactions run out, each ledger record left is reported as
+:data:`MISSING`. Only the ledger is held in memory, and past
+``spill_threshold`` records it is moved to an SQLite database on disk.
+"""
+import calendar
+import csv
+from datetime import datetime
+from decimal import Decimal
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import tempfile
+
+from authorize.data import to_cents
+from authorize.exceptions import AuthorizeInvalidError
+
+
+MATCHED = 'matched'
+AMOUNT_MISMATCH = 'amount_mismatch'
+MISSING = 'missing'
+EXTRA = 'extra'
+
+_ISO_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)'
+    r'(\.\d+)?(Z|[+-]\d\d:?\d\d)?$')
+
+
+def parse_time(value):
+    """
+    Returns a datetime or ISO 8601 string as seconds since the epoch,
+    treating times without a timezone as UTC, or ``None``.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        offset = value.utcoffset()
+        seconds = calendar.timegm(value.timetuple()) + \
+            value.microsecond / 1e6
+        return seconds - (offset.total_seconds() if offset else 0)
+    match = _ISO_RE.match(value.strip())
+    if match is None:
+        raise ValueError('Unrecognised time {0!r}.'.format(value))
+    parts = match.groups()
+    seconds = calendar.timegm(tuple(int(p) for p in parts[:6]) +
+        (0, 0, 0))
+    if parts[6]:
+        seconds += float(parts[6])
+    zone = parts[7]
+    if zone and zone != 'Z':
+        zone = zone.replace(':', '')
+        sign = -1 if zone[0] == '-' else 1
+        seconds -= sign * (int(zone[1:3]) * 3600 + int(zone[3:5]) * 60)
+    return seconds
+
+
+def _cents(value):
+    try:
+        return to_cents(value)
+    except AuthorizeInvalidError:
+        return None
+
+
+class Reconciled(object):
+    """
+    A reconciliation result. ``status`` is one of :data:`MATCHED`,
+    :data:`AMOUNT_MISMATCH`, :data:`MISSING` or :data:`EXTRA`;
+    ``transaction`` and ``record`` are the gateway transaction and ledger
+    record involved, either of which may be ``None``; and ``matched_on``
+    names the key they were matched by.
+    """
+    def __init__(self, status, transaction=None, record=None,
+            matched_on=None):
+        self.status = status
+        self.transaction = transaction
+        self.record = record
+        self.matched_on = matched_on
+
+    def __repr__(self):
+        side = self.transaction or self.record
+        return '<Reconciled {0} {1}>'.format(self.status,
+            side.get('transaction_id') or side.get('invoice_number'))
+
+    @property
+    def difference(self):
+        """
+        The gateway amount less the ledger amount, as a Decimal, or ``None``
+        unless both sides are present.
+        """
+        if self.transaction is None or self.record is None:
+            return None
+        cents = (_cents(self.transaction.get('amount')) or 0) - \
+            (_cents(self.record.get('amount')) or 0)
+        return Decimal(cents).scaleb(-2)
+
+    def to_dict(self):
+        """Returns the result as a dictionary, ready to dump as JSON."""
+        difference = self.difference
+        return {
+            'status': self.status,
+            'matched_on': self.matched_on,
+            'transaction': self.transaction,
+            'record': self.record,
+            'difference': None if difference is None else str(difference),
+        }
+
+
+class _Entry(object):
+    __slots__ = ('record', 'transaction_id', 'invoice', 'cents', 'time',
+        'removed')
+
+    def __init__(self, record):
+        self.record = record
+        self.transaction_id = record.get('transaction_id') or None
+        self.invoice = record.get('invoice_number') or None
+        self.cents = _cents(record.get('amount'))
+        self.time = parse_time(record.get('time'))
+        self.removed = False
+
+
+def _bucket_width(tolerance):
+    # Amounts are bucketed by time in buckets at least as wide as the
+    # tolerance, so a match is always in the same or a neighbouring bucket;
+    # a tolerance of 0 only matches equal times, but still needs a width
+    return tolerance or 1
+
+
+class _MemoryIndex(object):
+    """Hash indexes of ledger records held in memory."""
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self._width = _bucket_width(tolerance)
+        self._entries = []
+        self._by_id = {}
+        self._by_invoice = {}
+        self._by_amount = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, entry):
+        self._entries.append(entry)
+        self._count += 1
+        if entry.transaction_id:
+            self._by_id.setdefault(entry.transaction_id, []).append(entry)
+        if entry.invoice:
+            self._by_invoice.setdefault(entry.invoice, []).append(entry)
+        if entry.cents is not None and entry.time is not None:
+            key = (entry.cents, int(entry.time // self._width))
+            self._by_amount.setdefault(key, []).append(entry)
+
+    def _first(self, index, key):
+        entries = index.get(key)
+        while entries:
+            if not entries[0].removed:
+                return entries[0]
+            # Drop entries already matched through another index
+            entries.pop(0)
+        return None
+
+    def match(self, transaction_id, invoice, cents, time):
+        """
+        Removes and returns the best ledger record for a transaction, and
+        the key it was matched on, or ``(None, None)``.
+        """
+        entry, key = None, None
+        if transaction_id:
+            entry, key = self._first(self._by_id, transaction_id), \
+                'transaction_id'
+        if entry is None and invoice:
+            entry, key = self._first(self._by_invoice, invoice), \
+                'invoice_number'
+        if entry is None and cents is not None and time is not None:
+            entry, key = self._nearest(cents, time), 'amount'
+        if entry is None:
+            return None, None
+        entry.removed = True
+        self._count -= 1
+        return entry.record, key
+
+    def _nearest(self, cents, time):
+        bucket = int(time // self._width)
+        best = None
+        for key in ((cents, bucket - 1), (cents, bucket),
+                (cents, bucket + 1)):
+            for entry in self._by_amount.get(key, ()):
+                distance = abs(entry.time - time)
+                if not entry.removed and distance <= self.tolerance and \
+                        (best is None or distance < abs(best.time - time)):
+                    best = entry
+        return best
+
+    def entries(self):
+        """Returns the records not yet matched, in the order added."""
+        return [entry for entry in self._entries if not entry.removed]
+
+    def remaining(self):
+        for entry in self.entries():
+            yield entry.record
+
+    def close(self):
+        pass
+
+
+class _SQLiteIndex(object):
+    """
+    Indexes of ledger records kept in an SQLite database in ``directory``,
+    which defaults to the system's temporary directory.
+    """
+    def __init__(self, tolerance, directory=None):
+        self.tolerance = tolerance
+        self._width = _bucket_width(tolerance)
+        self._directory = tempfile.mkdtemp(prefix='authorize-reconcile-',
+            dir=directory)
+        self._connection = sqlite3.connect(
+            os.path.join(self._directory, 'ledger.db'))
+        self._connection.executescript(
+            'PRAGMA journal_mode = OFF;'
+            'PRAGMA synchronous = OFF;'
+            'CREATE TABLE ledger (id INTEGER PRIMARY KEY, transaction_id '
+            'TEXT, invoice TEXT, cents INTEGER, bucket INTEGER, time REAL, '
+            'record BLOB);'
+            'CREATE INDEX ledger_id ON ledger (transaction_id);'
+            'CREATE INDEX ledger_invoice ON ledger (invoice);'
+            'CREATE INDEX ledger_amount ON ledger (cents, bucket);')
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, entry):
+        bucket = None
+        if entry.time is not None:
+            bucket = int(entry.time // self._width)
+        self._connection.execute(
+            'INSERT INTO ledger (transaction_id, invoice, cents, bucket, '
+            'time, record) VALUES (?, ?, ?, ?, ?, ?)',
+            (entry.transaction_id, entry.invoice, entry.cents, bucket,
+                entry.time, sqlite3.Binary(pickle.dumps(entry.record, 2))))
+        self._count += 1
+
+    def match(self, transaction_id, invoice, cents, time):
+        row, key = None, None
+        if transaction_id:
+            row, key = self._connection.execute(
+                'SELECT id, record FROM ledger WHERE transaction_id = ? '
+                'ORDER BY id LIMIT 1', (transaction_id,)).fetchone(), \
+                'transaction_id'
+        if row is None and invoice:
+            row, key = self._connection.execute(
+                'SELECT id, record FROM ledger WHERE invoice = ? '
+                'ORDER BY id LIMIT 1', (invoice,)).fetchone(), \
+                'invoice_number'
+        if row is None and cents is not None and time is not None:
+            bucket = int(time // self._width)
+            row, key = self._connection.execute(
+                'SELECT id, record FROM ledger WHERE cents = ? AND bucket '
+                'BETWEEN ? AND ? AND abs(time - ?) <= ? '
+                'ORDER BY abs(time - ?), id LIMIT 1',
+                (cents, bucket - 1, bucket + 1, time, self.tolerance,
+                    time)).fetchone(), 'amount'
+        if row is None:
+            return None, None
+        self._connection.execute('DELETE FROM ledger WHERE id = ?',
+            (row[0],))
+        self._count -= 1
+        return pickle.loads(bytes(row[1])), key
+
+    def remaining(self):
+        cursor = self._connection.execute(
+            'SELECT record FROM ledger ORDER BY id')
+        for row in cursor:
+            yield pickle.loads(bytes(row[0]))
+
+    def close(self):
+        self._connection.close()
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+
+class Reconciler(object):
+    """
+    Reconciles gateway transactions against ledger records. Amounts match
+    on time when they are at most ``tolerance`` seconds apart, or only at
+    the same time if ``tolerance`` is 0. Once more
+    than ``spill_threshold`` ledger records are indexed, the index moves to
+    an SQLite database in ``spill_directory``; pass ``None`` to always keep
+    it in memory. Only transactions whose ``status`` is in ``statuses`` are
+    reconciled, if given. Counts of each status are kept in ``counts``.
+    """
+    def __init__(self, tolerance=300, spill_threshold=1000000,
+            spill_directory=None, statuses=None):
+        if tolerance < 0:
+            raise ValueError('The tolerance must not be negative.')
+        self.tolerance = tolerance
+        self.spill_threshold = spill_threshold
+        self.spill_directory = spill_directory
+        self.statuses = statuses and frozenset(statuses)
+        self.counts = dict((status, 0) for status in
+            (MATCHED, AMOUNT_MISMATCH, MISSING, EXTRA))
+
+    def _index(self, ledger):
+        index = _MemoryIndex(self.tolerance)
+        for record in ledger:
+            index.add(_Entry(record))
+            if self.spill_threshold is not None and \
+                    isinstance(index, _MemoryIndex) and \
+                    len(index) > self.spill_threshold:
+                index = self._spill(index)
+        return index
+
+    def _spill(self, memory):
+        index = _SQLiteIndex(self.tolerance, self.spill_directory)
+        for entry in memory.entries():
+            index.add(entry)
+        return index
+
+    def _result(self, *args):
+        result = Reconciled(*args)
+        self.counts[result.status] += 1
+        return result
+
+    def reconcile(self, transactions, ledger):
+        """
+        Yields a :class:`Reconciled` result for each gateway transaction,
+        followed by one for each ledger record left unmatched.
+        """
+        index = self._index(ledger)
+        try:
+            for transaction in transactions:
+                if self.statuses and \
+                        transaction.get('status') not in self.statuses:
+                    continue
+                cents = _cents(transaction.get('amount'))
+                record, key = index.match(
+                    transaction.get('transaction_id') or None,
+                    transaction.get('invoice_number') or None,
+                    cents, parse_time(transaction.get('submitted')))
+                if record is None:
+                    yield self._result(EXTRA, transaction)
+                elif _cents(record.get('amount')) != cents:
+                    yield self._result(AMOUNT_MISMATCH, transaction, record,
+                        key)
+                else:
+                    yield self._result(MATCHED, transaction, record, key)
+            for record in index.remaining():
+                yield self._result(MISSING, None, record)
+        finally:
+            index.close()
+
+
+def reconcile(transactions, ledger, **options):
+    """
+    Reconciles ``transactions`` against ``ledger`` with a new
+    :class:`Reconciler`, passing it any keyword arguments, and yields the
+    results.
+    """
+    return Reconciler(**options).reconcile(transactions, ledger)
+
+
+def read_records(path):
+    """
+    Yields the records in a file: a CSV file with a header row if the name
+    ends in ``.csv``, otherwise one JSON object per line.
+    """
+    if path.endswith('.csv'):
+        with io.open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield row
+    else:
+        with io.open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,184 @@
+"""
+Record and replay of gateway traffic, for benchmarks and regression tests
+against realistic requests rather than hand-written fixtures.
+
+A :class:`RecordingTransport` passes each request on to a real transport and
+writes the request and response, with their timings, to a file. Card
+numbers, card codes and transaction keys are masked with :func:`scrub
+<authorize.scrub.scrub>` before anything is written. A :class:`ReplayTransport` later serves the recorded responses back,
+either at the recorded speed or faster::
+
+    >>> recorder = RecordingTransport('traffic.jsonl.gz')
+    >>> client = AuthorizeClient('login', 'key', transport=recorder)
+    >>> # ... run some traffic ...
+    >>> recorder.close()
+    >>> replay = ReplayTransport('traffic.jsonl.gz', speed=10)
+    >>> client = AuthorizeClient('login', 'key', transport=replay)
+
+Recordings hold one JSON object per line, and are gzipped when the file name
+ends in ``.gz``. Each exchange has these keys:
+
+``at``
+    Seconds since the recording started when the request was sent.
+``duration``
+    Seconds until the response arrived.
+``method``, ``url``, ``operation``
+    The request, with its AIM transaction type, SOAP operation or XML or
+    JSON API request name.
+``request``, ``code``, ``headers``, ``response``
+    The scrubbed request body, and the response status, headers and body.
+"""
+import gzip
+import io
+import json
+import re
+import threading
+import time
+from timeit import default_timer
+
+from authorize.scrub import scrub
+from authorize.transport import Reply, Transport, UrllibTransport
+
+
+_AIM_TYPE = re.compile(r'(?:^|&)x_type=(\w+)')
+_XML_REQUEST = re.compile(r'<(\w+Request)[\s>]')
+_JSON_REQUEST = re.compile(r'^\s*\{\s*"(\w+Request)"')
+
+
+def operation_name(body, headers):
+    """
+    Returns the SOAP operation, AIM transaction type or XML or JSON API
+    request name of a request, or ``None`` if it can't be told.
+    """
+    action = dict((k.lower(), v) for k, v in (headers or {}).items()).get(
+        'soapaction')
+    if action:
+        return action.strip('"').rsplit('/', 1)[-1]
+    match = _AIM_TYPE.search(body) or _XML_REQUEST.search(body) or \
+        _JSON_REQUEST.search(body)
+    return match and match.group(1)
+
+
+def _text(body):
+    # Latin-1 maps every byte to a character, so bodies survive the round
+    # trip through JSON unchanged
+    if isinstance(body, bytes):
+        return body.decode('iso-8859-1')
+    return body
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, mode + 'b'), encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+
+def read_recording(path):
+    """Yields the exchanges in the recording at ``path`` as dictionaries."""
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RecordingTransport(Transport):
+    """
+    Sends requests with ``transport``, which defaults to an
+    :class:`UrllibTransport <authorize.transport.UrllibTransport>`, and
+    records each exchange to ``path``. Call :meth:`close` when done.
+    """
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport or UrllibTransport()
+        self._file = _open(path, 'w')
+        self._lock = threading.Lock()
+        self._start = default_timer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Finishes writing the recording."""
+        with self._lock:
+            self._file.close()
+
+    def open(self, url, headers=None):
+        return self._record('GET', url, None, headers,
+            lambda: self.transport.open(url, headers))
+
+    def send(self, url, body, headers=None):
+        return self._record('POST', url, body, headers,
+            lambda: self.transport.send(url, body, headers))
+
+    def _record(self, method, url, body, headers, send):
+        start = default_timer()
+        reply = send()
+        duration = default_timer() - start
+        request = scrub(_text(body or b''))
+        exchange = {
+            'at': round(start - self._start, 6),
+            'duration': round(duration, 6),
+            'method': method,
+            'url': url,
+            'operation': operation_name(request, headers),
+            'request': request,
+            'code': reply.code,
+            'headers': reply.headers,
+            'response': scrub(_text(reply.body)),
+        }
+        line = json.dumps(exchange, separators=(',', ':'), sort_keys=True)
+        with self._lock:
+            self._file.write(line + u'\n')
+        return reply
+
+
+class ReplayTransport(Transport):
+    """
+    Serves the responses recorded at ``path``. Each request is answered with
+    the next recorded response for the same operation (or, for GET
+    requests, the same URL), cycling back to the first once they run out
+    unless ``loop`` is ``False``.
+
+    Responses are delayed by their recorded duration divided by ``speed``,
+    so ``speed=10`` replays ten times faster. Pass ``speed=None`` to answer
+    at once.
+    """
+    def __init__(self, path, speed=1.0, loop=True):
+        self.speed = speed
+        self.loop = loop
+        self.exchanges = list(read_recording(path))
+        self._responses = {}
+        for exchange in self.exchanges:
+            self._responses.setdefault(self._key(exchange['method'],
+                exchange['url'], exchange['operation']), []).append(exchange)
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def _key(self, method, url, operation):
+        if method == 'GET':
+            return (method, url)
+        return (method, operation)
+
+    def open(self, url, headers=None):
+        return self._reply(self._key('GET', url, None))
+
+    def send(self, url, body, headers=None):
+        operation = operation_name(_text(body), headers)
+        return self._reply(self._key('POST', url, operation))
+
+    def _reply(self, key):
+        responses = self._responses.get(key)
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        if not responses or (position >= len(responses) and not self.loop):
+            raise IOError('No recorded response for {0} {1}'.format(*key))
+        exchange = responses[position % len(responses)]
+        if self.speed:
+            time.sleep(exchange['duration'] / self.speed)
+        return Reply(exchange['code'], exchange['headers'],
+            exchange['response'].encode('iso-8859-1'))
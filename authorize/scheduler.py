@@ -0,0 +1,184 @@
+"""
+Scheduling shares a fixed number of gateway calls in flight between the
+calls waiting for them, so a large batch job can't starve checkouts running
+in the same process. Calls have a priority class: ``INTERACTIVE``, the
+default, or ``BATCH``. A waiting interactive call always goes before any
+waiting batch call. Within a class, calls for different merchant accounts,
+told apart by login ID, take turns in proportion to their weights. This is
+start-time fair queuing, so one busy merchant can't crowd out the others.
+
+Share one :class:`Scheduler` between the clients of every merchant account
+in the process, and run background work at batch priority::
+
+    >>> from authorize.scheduler import BATCH, priority, Scheduler
+    >>> scheduler = Scheduler(capacity=16, weights={'285tUPuS': 2})
+    >>> client = AuthorizeClient('285tUPuS', '58JKJ4T95uee75wd',
+    ...     scheduler=scheduler)
+    >>> with priority(BATCH):
+    ...     for saved_card in renewals:
+    ...         saved_card.capture(amount)
+
+The queue of each class holds at most ``max_queue`` calls. Calls beyond
+that fail at once with an :class:`AuthorizeQueueFullError
+<authorize.exceptions.AuthorizeQueueFullError>` rather than waiting.
+"""
+import heapq
+import itertools
+import threading
+from timeit import default_timer
+
+from authorize.exceptions import AuthorizeQueueFullError
+
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+# The priority classes, the first served first
+PRIORITIES = (INTERACTIVE, BATCH)
+
+_local = threading.local()
+
+
+def current_priority():
+    """Returns the priority class of calls made in this thread."""
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+class _Priority(object):
+    def __init__(self, name):
+        if name not in PRIORITIES:
+            raise ValueError('Unknown priority {0!r}.'.format(name))
+        self.name = name
+
+    def __enter__(self):
+        self.previous = current_priority()
+        _local.priority = self.name
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.priority = self.previous
+        return False
+
+
+def priority(name):
+    """
+    Returns a context manager running the calls made in this thread inside
+    the block at the priority class ``name``.
+    """
+    return _Priority(name)
+
+
+class Scheduler(object):
+    """
+    Lets up to ``capacity`` calls through at once, queueing the rest by
+    priority class and merchant. ``weights`` maps merchant login IDs to
+    their share of the capacity relative to others, which defaults to 1.
+    With no ``capacity``, calls are never held back.
+    """
+    def __init__(self, capacity=None, weights=None, max_queue=1000):
+        self.capacity = capacity
+        self.weights = dict(weights or {})
+        self.max_queue = max_queue
+        self.rejected = 0
+        self._in_flight = 0
+        self._queues = dict((name, []) for name in PRIORITIES)
+        # The virtual time of each class, and the finish tag of the last
+        # call queued by each class and merchant
+        self._virtual = dict((name, 0.0) for name in PRIORITIES)
+        self._finish = {}
+        # The number, total and longest waits of each class
+        self._waits = dict((name, [0, 0.0, 0.0]) for name in PRIORITIES)
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def slot(self, merchant):
+        """
+        Returns a context manager that waits for the turn of a call for
+        ``merchant`` at this thread's priority, and holds its place until
+        the block exits.
+        """
+        if self.capacity is None:
+            return _NULL_SLOT
+        return _ScheduledSlot(self, merchant, current_priority())
+
+    def stats(self):
+        """
+        Returns a dictionary with the calls ``in_flight``, the number of
+        calls ``rejected`` and, for each priority class, the calls
+        ``queued`` and the number, ``total`` and ``max`` of the ``waits``,
+        in seconds.
+        """
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'rejected': self.rejected,
+                'queued': dict((name, len(queue))
+                    for name, queue in self._queues.items()),
+                'waits': dict((name, {'count': count, 'total': total,
+                    'max': longest}) for name, (count, total, longest)
+                    in self._waits.items()),
+            }
+
+    def _record_wait(self, name, seconds):
+        waits = self._waits[name]
+        waits[0] += 1
+        waits[1] += seconds
+        waits[2] = max(waits[2], seconds)
+
+    def _acquire(self, merchant, name):
+        started = default_timer()
+        with self._lock:
+            if self._in_flight < self.capacity and \
+                    not any(self._queues.values()):
+                self._in_flight += 1
+                self._record_wait(name, 0.0)
+                return
+            queue = self._queues[name]
+            if len(queue) >= self.max_queue:
+                self.rejected += 1
+                raise AuthorizeQueueFullError('The {0} queue is full.'
+                    .format(name))
+            key = (name, merchant)
+            start = max(self._virtual[name], self._finish.get(key, 0.0))
+            self._finish[key] = start + 1.0 / self.weights.get(merchant, 1)
+            turn = threading.Event()
+            heapq.heappush(queue, (start, next(self._order), turn))
+        turn.wait()
+        with self._lock:
+            self._record_wait(name, default_timer() - started)
+
+    def _release(self):
+        # Hands the place over to the next call in line, if any
+        with self._lock:
+            for name in PRIORITIES:
+                queue = self._queues[name]
+                if queue:
+                    start, _, turn = heapq.heappop(queue)
+                    self._virtual[name] = start
+                    turn.set()
+                    return
+            self._in_flight -= 1
+
+
+class _ScheduledSlot(object):
+    def __init__(self, scheduler, merchant, name):
+        self.scheduler = scheduler
+        self.merchant = merchant
+        self.name = name
+
+    def __enter__(self):
+        self.scheduler._acquire(self.merchant, self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.scheduler._release()
+        return False
+
+
+class _NullSlot(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SLOT = _NullSlot()
@@ -0,0 +1,37 @@
+"""
+Masks the secrets in request and response bodies before they are written
+anywhere, for the :mod:`wire log <authorize.wirelog>` and :mod:`recordings
+<authorize.replay>` alike, so every body format is handled in one place.
+
+Transaction keys and card codes are masked in AIM form fields, SOAP elements
+and JSON API members, and anything that looks like a card number keeps only
+its last four digits::
+
+    >>> scrub('x_tran_key=secret&x_card_num=4111111111111111')
+    'x_tran_key=XXXX&x_card_num=XXXX1111'
+"""
+import re
+
+
+MASK = 'XXXX'
+
+_SCRUB_RE = re.compile(
+    # A transaction key or card code as an AIM form field, SOAP element,
+    # with or without a namespace prefix, or JSON API member
+    r'(?P<key>(?<!\w)(?:x_tran_key|x_card_code)='
+    r'|<(?:\w+:)?(?:transactionKey|cardCode)>'
+    r'|"(?:transactionKey|cardCode)"\s*:\s*")[^<&"]+'
+    # A run of digits as long as a card number
+    r'|(?<!\d)\d{9,15}(?P<last>\d{4})(?!\d)')
+
+
+def _mask(match):
+    key = match.group('key')
+    if key is not None:
+        return key + MASK
+    return MASK + match.group('last')
+
+
+def scrub(text):
+    """Masks card numbers, card codes and transaction keys in ``text``."""
+    return _SCRUB_RE.sub(_mask, text)
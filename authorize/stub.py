@@ -0,0 +1,568 @@
+"""
+A stub Authorize.net gateway that runs in process, for load tests and
+experiments that shouldn't touch the network. It keeps its transactions,
+saved profiles and subscriptions in memory and answers the transaction API
+and the subset of the CIM and ARB services this library uses, through
+either SOAP or the JSON API.
+
+Install it on a client with a :class:`StubTransport`::
+
+    >>> client = AuthorizeClient('login', 'key', transport=StubTransport())
+
+Any login and transaction key are accepted. Cards are approved unless the
+card number is ``4222222222222``, which is always declined. As with the real
+gateway, a charge repeating the type, card, amount, invoice number and
+customer id of one made within the duplicate window is rejected.
+"""
+from collections import OrderedDict
+import itertools
+import json
+import pkgutil
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from six import text_type
+from six.moves.urllib.parse import parse_qsl
+
+from authorize.transport import Reply, Transport
+
+
+SOAP_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+API_NS = 'https://api.authorize.net/soap/v1/'
+DECLINED_CARD = '4222222222222'
+
+# JSON request arrays, and the element name of their items in SOAP requests
+_JSON_ITEMS = {'paymentProfiles': 'CustomerPaymentProfileType'}
+# SOAP result elements that are arrays in JSON responses
+_JSON_ARRAYS = frozenset(['customerPaymentProfileIdList',
+    'customerShippingAddressIdList', 'validationDirectResponseList',
+    'paymentProfiles', 'ids'])
+
+_TRANSACTION_TYPES = {
+    'AUTH_ONLY': 'auth_only',
+    'AUTH_CAPTURE': 'auth_capture',
+    'PRIOR_AUTH_CAPTURE': 'prior_auth_capture',
+    'CREDIT': 'credit',
+    'VOID': 'void',
+}
+_REASONS = {
+    1: 'This transaction has been approved.',
+    2: 'This transaction has been declined.',
+    3: 'The transaction type is invalid.',
+    11: 'A duplicate transaction has been submitted.',
+    16: 'The transaction cannot be found.',
+    47: 'The amount requested for settlement cannot be greater than the '
+        'original amount authorized.',
+    54: 'The referenced transaction does not meet the criteria for issuing '
+        'a credit.',
+}
+
+
+def service_wsdl():
+    """Returns the stub's WSDL for the CIM and ARB services, as bytes."""
+    return pkgutil.get_data('authorize', 'wsdl/service.wsdl')
+
+
+class GatewayError(Exception):
+    """
+    An error result returned by the SOAP services, with any ``fields`` to
+    include in the result.
+    """
+    def __init__(self, code, text, fields=None):
+        Exception.__init__(self, text)
+        self.code = code
+        self.text = text
+        self.fields = fields or []
+
+
+class Gateway(object):
+    """
+    The stub gateway's state and request handling. All methods are thread
+    safe.
+
+    ``duplicate_window`` is the default number of seconds within which a
+    repeated charge is rejected, which requests can override with
+    ``x_duplicate_window``. Set it to 0 to accept duplicates.
+    """
+    def __init__(self, duplicate_window=120):
+        self.duplicate_window = duplicate_window
+        self._recent = {}
+        self.transactions = {}
+        self.profiles = {}
+        self.subscriptions = {}
+        self._ids = itertools.count(2000000001)
+        self._lock = threading.RLock()
+
+    def handle_aim(self, body):
+        """Answers a transaction API request, returning the response body."""
+        params = dict(parse_qsl(body.decode('utf-8')))
+        with self._lock:
+            fields = self._transact(params.get('x_type'), params)
+        return self._direct_response(fields, params.get('x_delim_char', ','))
+
+    def handle_soap(self, body):
+        """
+        Answers a SOAP request, returning the HTTP status code and response
+        body.
+        """
+        try:
+            request = ElementTree.fromstring(body).find(
+                '{{{0}}}Body'.format(SOAP_NS))[0]
+        except (ElementTree.ParseError, TypeError, IndexError):
+            return 500, _fault('soap:Client', 'Malformed request.')
+        operation = request.tag.rsplit('}', 1)[-1]
+        handler = getattr(self, '_soap_' + operation, None)
+        if handler is None:
+            return 500, _fault('soap:Client',
+                'Unknown operation {0}.'.format(operation))
+        try:
+            with self._lock:
+                fields = handler(request)
+            code, text = 'I00001', 'Successful.'
+            result = 'Ok'
+        except GatewayError as e:
+            fields = e.fields
+            code, text = e.code, e.text
+            result = 'Error'
+        content = [
+            ('resultCode', result),
+            ('messages', [('MessagesTypeMessage',
+                [('code', code), ('text', text)])]),
+        ] + fields
+        return 200, _envelope(operation, content)
+
+    def handle_json(self, body):
+        """
+        Answers a JSON API request for one of the SOAP operations the stub
+        supports, returning the HTTP status code and response body.
+        """
+        try:
+            (name, fields), = json.loads(body.decode('utf-8-sig')).items()
+            request = _json_element(name, fields)
+        except (ValueError, AttributeError):
+            return 400, json.dumps(_json_result('Error', 'E00003',
+                'The request is malformed.', []))
+        if name.startswith('ARB'):
+            operation = name[:-len('Request')]
+        else:
+            operation = name[0].upper() + name[1:-len('Request')]
+        handler = getattr(self, '_soap_' + operation, None)
+        if handler is None or not name.endswith('Request'):
+            return 200, json.dumps(_json_result('Error', 'E00045',
+                'The root node does not reference a valid XML namespace.',
+                []))
+        try:
+            with self._lock:
+                fields = handler(request)
+            result = _json_result('Ok', 'I00001', 'Successful.', fields)
+        except GatewayError as e:
+            result = _json_result('Error', e.code, e.text, e.fields)
+        # Like Authorize.net, responses start with a byte order mark
+        return 200, u'\ufeff' + json.dumps(result)
+
+    def _next_id(self):
+        return next(self._ids)
+
+    def _transact(self, kind, params):
+        # Runs a transaction, returning the response fields by index
+        fields = {0: '1', 1: '1', 2: '1', 11: _TRANSACTION_TYPES.get(kind, '')}
+        amount = _amount(params.get('x_amount'))
+        card = params.get('x_card_num') or ''
+        if kind in ('AUTH_ONLY', 'AUTH_CAPTURE'):
+            if card == DECLINED_CARD:
+                return self._reason(fields, 2, '2')
+            if self._duplicate(kind, card, amount, params):
+                return self._reason(fields, 11)
+            transaction_id = str(self._next_id())
+            self.transactions[transaction_id] = {
+                'type': fields[11],
+                'amount': amount,
+                'status': 'captured' if kind == 'AUTH_CAPTURE'
+                    else 'authorized',
+                'card': card[-4:],
+            }
+        elif kind in ('PRIOR_AUTH_CAPTURE', 'VOID', 'CREDIT'):
+            if kind == 'CREDIT' and not params.get('x_trans_id'):
+                if self._duplicate(kind, card, amount, params):
+                    return self._reason(fields, 11)
+                return self._unlinked_credit(fields, amount, card)
+            transaction_id = params.get('x_trans_id')
+            original = self.transactions.get(transaction_id)
+            if original is None:
+                return self._reason(fields, 16)
+            if kind == 'PRIOR_AUTH_CAPTURE':
+                if original['status'] != 'authorized':
+                    return self._reason(fields, 16)
+                if amount is not None and amount > original['amount']:
+                    return self._reason(fields, 47)
+                original['status'] = 'captured'
+                original['amount'] = amount or original['amount']
+            elif kind == 'VOID':
+                if original['status'] == 'voided':
+                    return self._reason(fields, 16)
+                original['status'] = 'voided'
+            else:
+                credited = original.get('credited', Decimal(0)) + \
+                    (amount or 0)
+                if amount is None or original['status'] != 'captured' or \
+                        credited > original['amount']:
+                    return self._reason(fields, 54)
+                original['credited'] = credited
+                transaction_id = str(self._next_id())
+                self.transactions[transaction_id] = {
+                    'type': 'credit',
+                    'amount': amount,
+                    'status': 'credited',
+                    'card': original['card'],
+                }
+            amount = amount or original['amount']
+            card = card or original['card']
+        else:
+            return self._reason(fields, 3)
+        return self._approve(fields, transaction_id, amount, card, params)
+
+    def _duplicate(self, kind, card, amount, params):
+        # Remembers the charge, returning True if it repeats a recent one
+        window = int(params.get('x_duplicate_window', self.duplicate_window))
+        now = time.time()
+        key = (kind, card, amount, params.get('x_invoice_num'),
+            params.get('x_cust_id'))
+        previous = self._recent.get(key)
+        self._recent[key] = now
+        if len(self._recent) > 10000:
+            # 28800 seconds is the longest window the gateway allows
+            for old_key, when in list(self._recent.items()):
+                if now - when > 28800:
+                    del self._recent[old_key]
+        return previous is not None and now - previous < window
+
+    def _unlinked_credit(self, fields, amount, card):
+        transaction_id = str(self._next_id())
+        self.transactions[transaction_id] = {
+            'type': 'credit',
+            'amount': amount,
+            'status': 'credited',
+            'card': card[-4:],
+        }
+        return self._approve(fields, transaction_id, amount, card, {})
+
+    def _approve(self, fields, transaction_id, amount, card, params):
+        fields.update({
+            3: _REASONS[1],
+            4: 'STUB{0:0>2}'.format(int(transaction_id) % 100),
+            5: 'Y',
+            6: transaction_id,
+            9: '{0:.2f}'.format(amount or 0),
+            38: 'P' if params.get('x_card_code') else '',
+            50: 'XXXX' + card[-4:],
+            51: 'Visa',
+        })
+        return fields
+
+    def _reason(self, fields, reason, response_code='3'):
+        fields.update({0: response_code, 2: str(reason), 3: _REASONS[reason],
+            6: '0'})
+        return fields
+
+    def _direct_response(self, fields, delimiter):
+        return delimiter.join(fields.get(i, '') for i in range(69))
+
+    def _profile(self, profile_id):
+        profile = self.profiles.get(profile_id)
+        if profile is None:
+            raise GatewayError('E00040', 'The record cannot be found.')
+        return profile
+
+    def _payment(self, profile, element):
+        payment_id = self._next_id()
+        payment = {'id': payment_id, 'billTo': []}
+        self._update_payment(payment, element)
+        profile['payments'][payment_id] = payment
+        return payment_id
+
+    def _update_payment(self, payment, element):
+        card = _child(element, 'payment', 'creditCard')
+        number = _text(card, 'cardNumber')
+        if number and not number.startswith('XXXX'):
+            payment['number'] = number
+        expiration = _text(card, 'expirationDate')
+        if expiration and expiration != 'XXXX':
+            payment['expiration'] = expiration
+        bill_to = _child(element, 'billTo')
+        if bill_to is not None:
+            payment['billTo'] = [(field.tag.rsplit('}', 1)[-1], field.text)
+                for field in bill_to]
+
+    def _soap_CreateCustomerProfile(self, request):
+        element = _child(request, 'profile')
+        merchant_id = _text(element, 'merchantCustomerId')
+        for profile in self.profiles.values():
+            if merchant_id and profile['merchantCustomerId'] == merchant_id:
+                raise GatewayError('E00039', 'A duplicate record with ID '
+                    '{0} already exists.'.format(profile['id']))
+        profile_id = self._next_id()
+        profile = self.profiles[profile_id] = {
+            'id': profile_id,
+            'merchantCustomerId': merchant_id,
+            'description': _text(element, 'description'),
+            'email': _text(element, 'email'),
+            'payments': {},
+        }
+        payment_ids = [self._payment(profile, payment) for payment in
+            _children(element, 'paymentProfiles',
+                'CustomerPaymentProfileType')]
+        return [
+            ('customerProfileId', profile_id),
+            ('customerPaymentProfileIdList',
+                [('long', i) for i in payment_ids]),
+            ('customerShippingAddressIdList', []),
+            ('validationDirectResponseList', []),
+        ]
+
+    def _soap_CreateCustomerPaymentProfile(self, request):
+        profile = self._profile(_long(request, 'customerProfileId'))
+        payment_id = self._payment(profile, _child(request, 'paymentProfile'))
+        return [('customerPaymentProfileId', payment_id)]
+
+    def _soap_GetCustomerProfile(self, request):
+        profile = self._profile(_long(request, 'customerProfileId'))
+        payments = []
+        for payment in sorted(profile['payments'].values(),
+                key=lambda p: p['id']):
+            payments.append(('CustomerPaymentProfileMaskedType', [
+                ('billTo', payment['billTo']),
+                ('customerPaymentProfileId', payment['id']),
+                ('payment', [('creditCard', [
+                    ('cardNumber', 'XXXX' + payment['number'][-4:]),
+                    ('expirationDate', 'XXXX'),
+                ])]),
+            ]))
+        return [('profile', [
+            ('merchantCustomerId', profile['merchantCustomerId']),
+            ('description', profile['description']),
+            ('email', profile['email']),
+            ('customerProfileId', profile['id']),
+            ('paymentProfiles', payments),
+        ])]
+
+    def _soap_GetCustomerProfileIds(self, request):
+        return [('ids', [('long', i) for i in sorted(self.profiles)])]
+
+    def _soap_UpdateCustomerProfile(self, request):
+        element = _child(request, 'profile')
+        profile = self._profile(_long(element, 'customerProfileId'))
+        for field in ('merchantCustomerId', 'description', 'email'):
+            profile[field] = _text(element, field)
+        return []
+
+    def _soap_UpdateCustomerPaymentProfile(self, request):
+        profile = self._profile(_long(request, 'customerProfileId'))
+        element = _child(request, 'paymentProfile')
+        payment = profile['payments'].get(
+            _long(element, 'customerPaymentProfileId'))
+        if payment is None:
+            raise GatewayError('E00040', 'The record cannot be found.')
+        self._update_payment(payment, element)
+        return []
+
+    def _soap_DeleteCustomerProfile(self, request):
+        profile = self._profile(_long(request, 'customerProfileId'))
+        del self.profiles[profile['id']]
+        return []
+
+    def _soap_DeleteCustomerPaymentProfile(self, request):
+        profile = self._profile(_long(request, 'customerProfileId'))
+        if profile['payments'].pop(
+                _long(request, 'customerPaymentProfileId'), None) is None:
+            raise GatewayError('E00040', 'The record cannot be found.')
+        return []
+
+    def _soap_CreateCustomerProfileTransaction(self, request):
+        transaction = _child(request, 'transaction')[0]
+        kind = {
+            'profileTransAuthOnly': 'AUTH_ONLY',
+            'profileTransAuthCapture': 'AUTH_CAPTURE',
+            'profileTransRefund': 'CREDIT',
+        }[transaction.tag.rsplit('}', 1)[-1]]
+        profile = self._profile(_long(transaction, 'customerProfileId'))
+        payment = profile['payments'].get(
+            _long(transaction, 'customerPaymentProfileId'))
+        if payment is None:
+            raise GatewayError('E00040', 'The record cannot be found.')
+        options = dict(parse_qsl(_text(request, 'extraOptions') or ''))
+        params = {
+            'x_amount': _text(transaction, 'amount'),
+            'x_card_num': payment['number'],
+            'x_card_code': _text(transaction, 'cardCode'),
+            'x_trans_id': _text(transaction, 'transId'),
+        }
+        if 'x_duplicate_window' in options:
+            params['x_duplicate_window'] = options['x_duplicate_window']
+        fields = self._transact(kind, params)
+        response = [('directResponse', self._direct_response(fields,
+            options.get('x_delim_char', ',')))]
+        if fields[0] != '1':
+            raise GatewayError('E00027', fields[3], response)
+        return response
+
+    def _soap_ARBCreateSubscription(self, request):
+        element = _child(request, 'subscription')
+        card = _text(_child(element, 'payment', 'creditCard'), 'cardNumber')
+        if card == DECLINED_CARD:
+            raise GatewayError('E00027', _REASONS[2])
+        subscription_id = self._next_id()
+        self.subscriptions[subscription_id] = {
+            'id': subscription_id,
+            'amount': _amount(_text(element, 'amount')),
+            'status': 'active',
+        }
+        return [('subscriptionId', subscription_id)]
+
+    def _subscription(self, request):
+        subscription = self.subscriptions.get(
+            _long(request, 'subscriptionId'))
+        if subscription is None or subscription['status'] != 'active':
+            raise GatewayError('E00035', 'The subscription cannot be found.')
+        return subscription
+
+    def _soap_ARBUpdateSubscription(self, request):
+        subscription = self._subscription(request)
+        amount = _amount(_text(_child(request, 'subscription'), 'amount'))
+        if amount is not None:
+            subscription['amount'] = amount
+        return []
+
+    def _soap_ARBCancelSubscription(self, request):
+        self._subscription(request)['status'] = 'canceled'
+        return []
+
+
+class StubTransport(Transport):
+    """
+    A transport answering every request from a :class:`Gateway`, which
+    defaults to a new one. Each request is delayed by ``latency`` seconds to
+    stand in for the network.
+    """
+    def __init__(self, gateway=None, latency=0):
+        self.gateway = gateway if gateway is not None else Gateway()
+        self.latency = latency
+
+    def open(self, url, headers=None):
+        return Reply(200, {'content-type': 'text/xml; charset=utf-8'},
+            service_wsdl())
+
+    def send(self, url, body, headers=None):
+        if self.latency:
+            time.sleep(self.latency)
+        if body.lstrip().startswith(b'{'):
+            code, response = self.gateway.handle_json(body)
+            content_type = 'application/json; charset=utf-8'
+        elif body.lstrip().startswith(b'<'):
+            code, response = self.gateway.handle_soap(body)
+            content_type = 'text/xml; charset=utf-8'
+        else:
+            code, response = 200, self.gateway.handle_aim(body)
+            content_type = 'text/plain; charset=utf-8'
+        return Reply(code, {'content-type': content_type},
+            response.encode('utf-8'))
+
+
+def _child(element, *path):
+    for name in path:
+        if element is None:
+            return None
+        element = element.find('{{{0}}}{1}'.format(API_NS, name))
+    return element
+
+
+def _children(element, *path):
+    parent = _child(element, *path[:-1])
+    if parent is None:
+        return []
+    return parent.findall('{{{0}}}{1}'.format(API_NS, path[-1]))
+
+
+def _text(element, name):
+    child = _child(element, name)
+    return child.text if child is not None else None
+
+
+def _long(element, name):
+    try:
+        return int(_text(element, name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _amount(value):
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except (TypeError, InvalidOperation):
+        return None
+
+
+def _json_element(name, value):
+    # Converts a JSON request into the element of the SOAP request it
+    # stands for, so both are answered by the same handlers
+    element = ElementTree.Element('{{{0}}}{1}'.format(API_NS, name))
+    if isinstance(value, dict):
+        for key, child in value.items():
+            element.append(_json_element(key, child))
+    elif isinstance(value, list):
+        item = _JSON_ITEMS.get(name, name)
+        for child in value:
+            element.append(_json_element(item, child))
+    elif value is not None:
+        element.text = text_type(value)
+    return element
+
+
+def _json_value(name, value):
+    # Converts the content of a SOAP result to JSON
+    if isinstance(value, list):
+        if name in _JSON_ARRAYS:
+            return [_json_value(k, v) for k, v in value]
+        return OrderedDict((k, _json_value(k, v)) for k, v in value
+            if v is not None)
+    return text_type(value)
+
+
+def _json_result(result, code, text, fields):
+    content = _json_value(None, fields)
+    content['messages'] = OrderedDict([
+        ('resultCode', result),
+        ('message', [OrderedDict([('code', code), ('text', text)])]),
+    ])
+    return content
+
+
+def _xml(name, value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        content = ''.join(_xml(k, v) for k, v in value)
+    else:
+        content = escape(text_type(value))
+    return '<{0}>{1}</{0}>'.format(name, content)
+
+
+def _envelope(operation, content):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="{0}"><soap:Body>'
+        '<{1}Response xmlns="{2}">{3}</{1}Response>'
+        '</soap:Body></soap:Envelope>'
+    ).format(SOAP_NS, operation, API_NS,
+        _xml(operation + 'Result', content))
+
+
+def _fault(code, message):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="{0}"><soap:Body><soap:Fault>'
+        '<faultcode>{1}</faultcode><faultstring>{2}</faultstring>'
+        '</soap:Fault></soap:Body></soap:Envelope>'
+    ).format(SOAP_NS, code, escape(message))
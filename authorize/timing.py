@@ -0,0 +1,254 @@
+"""
+Every call to Authorize.net is timed phase by phase, so a slow call can be
+put down to the right cause. The phases of a call are, in order:
+
+``build``
+    Building the request from the call's parameters.
+``wait``
+    Waiting for the rate limiter and circuit breaker.
+``network``
+    The round trip to Authorize.net.
+``parse``
+    Parsing the response, including suds' unmarshalling for SOAP calls.
+
+SOAP calls build their request after the wait, so their ``build`` phase
+comes second. With an :class:`InstrumentedTransport
+<authorize.transport.InstrumentedTransport>` installed on the client, the
+round trip is broken down further into ``dns``, ``connect``, ``tls``,
+``first_byte`` (sending the request and waiting for the response headers)
+and ``transfer`` (reading the response body), and ``network`` only covers
+what is left over.
+
+The timing of the gateway call behind a transaction is kept in its
+``timing`` attribute, and errors raised by a call carry the timing of the
+call in theirs::
+
+    >>> transaction = client.card(credit_card).capture(20)
+    >>> transaction.timing
+    <CallTiming aim AUTH_CAPTURE 0.412s>
+    >>> transaction.timing.phases
+    OrderedDict([('build', 4.1e-05), ('wait', 2e-06), ('network', 0.41), ...])
+
+To see the timing of every call, install a listener with
+:func:`add_listener`. A :class:`SlowCallLog` logs the phases of calls that
+take longer than a threshold::
+
+    >>> from authorize.timing import add_listener, SlowCallLog
+    >>> add_listener(SlowCallLog(threshold=2.0))
+"""
+from collections import OrderedDict
+import logging
+import threading
+import time
+from timeit import default_timer
+
+from authorize.exceptions import AuthorizeError
+
+
+log = logging.getLogger('authorize.timing')
+
+_listeners = []
+_local = threading.local()
+
+
+def add_listener(listener):
+    """
+    Calls ``listener`` with the :class:`CallTiming` of every finished
+    gateway call in the process, whether it succeeded or not. Listeners are
+    called in the thread that made the call, so they should be quick. Errors
+    raised by a listener are logged to the ``authorize.timing`` logger and
+    never reach the caller.
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Stops calling a listener installed with :func:`add_listener`."""
+    _listeners.remove(listener)
+
+
+class CallTiming(object):
+    """
+    The timing of one call to Authorize.net. ``started`` is the time the
+    call started, in seconds since the epoch, and ``error`` is the exception
+    that ended the call, if any.
+    """
+    def __init__(self, endpoint, operation):
+        self.endpoint = endpoint
+        self.operation = operation
+        self.started = time.time()
+        self.error = None
+        self.marks = []
+        self._start = default_timer()
+        self._end = None
+
+    def __repr__(self):
+        return '<CallTiming {0.endpoint} {0.operation} {0.total:.3f}s>' \
+            .format(self)
+
+    def mark(self, phase):
+        """Marks the end of ``phase``, which began at the previous mark."""
+        self.marks.append((phase, default_timer()))
+
+    @property
+    def total(self):
+        """The duration of the whole call in seconds."""
+        return (self._end or default_timer()) - self._start
+
+    @property
+    def phases(self):
+        """
+        An ordered dictionary of the duration of each phase in seconds.
+        Phases marked more than once are added together.
+        """
+        phases = OrderedDict()
+        previous = self._start
+        for phase, when in self.marks:
+            phases[phase] = phases.get(phase, 0) + when - previous
+            previous = when
+        return phases
+
+    def to_dict(self):
+        """Returns the timing as a dictionary, for logging or metrics."""
+        return {
+            'endpoint': self.endpoint,
+            'operation': self.operation,
+            'started': self.started,
+            'total': self.total,
+            'phases': dict(self.phases),
+            'error': self.error and repr(self.error),
+        }
+
+    def format(self):
+        """Returns the phases as a single line of text."""
+        return ' '.join('{0}={1:.3f}s'.format(phase, seconds)
+            for phase, seconds in self.phases.items())
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _collectors():
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    return _local.collectors
+
+
+class _TimedCall(object):
+    def __init__(self, endpoint, operation):
+        self.timing = CallTiming(endpoint, operation)
+
+    def __enter__(self):
+        _stack().append(self.timing)
+        return self.timing
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _stack().pop()
+        timing = self.timing
+        timing._end = default_timer()
+        timing.error = exc_value
+        if isinstance(exc_value, AuthorizeError):
+            exc_value.timing = timing
+        for collected in _collectors():
+            collected.append(timing)
+        for listener in list(_listeners):
+            # The call is over, so a broken listener must not fail it
+            try:
+                listener(timing)
+            except Exception:
+                log.exception('Timing listener %r failed.', listener)
+        return False
+
+
+class _Attached(object):
+    def __init__(self, timing):
+        self.timing = timing
+
+    def __enter__(self):
+        if self.timing is not None:
+            _stack().append(self.timing)
+        return self.timing
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.timing is not None:
+            _stack().pop()
+        return False
+
+
+def attached(timing):
+    """
+    Returns a context manager making ``timing``, a :class:`CallTiming`, the
+    call being timed in this thread inside its block, such as in a worker
+    thread making a request on another thread's behalf. Unlike
+    :func:`timed`, it neither ends the timing nor calls the listeners. Does
+    nothing if ``timing`` is ``None``.
+    """
+    return _Attached(timing)
+
+
+def timed(endpoint, operation):
+    """
+    Returns a context manager that times its block as a call to
+    ``operation`` on ``endpoint``. It yields the :class:`CallTiming`, and
+    sets it as the ``timing`` of any :class:`AuthorizeError
+    <authorize.exceptions.AuthorizeError>` that ends the call.
+    """
+    return _TimedCall(endpoint, operation)
+
+
+def current():
+    """
+    Returns the :class:`CallTiming` of the call being timed in this thread,
+    or ``None``.
+    """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def mark(phase):
+    """Marks the end of ``phase`` of the call being timed in this thread."""
+    stack = _stack()
+    if stack:
+        stack[-1].mark(phase)
+
+
+class _Collector(object):
+    def __enter__(self):
+        self.timings = []
+        _collectors().append(self.timings)
+        return self.timings
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _collectors().pop()
+        return False
+
+
+def collect():
+    """
+    Returns a context manager yielding a list, to which the
+    :class:`CallTiming` of every call finished in this thread inside the
+    block is added.
+    """
+    return _Collector()
+
+
+class SlowCallLog(object):
+    """
+    A listener logging a warning with the phases of each call that takes
+    longer than ``threshold`` seconds, to ``logger`` or else the
+    ``authorize.timing`` logger.
+    """
+    def __init__(self, threshold=1.0, logger=None):
+        self.threshold = threshold
+        self.logger = logger or log
+
+    def __call__(self, timing):
+        if timing.total < self.threshold:
+            return
+        self.logger.warning('Slow %s %s call took %.3fs%s: %s',
+            timing.endpoint, timing.operation, timing.total,
+            ' and failed' if timing.error is not None else '',
+            timing.format(), extra={'timing': timing.to_dict()})
@@ -0,0 +1,274 @@
+"""
+Tracing shows where the time goes inside the client's higher level
+operations. Install a tracer with :func:`set_tracer` and every method of the
+:mod:`authorize.client` objects emits a span, with a child span for each call
+to Authorize.net that it makes. Each gateway span in turn has child spans for
+its phases: waiting for the rate limiter, building the request, the network
+round trip and parsing the response.
+
+Tracers are plain objects implementing :class:`Tracer`, so no tracing library
+is required. To send spans to OpenTelemetry, install the adapter::
+
+    >>> from authorize.tracing import OpenTelemetryTracer, set_tracer
+    >>> set_tracer(OpenTelemetryTracer())
+
+When no tracer is installed, tracing costs no more than a function call.
+"""
+from functools import wraps
+import threading
+import time
+from timeit import default_timer
+
+from suds.plugin import MessagePlugin
+
+from authorize import timing
+
+
+_tracer = None
+_local = threading.local()
+
+
+def set_tracer(tracer):
+    """
+    Installs ``tracer`` for the whole process. Pass ``None`` to turn tracing
+    off again.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    """Returns the installed tracer, or ``None``."""
+    return _tracer
+
+
+class Tracer(object):
+    """
+    The interface a tracer must implement. Times are given as seconds since
+    the epoch, as returned by ``time.time()``.
+    """
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        """
+        Starts and returns a new :class:`Span` called ``name``. ``parent`` is
+        the enclosing span, if any.
+        """
+        raise NotImplementedError
+
+
+class Span(object):
+    """The interface for the spans returned by a :class:`Tracer`."""
+    def set_attribute(self, key, value):
+        """Sets an attribute on the span."""
+        raise NotImplementedError
+
+    def end(self, end_time=None, error=None):
+        """
+        Ends the span. ``error`` is the exception that ended it, if any.
+        """
+        raise NotImplementedError
+
+
+class RecordingTracer(Tracer):
+    """
+    A simple tracer that keeps every finished span in its ``spans`` list,
+    for debugging and tests.
+    """
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        return RecordedSpan(self, name, parent, attributes, start_time)
+
+
+class RecordedSpan(Span):
+    def __init__(self, tracer, name, parent, attributes, start_time):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = start_time or time.time()
+        self.end_time = None
+        self.error = None
+
+    def __repr__(self):
+        return '<RecordedSpan {0.name}>'.format(self)
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_time=None, error=None):
+        self.end_time = end_time or time.time()
+        self.error = error
+        with self.tracer._lock:
+            self.tracer.spans.append(self)
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Adapts an OpenTelemetry tracer, which defaults to the global tracer
+    provider's tracer for this library. Requires the ``opentelemetry-api``
+    package.
+    """
+    def __init__(self, tracer=None):
+        from opentelemetry import trace
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer('authorize')
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        context = None
+        if parent is not None:
+            context = self._trace.set_span_in_context(parent.span)
+        span = self.tracer.start_span(name, context=context,
+            attributes=attributes, start_time=_nanoseconds(start_time))
+        return _OpenTelemetrySpan(self._trace, span)
+
+
+class _OpenTelemetrySpan(Span):
+    def __init__(self, trace, span):
+        self._trace = trace
+        self.span = span
+
+    def set_attribute(self, key, value):
+        self.span.set_attribute(key, value)
+
+    def end(self, end_time=None, error=None):
+        if error is not None:
+            self.span.record_exception(error)
+            self.span.set_status(self._trace.Status(
+                self._trace.StatusCode.ERROR, str(error)))
+        self.span.end(end_time=_nanoseconds(end_time))
+
+
+def _nanoseconds(seconds):
+    if seconds is None:
+        return None
+    return int(seconds * 1e9)
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class _ActiveSpan(object):
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.marks = []
+
+    def __enter__(self):
+        stack = _stack()
+        parent = stack[-1].span if stack else None
+        self.start = time.time()
+        self.span = self.tracer.start_span(self.name, parent=parent,
+            attributes=self.attributes, start_time=self.start)
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _stack().pop()
+        previous = self.start
+        for phase, when in self.marks:
+            child = self.tracer.start_span(phase, parent=self.span,
+                start_time=previous)
+            child.end(end_time=when)
+            previous = when
+        self.span.end(error=exc_value)
+        return False
+
+    def set_attribute(self, key, value):
+        self.span.set_attribute(key, value)
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(*name, **attributes):
+    """
+    Returns a context manager that traces its block as a span, nested in the
+    current span of this thread. The parts of ``name`` are joined with dots,
+    so callers don't pay for building the name when tracing is off.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _ActiveSpan(_tracer, '.'.join(filter(None, name)), attributes)
+
+
+def mark(phase):
+    """
+    Marks the end of ``phase`` of the current span. When the span ends, each
+    phase is emitted as a child span lasting from the previous mark (or the
+    start of the span) until its own mark.
+
+    The phase is also marked on the :mod:`timing <authorize.timing>` of the
+    gateway call in progress, if any.
+    """
+    timing.mark(phase)
+    if _tracer is None:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].marks.append((phase, time.time()))
+
+
+def adopt(marks):
+    """
+    Marks the phases in ``marks``, the ``marks`` of a :class:`CallTiming
+    <authorize.timing.CallTiming>` timed in another thread, on the gateway
+    call and span in progress in this thread.
+    """
+    call = timing.current()
+    if call is not None:
+        call.marks.extend(marks)
+    if _tracer is None:
+        return
+    stack = _stack()
+    if stack:
+        # Marks are timed with the timer, and spans with the clock
+        offset = time.time() - default_timer()
+        stack[-1].marks.extend((phase, when + offset)
+            for phase, when in marks)
+
+
+def traced(name):
+    """Decorates a method so each call to it is traced as a span."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return method(*args, **kwargs)
+            with _ActiveSpan(_tracer, name, {}):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PhasePlugin(MessagePlugin):
+    """
+    A suds plugin marking the build, network and parse phases of SOAP calls.
+    """
+    def sending(self, context):
+        mark('build')
+
+    def received(self, context):
+        mark('network')
+
+    def unmarshalled(self, context):
+        mark('parse')
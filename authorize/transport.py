@@ -0,0 +1,464 @@
+"""
+Transports carry the raw HTTP requests to Authorize.net. By default the
+transaction API uses ``urlopen`` and the SOAP APIs share one
+:class:`PooledTransport`, which keeps connections to each host open between
+calls and asks for compressed replies. Any :class:`Transport` can be
+installed on the client to take over the HTTP side of all three APIs, for
+example to record traffic or replay it (see :mod:`authorize.replay`), or to
+break down the timing of each request with an
+:class:`InstrumentedTransport`.
+
+The shared pool's timeouts and size can be changed by installing another
+before the first call::
+
+    >>> from authorize.transport import PooledTransport, set_default_transport
+    >>> set_default_transport(PooledTransport(timeout=20, max_idle=8))
+"""
+import os
+import re
+import select
+import socket
+import ssl
+import threading
+import time
+import zlib
+
+from six import BytesIO
+from six.moves import http_client
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.parse import urlsplit
+from six.moves.urllib.request import Request, urlopen
+from suds.transport import Reply as SudsReply, Transport as SudsBaseTransport, \
+    TransportError
+
+from authorize import tracing, wirelog
+
+
+DEFAULT_CHARSET = 'iso-8859-1'
+CHARSET_RE = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class Reply(object):
+    """
+    A raw HTTP response: the status ``code``, a dictionary of ``headers``
+    with lowercase names, and the ``body`` as bytes.
+    """
+    def __init__(self, code, headers, body):
+        self.code = code
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):
+        return '<Reply {0.code} {1} bytes>'.format(self, len(self.body))
+
+    @property
+    def charset(self):
+        """The charset named in the content type, if any."""
+        match = CHARSET_RE.search(self.headers.get('content-type', ''))
+        return match and match.group(1).lower()
+
+    def text(self):
+        """The body decoded using its charset."""
+        return self.body.decode(self.charset or DEFAULT_CHARSET)
+
+
+class Transport(object):
+    """
+    The interface for transports. Connection problems should be raised as
+    ``IOError``; HTTP error statuses are returned as replies.
+    """
+    def open(self, url, headers=None):
+        """Sends a GET request for ``url`` and returns a :class:`Reply`."""
+        raise NotImplementedError
+
+    def send(self, url, body, headers=None):
+        """Sends ``body`` as a POST request and returns a :class:`Reply`."""
+        raise NotImplementedError
+
+
+class UrllibTransport(Transport):
+    """A transport using the standard library's ``urlopen``."""
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+
+    def open(self, url, headers=None):
+        return self._request(Request(url, headers=headers or {}))
+
+    def send(self, url, body, headers=None):
+        return self._request(Request(url, data=body, headers=headers or {}))
+
+    def _request(self, request):
+        try:
+            resource = urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            resource = e
+        try:
+            headers = dict((name.lower(), value)
+                for name, value in resource.headers.items())
+            return Reply(resource.code, headers, resource.read())
+        finally:
+            resource.close()
+
+
+class InstrumentedTransport(Transport):
+    """
+    A transport that opens each connection step by step, so the time taken
+    to look up the host, connect, negotiate TLS, wait for the response and
+    read its body are marked as the ``dns``, ``connect``, ``tls``,
+    ``first_byte`` and ``transfer`` phases of the call's
+    :mod:`timing <authorize.timing>`. TLS uses ``context``, which defaults
+    to the system's default SSL context.
+    """
+    def __init__(self, timeout=60, context=None):
+        self.timeout = timeout
+        self.context = context or ssl.create_default_context()
+
+    def open(self, url, headers=None):
+        return self._request('GET', url, None, headers)
+
+    def send(self, url, body, headers=None):
+        return self._request('POST', url, body, headers)
+
+    def _connect(self, scheme, host, port):
+        family, kind, protocol, name, address = socket.getaddrinfo(
+            host, port, 0, socket.SOCK_STREAM)[0]
+        tracing.mark('dns')
+        sock = socket.socket(family, kind, protocol)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(address)
+            tracing.mark('connect')
+            if scheme == 'https':
+                sock = self.context.wrap_socket(sock, server_hostname=host)
+                tracing.mark('tls')
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _request(self, method, url, body, headers):
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        port = parts.port or (443 if https else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        connection = http_client.HTTPConnection(parts.hostname, port,
+            timeout=self.timeout)
+        try:
+            connection.sock = self._connect(parts.scheme, parts.hostname,
+                port)
+            connection.request(method, path, body, headers or {})
+            response = connection.getresponse()
+            tracing.mark('first_byte')
+            data = response.read()
+            tracing.mark('transfer')
+            headers = dict((name.lower(), value)
+                for name, value in response.getheaders())
+            return Reply(response.status, headers, data)
+        except http_client.HTTPException as e:
+            raise IOError(e)
+        finally:
+            connection.close()
+
+
+class DNSCache(object):
+    """
+    Remembers the addresses of hosts for ``ttl`` seconds, so new connections
+    to a host skip looking it up. The addresses of a host are forgotten
+    early if none of them can be connected to.
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """
+        Returns the ``getaddrinfo`` results for a TCP connection to ``host``
+        and ``port``.
+        """
+        key = (host, port)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        """Forgets the addresses of ``host`` and ``port``."""
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+class PooledTransport(Transport):
+    """
+    A transport keeping connections open between requests, so calls after
+    the first to a host skip connecting and negotiating TLS. Up to
+    ``max_idle`` idle connections are kept for each host, and closed once
+    idle for ``idle_timeout`` seconds; APIs sharing a transport share its
+    connections. Replies are asked for gzipped if ``compress``, which
+    shrinks the WSDL and large SOAP replies several times over.
+
+    New connections are cheap too. Hosts are looked up through
+    ``dns_cache``, a :class:`DNSCache` of the transport's own by default,
+    and TLS sessions are resumed from the last connection to the same host
+    where the Python version supports it, skipping most of the handshake.
+    TLS uses ``context``, which defaults to the system's default SSL
+    context; keep session tickets enabled on your own.
+
+    Connecting may take ``connect_timeout`` seconds and each read of the
+    reply ``timeout`` seconds. A process forked from one that used the
+    transport, such as a prefork server's worker, starts over with no
+    connections rather than sharing its parent's.
+    """
+    def __init__(self, timeout=60, connect_timeout=10, max_idle=4,
+            idle_timeout=30, compress=True, context=None, dns_cache=None):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.compress = compress
+        self.context = context or ssl.create_default_context()
+        self.dns_cache = dns_cache if dns_cache is not None else DNSCache()
+        self.handshakes = 0
+        self.resumed = 0
+        # Idle connections and when they were returned, keyed by scheme,
+        # host and port, the most recently used last
+        self._idle = {}
+        # The last TLS session with each host and port
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def open(self, url, headers=None):
+        return self._request('GET', url, None, headers)
+
+    def send(self, url, body, headers=None):
+        return self._request('POST', url, body, headers)
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of TLS ``handshakes`` made in
+        full and ``resumed`` from an earlier session, and the ``dns_hits``
+        and ``dns_misses`` of the DNS cache.
+        """
+        with self._lock:
+            return {
+                'handshakes': self.handshakes,
+                'resumed': self.resumed,
+                'dns_hits': self.dns_cache.hits,
+                'dns_misses': self.dns_cache.misses,
+            }
+
+    def close(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def _open_socket(self, host, port):
+        error = None
+        for family, kind, protocol, _, address in \
+                self.dns_cache.resolve(host, port):
+            sock = socket.socket(family, kind, protocol)
+            try:
+                sock.settimeout(self.connect_timeout)
+                sock.connect(address)
+                return sock
+            except socket.error as e:
+                sock.close()
+                error = e
+        self.dns_cache.forget(host, port)
+        raise error
+
+    def _wrap(self, sock, host, port):
+        options = {'server_hostname': host}
+        session = self._sessions.get((host, port))
+        if session is not None:
+            options['session'] = session
+        sock = self.context.wrap_socket(sock, **options)
+        with self._lock:
+            if getattr(sock, 'session_reused', False):
+                self.resumed += 1
+            else:
+                self.handshakes += 1
+        return sock
+
+    def _remember_session(self, key, sock):
+        # TLS 1.3 servers send the session after the handshake, so this is
+        # called once the reply has started, before a closing reply lets go
+        # of the socket
+        session = getattr(sock, 'session', None)
+        if session is not None:
+            self._sessions[key[1:]] = session
+
+    def _connect(self, key):
+        scheme, host, port = key
+        sock = self._open_socket(host, port)
+        try:
+            if scheme == 'https':
+                sock = self._wrap(sock, host, port)
+                connection = http_client.HTTPSConnection(host, port,
+                    context=self.context)
+            else:
+                connection = http_client.HTTPConnection(host, port)
+            sock.settimeout(self.timeout)
+        except Exception:
+            sock.close()
+            raise
+        connection.sock = sock
+        return connection
+
+    def _after_fork(self):
+        # A forked child shares its parent's sockets and TLS state, so
+        # replies to the two would get mixed up; the child forgets them and
+        # the lock, which another thread of the parent may have held
+        pid = os.getpid()
+        if pid != self._pid:
+            self._lock = threading.Lock()
+            self._idle = {}
+            self._sessions = {}
+            self._pid = pid
+
+    def _checkout(self, key):
+        # Returns an idle connection to the host, or a new one
+        self._after_fork()
+        expired = []
+        connection = None
+        with self._lock:
+            connections = self._idle.get(key, [])
+            deadline = time.time() - self.idle_timeout
+            while connections:
+                candidate, returned = connections.pop()
+                if returned < deadline or _dropped(candidate):
+                    expired.append(candidate)
+                else:
+                    connection = candidate
+                    break
+        for candidate in expired:
+            candidate.close()
+        return connection or self._connect(key)
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append((connection, time.time()))
+                return
+        connection.close()
+
+    def _request(self, method, url, body, headers):
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        key = (parts.scheme, parts.hostname,
+            parts.port or (443 if https else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers or {})
+        if self.compress:
+            headers['Accept-Encoding'] = 'gzip'
+        try:
+            connection = self._checkout(key)
+        except (http_client.HTTPException, socket.error) as e:
+            raise IOError(e)
+        # Requests are never sent twice, as a payment may have gone through
+        # even if the connection fails before the response arrives
+        sock = connection.sock
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            if https:
+                self._remember_session(key, sock)
+            data = response.read()
+        except (http_client.HTTPException, socket.error) as e:
+            connection.close()
+            raise IOError(e)
+        headers = dict((name.lower(), value)
+            for name, value in response.getheaders())
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+        if headers.get('content-encoding') == 'gzip':
+            try:
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            except zlib.error as e:
+                raise IOError(e)
+            del headers['content-encoding']
+            headers.pop('content-length', None)
+        return Reply(response.status, headers, data)
+
+
+def _dropped(connection):
+    # An idle connection with something to read has been closed by the
+    # server, or is out of step with it, so can't be used
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (ValueError, select.error):
+        return True
+
+
+def default_transport():
+    """
+    Returns the :class:`PooledTransport` shared by the SOAP APIs of every
+    client not given a transport, creating it the first time.
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = PooledTransport()
+    return _default
+
+
+def set_default_transport(transport):
+    """
+    Installs ``transport`` as the transport shared by the SOAP APIs of
+    clients not given one. Clients already created keep the transport they
+    started with once they have made a call. Pass ``None`` to go back to a
+    new :class:`PooledTransport`.
+    """
+    global _default
+    _default = transport
+
+
+class SudsTransport(SudsBaseTransport):
+    """Adapts a :class:`Transport` for use by a suds client."""
+    def __init__(self, transport):
+        SudsBaseTransport.__init__(self)
+        self.transport = transport
+
+    def open(self, request):
+        reply = self.transport.open(request.url, request.headers)
+        if reply.code != 200:
+            raise TransportError('HTTP {0}'.format(reply.code), reply.code,
+                BytesIO(reply.body))
+        return BytesIO(reply.body)
+
+    def send(self, request):
+        wirelog.capture('request', request.message)
+        reply = self.transport.send(request.url, request.message,
+            request.headers)
+        wirelog.capture('response', reply.body)
+        if reply.code in (202, 204):
+            return None
+        if reply.code != 200:
+            # suds reads SOAP faults from the body of 500 errors
+            raise TransportError('HTTP {0}'.format(reply.code), reply.code,
+                BytesIO(reply.body))
+        return SudsReply(reply.code, reply.headers, reply.body)
@@ -0,0 +1,224 @@
+"""
+Validation checks the arguments of an operation on this side of the wire,
+before any request is built, so a bad amount or subscription interval costs
+nothing but the check. Each operation has a :class:`Validator` holding a
+list of rules, built once when this module is imported; the APIs run it
+first thing, raising
+:class:`AuthorizeInvalidError <authorize.exceptions.AuthorizeInvalidError>`
+with the first problem found.
+
+Bulk jobs can check all their rows up front, getting every problem with
+every row in a single pass::
+
+    >>> from authorize.validation import validate_batch
+    >>> rows = [
+    ...     {'amount': '20.00', 'cvv': '911'},
+    ...     {'amount': '-5', 'cvv': 'abc'},
+    ... ]
+    >>> validate_batch('cim.AUTH_CAPTURE', rows)
+    [(1, ['The amount must be at least 0.01.', 'CVV Must be a number.'])]
+
+Operations are named by API and gateway operation, as for
+:mod:`rate limits <authorize.limiter>`. Saved card transactions, which all
+use ``CreateCustomerProfileTransaction``, are named by their transaction
+type: ``'cim.AUTH_ONLY'``, ``'cim.AUTH_CAPTURE'`` and ``'cim.CREDIT'``. The
+rows' keys are the names of the API methods' arguments.
+"""
+from datetime import date
+import re
+
+from authorize.data import Money, to_cents
+from authorize.exceptions import AuthorizeInvalidError
+
+
+_CVV_RE = re.compile(r'\d{3,4}$')
+
+
+def amount(name, minimum=1, optional=False):
+    """
+    A rule that ``name`` is an amount in whole cents of at least
+    ``minimum`` cents. It may be left out if ``optional``.
+    """
+    label = name.replace('_', ' ')
+    low = str(Money(minimum))
+
+    def check(args):
+        value = args.get(name)
+        if value is None:
+            return None if optional else 'The {0} is required.'.format(label)
+        try:
+            cents = to_cents(value)
+        except AuthorizeInvalidError as e:
+            return e.args[0]
+        if cents < minimum:
+            return 'The {0} must be at least {1}.'.format(label, low)
+    return check
+
+
+def integer(name, minimum, maximum, message):
+    """
+    A rule that ``name``, if given, is an integer from ``minimum`` to
+    ``maximum``, failing with ``message``.
+    """
+    def check(args):
+        value = args.get(name)
+        if value is None:
+            return None
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return message
+        if not minimum <= value <= maximum:
+            return message
+    return check
+
+
+def not_past(name, message):
+    """A rule that the date ``name``, if given, is not before today."""
+    def check(args):
+        value = args.get(name)
+        if value is not None and value < date.today():
+            return message
+    return check
+
+
+def cvv(name='cvv'):
+    """A rule that ``name``, if given, is a three or four digit CVV."""
+    def check(args):
+        value = args.get(name)
+        if value is not None and not _CVV_RE.match(str(value)):
+            return 'CVV Must be a number.'
+    return check
+
+
+def card_names(name, message):
+    """
+    A rule that the :class:`CreditCard <authorize.data.CreditCard>`
+    ``name`` has a first and last name.
+    """
+    def check(args):
+        card = args.get(name)
+        if card is None or not (card.first_name and card.last_name):
+            return message
+    return check
+
+
+def exactly_one(names, message):
+    """A rule that exactly one of ``names`` is given."""
+    def check(args):
+        if sum(1 for name in names if args.get(name)) != 1:
+            return message
+    return check
+
+
+def together(names, message):
+    """A rule that either all of ``names`` are given or none are."""
+    def check(args):
+        if len(set(bool(args.get(name)) for name in names)) > 1:
+            return message
+    return check
+
+
+class Validator(object):
+    """
+    Checks the arguments of ``operation`` against ``rules``, functions
+    taking the arguments as a dictionary and returning an error message, or
+    ``None`` if they pass.
+    """
+    def __init__(self, operation, rules):
+        self.operation = operation
+        self.rules = tuple(rules)
+
+    def __repr__(self):
+        return '<Validator {0}>'.format(self.operation)
+
+    def errors(self, args):
+        """Returns the messages of every rule ``args`` fail."""
+        return [error for error in (rule(args) for rule in self.rules)
+            if error]
+
+    def validate(self, **args):
+        """
+        Raises :class:`AuthorizeInvalidError
+        <authorize.exceptions.AuthorizeInvalidError>` with the message of the
+        first rule the arguments fail.
+        """
+        for rule in self.rules:
+            error = rule(args)
+            if error:
+                raise AuthorizeInvalidError(error)
+
+    def validate_batch(self, rows):
+        """
+        Checks each of ``rows``, dictionaries of arguments, returning an
+        ``(index, errors)`` pair for each row failing any rule.
+        """
+        results = []
+        for index, row in enumerate(rows):
+            errors = self.errors(row)
+            if errors:
+                results.append((index, errors))
+        return results
+
+
+_START = not_past('start', 'The start date for the subscription may not be '
+    'in the past.')
+_DAYS = integer('days', 7, 365, 'The interval days must be an integer value '
+    'between 7 and 365.')
+_MONTHS = integer('months', 1, 12, 'The interval months must be an integer '
+    'value between 1 and 12.')
+_OCCURRENCES = integer('occurrences', 1, 9999, 'The occurrences must be an '
+    'integer value between 1 and 9999.')
+_TRIAL_OCCURRENCES = integer('trial_occurrences', 1, 99, 'The trial '
+    'occurrences must be an integer value between 1 and 99.')
+
+VALIDATORS = dict((v.operation, v) for v in [
+    # Zero dollar authorizations verify a card without holding funds
+    Validator('aim.AUTH_ONLY', [amount('amount', minimum=0)]),
+    Validator('aim.AUTH_CAPTURE', [amount('amount')]),
+    Validator('aim.PRIOR_AUTH_CAPTURE', [amount('amount', optional=True)]),
+    Validator('aim.CREDIT', [amount('amount')]),
+    Validator('cim.AUTH_ONLY', [amount('amount', minimum=0), cvv()]),
+    Validator('cim.AUTH_CAPTURE', [amount('amount'), cvv()]),
+    Validator('cim.CREDIT', [amount('amount')]),
+    Validator('arb.ARBCreateSubscription', [
+        card_names('credit_card', 'Subscriptions require first name and '
+            'last name to be provided with the credit card.'),
+        amount('amount'),
+        exactly_one(['days', 'months'], 'Please provide either the months '
+            'or days argument to define the subscription interval.'),
+        _DAYS,
+        _MONTHS,
+        _START,
+        _OCCURRENCES,
+        together(['trial_amount', 'trial_occurrences'], 'To indicate a '
+            'trial period, you must provide both a trial amount and '
+            'occurrences.'),
+        amount('trial_amount', minimum=0, optional=True),
+        _TRIAL_OCCURRENCES,
+    ]),
+    Validator('arb.ARBUpdateSubscription', [
+        amount('amount', optional=True),
+        _START,
+        _OCCURRENCES,
+        amount('trial_amount', minimum=0, optional=True),
+        _TRIAL_OCCURRENCES,
+    ]),
+])
+
+
+def validate(operation, **args):
+    """
+    Validates the arguments of ``operation`` with its :class:`Validator`,
+    raising :class:`AuthorizeInvalidError
+    <authorize.exceptions.AuthorizeInvalidError>` if they fail.
+    """
+    VALIDATORS[operation].validate(**args)
+
+
+def validate_batch(operation, rows):
+    """
+    Checks the arguments of ``operation`` in each of ``rows``, returning an
+    ``(index, errors)`` pair for each invalid row.
+    """
+    return VALIDATORS[operation].validate_batch(rows)
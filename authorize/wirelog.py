@@ -0,0 +1,170 @@
+"""
+The wire log records what went over the wire in calls to Authorize.net,
+for troubleshooting in production without turning on suds' or urllib's
+debug logging, which writes out whole requests, card numbers included, in
+the thread making the payment.
+
+Each logged call is a JSON record of its API and operation, how long it
+took, its error if any, and the start of its request and response bodies
+with card numbers, CVVs and transaction keys masked by :func:`scrub
+<authorize.scrub.scrub>`. Only a sample of calls is logged, along with
+every call that fails or is slow; the payment path only decides whether to
+keep a call and hands it over, while masking and formatting happen on a
+background thread::
+
+    >>> from authorize.wirelog import set_wire_logger, WireLogger
+    >>> set_wire_logger(WireLogger(sample_rate=0.001, slow=2.0))
+
+Records go to the ``authorize.wire`` logger by default, at ``INFO`` level,
+or ``WARNING`` for failed calls. When the background thread falls behind,
+calls are dropped rather than waited for, and counted in ``dropped``.
+Reports from the Transaction Details API are streamed page by page rather
+than timed as single calls, and are not logged.
+"""
+import json
+import logging
+import random
+import threading
+
+from six.moves.queue import Full, Queue
+
+from authorize import timing
+from authorize.scrub import scrub
+
+
+_wire_logger = None
+_local = threading.local()
+
+
+def set_wire_logger(wire_logger):
+    """
+    Installs ``wire_logger`` for the whole process. Pass ``None`` to turn
+    wire logging off again.
+    """
+    global _wire_logger
+    if _wire_logger is not None:
+        timing.remove_listener(_wire_logger)
+    _wire_logger = wire_logger
+    if wire_logger is not None:
+        timing.add_listener(wire_logger)
+
+
+def get_wire_logger():
+    """Returns the installed wire logger, or ``None``."""
+    return _wire_logger
+
+
+def capture(kind, body):
+    """
+    Keeps ``body``, the ``'request'`` or ``'response'`` body of the call
+    being timed in this thread, for the wire logger. Does nothing unless a
+    wire logger is installed.
+    """
+    if _wire_logger is None:
+        return
+    call = timing.current()
+    if call is None:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None or pending[0] is not call:
+        pending = _local.pending = (call, {})
+    pending[1][kind] = body
+
+
+def captured(call):
+    """
+    Returns and forgets the bodies kept in this thread for ``call``, a
+    :class:`CallTiming <authorize.timing.CallTiming>`, as a dictionary.
+    """
+    pending = getattr(_local, 'pending', None)
+    if pending is None or call is None or pending[0] is not call:
+        return {}
+    _local.pending = None
+    return pending[1]
+
+
+def _text(body, limit):
+    # Scrubs before cutting the body short, so no part of a card number is
+    # left behind at the cut
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    return scrub(body)[:limit]
+
+
+class WireLogger(object):
+    """
+    A :mod:`timing <authorize.timing>` listener logging a sample of calls,
+    ``sample_rate`` of them, along with every call that fails or takes
+    ``slow`` seconds or more. Up to ``max_body`` characters of each body
+    are logged to ``logger``, which defaults to the ``authorize.wire``
+    logger. Up to ``queue_size`` calls wait for the background thread.
+    """
+    def __init__(self, sample_rate=0.001, slow=2.0, max_body=2048,
+            logger=None, queue_size=1000):
+        self.sample_rate = sample_rate
+        self.slow = slow
+        self.max_body = max_body
+        self.logger = logger or logging.getLogger('authorize.wire')
+        self.dropped = 0
+        self._queue = Queue(queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __call__(self, call):
+        pending = getattr(_local, 'pending', None)
+        _local.pending = None
+        bodies = pending[1] if pending and pending[0] is call else {}
+        if call.error is None and call.total < self.slow and \
+                random.random() >= self.sample_rate:
+            return
+        self._start()
+        try:
+            self._queue.put_nowait((call, bodies))
+        except Full:
+            self.dropped += 1
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._run,
+                        name='authorize-wirelog')
+                    thread.daemon = True
+                    thread.start()
+                    self._thread = thread
+
+    def _run(self):
+        while True:
+            call, bodies = self._queue.get()
+            try:
+                self.write(call, bodies)
+            except Exception:
+                self.logger.exception('Could not log a call.')
+            finally:
+                self._queue.task_done()
+
+    def record(self, call, bodies):
+        """
+        Returns the record of ``call``, a :class:`CallTiming
+        <authorize.timing.CallTiming>`, and its ``bodies``, a dictionary of
+        its ``'request'`` and ``'response'`` bodies.
+        """
+        record = call.to_dict()
+        if record['error'] is not None:
+            record['error'] = scrub(record['error'])
+        for kind in ('request', 'response'):
+            body = bodies.get(kind)
+            if body is not None:
+                record[kind] = _text(body, self.max_body)
+                record[kind + '_size'] = len(body)
+        return record
+
+    def write(self, call, bodies):
+        """Logs the record of ``call``; runs on the background thread."""
+        level = logging.INFO if call.error is None else logging.WARNING
+        self.logger.log(level, json.dumps(self.record(call, bodies),
+            sort_keys=True))
+
+    def flush(self):
+        """Waits for every call handed over so far to be logged."""
+        self._queue.join()
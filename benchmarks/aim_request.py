@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Compares the cost of an AIM call the way TransactionAPI used to make it
+(copying the base parameters, filtering a dictionary and urlencoding
+everything on every call) against the shipped code path, which runs
+``TransactionAPI.capture`` through ``_make_call`` with its pre-encoded
+prefix. The network is left out: ``_send`` is replaced by a stub returning
+an approved response, which both paths parse.
+
+Run from the repository root::
+
+    python benchmarks/aim_request.py
+"""
+from __future__ import print_function
+
+from datetime import date
+from decimal import Decimal
+import os
+import sys
+import timeit
+
+from six import b, text_type
+from six.moves.urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from authorize.apis.transaction import parse_response, TransactionAPI
+from authorize.data import Address, CreditCard
+
+
+RESPONSE = ';'.join(['1', '1', '1', 'This transaction has been approved.',
+    'IKRAGJ', 'Y', '2171062816', '', '', '20.00', 'CC', 'auth_capture'] +
+    [''] * 26 + ['P'])
+
+
+def send(body):
+    return RESPONSE
+
+
+def legacy_body(api, amount, credit_card, address, email=None):
+    def safe_unicode_to_str(string):
+        try:
+            return str(string)
+        except UnicodeEncodeError:
+            return string.encode('utf-8')
+
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    params = api.base_params.copy()
+    params.update({
+        'x_card_num': credit_card.card_number,
+        'x_exp_date': credit_card.expiration.strftime('%m-%Y'),
+        'x_card_code': credit_card.cvv,
+        'x_first_name': credit_card.first_name,
+        'x_last_name': credit_card.last_name,
+    })
+    if email:
+        params['x_email'] = email
+    params.update({
+        'x_address': address.street,
+        'x_city': address.city,
+        'x_state': address.state,
+        'x_zip': address.zip_code,
+        'x_country': address.country,
+    })
+    for key, value in list(params.items()):
+        if value is None:
+            del params[key]
+    params['x_type'] = 'AUTH_CAPTURE'
+    params['x_amount'] = str(amount)
+    converted = {}
+    for key, value in params.items():
+        if isinstance(key, text_type):
+            key = safe_unicode_to_str(key)
+        if isinstance(value, text_type):
+            value = safe_unicode_to_str(value)
+        converted[key] = value
+    return b(urlencode(converted))
+
+
+def legacy_call(api, amount, credit_card, address, email=None):
+    return parse_response(send(legacy_body(api, amount, credit_card,
+        address, email)))
+
+
+def current_call(api, amount, credit_card, address, email=None):
+    return api.capture(amount, credit_card, address, email)
+
+
+def peak_bytes(func, args, calls=1000):
+    """
+    Returns the average peak memory allocated by one call, or ``None`` if
+    this Python can't measure it (tracemalloc.reset_peak needs Python 3.9).
+    """
+    try:
+        import tracemalloc
+        tracemalloc.reset_peak
+    except (ImportError, AttributeError):
+        return None
+    func(*args)
+    tracemalloc.start()
+    total = 0
+    for _ in range(calls):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func(*args)
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total // calls
+
+
+def main(number=20000):
+    api = TransactionAPI('285tUPuS', '58JKJ4T95uee75wd')
+    api._send = send
+    credit_card = CreditCard('4111111111111111', date.today().year + 5, 1,
+        '911', 'Jeff', 'Schenck')
+    address = Address('45 Rose Ave', 'Venice', 'CA', '90291')
+    args = (api, 20, credit_card, address)
+    for name, func in (('legacy', legacy_call), ('current', current_call)):
+        seconds = min(timeit.repeat(lambda: func(*args), number=number,
+            repeat=3))
+        print('{0:>8}: {1:6.2f} us/call'.format(
+            name, seconds / number * 1e6))
+        peak = peak_bytes(func, args)
+        if peak is not None:
+            print('{0:>8}  {1:6d} bytes peak/call'.format('', peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -69,6 +69,9 @@ setup(
     description='An awesome-sauce Python library for accessing the Authorize.net API. Sweet!',
     long_description=__doc__,
     license='MIT',
+    # ssl.create_default_context, used by the connection pool, is new in
+    # Python 2.7.9 and 3.4
+    python_requires='>=2.7.9, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*',
     install_requires=[
         'suds-jurko>=0.6',
         'six>=1.9.0',
@@ -77,19 +80,17 @@ setup(
         'authorize',
         'authorize.apis',
     ],
+    package_data={
+        'authorize': ['wsdl/*.wsdl', 'bin_ranges.csv'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
         'Environment :: Web Environment',
         'Intended Audience :: Developers',
         'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.5',
-        'Programming Language :: Python :: 2.6',
         'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.1',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
         'Programming Language :: Python :: 3.4',
         'License :: OSI Approved :: MIT License',
         'Topic :: Office/Business :: Financial',
@@ -10,6 +10,7 @@ from authorize.apis.customer import CustomerAPI, PROD_URL, TEST_URL
 from authorize.data import Address, CreditCard
 from authorize.exceptions import AuthorizeConnectionError, \
     AuthorizeResponseError
+from authorize.transport import default_transport
 
 
 class AttrDict(dict):
@@ -117,6 +118,8 @@ class CustomerAPITests(TestCase):
         self.assertEqual(self.Client.call_args, None)
         client_ = api.client
         self.assertEqual(self.Client.call_args[0][0], TEST_URL)
+        transport = self.Client.call_args[1]['transport']
+        self.assertTrue(transport.transport is default_transport())
         client_auth = api.client_auth
         self.assertEqual(client_auth.name, '123')
         self.assertEqual(client_auth.transactionKey, '456')
@@ -128,6 +131,30 @@ class CustomerAPITests(TestCase):
         self.assertEqual(self.api.client.service.TestService.call_args[0],
             (self.api.client_auth, 'foo'))
 
+    def test_make_call_hedged(self):
+        self.api.hedger = mock.Mock()
+        self.api.hedger.run.return_value = SUCCESS
+        self.api.client.service.GetCustomerProfile.return_value = SUCCESS
+        self.api._make_call('GetCustomerProfile', 'foo')
+        primary, hedge = self.api.hedger.run.call_args[0]
+        self.assertFalse(self.api.client.service.GetCustomerProfile.called)
+        # The second request takes its own limiter slot
+        self.api.limiter = mock.MagicMock()
+        self.assertEqual(hedge(), SUCCESS)
+        self.assertEqual(self.api.limiter.slot.call_args[0],
+            ('cim', 'GetCustomerProfile'))
+        self.assertEqual(primary(), SUCCESS)
+        self.assertEqual(self.api.limiter.slot.call_count, 1)
+        self.assertEqual(
+            self.api.client.service.GetCustomerProfile.call_args[0],
+            (self.api.client_auth, 'foo'))
+
+        # Only read-only operations are hedged
+        self.api.hedger.reset_mock()
+        self.api.client.service.TestService.return_value = SUCCESS
+        self.api._make_call('TestService', 'foo')
+        self.assertFalse(self.api.hedger.run.called)
+
     def test_make_call_connection_error(self):
         self.api.client.service.TestService.side_effect = WebFault('a', 'b')
         self.assertRaises(AuthorizeConnectionError, self.api._make_call,
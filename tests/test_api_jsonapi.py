@@ -0,0 +1,113 @@
+from datetime import date
+import json
+
+from unittest2 import TestCase
+import mock
+
+from authorize.apis.jsonapi import JSONCustomerAPI, JSONRecurringAPI, \
+    request_name, TEST_URL
+from authorize.data import CreditCard
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeInvalidError, AuthorizeResponseError
+from authorize.transport import Reply
+from test_api_transaction import PARSED_SUCCESS, SUCCESS
+
+
+def reply(content, code=200):
+    body = b'\xef\xbb\xbf' + json.dumps(content).encode('utf-8')
+    return Reply(code, {'content-type': 'application/json'}, body)
+
+
+OK = {'messages': {'resultCode': 'Ok',
+    'message': [{'code': 'I00001', 'text': 'Successful.'}]}}
+ERROR = {'messages': {'resultCode': 'Error',
+    'message': [{'code': 'E00040', 'text': 'The record cannot be found.'}]}}
+
+
+class JSONAPITests(TestCase):
+    def setUp(self):
+        self.api = JSONCustomerAPI('123', '456')
+        self.api.transport = mock.Mock()
+        self.year = date.today().year + 10
+        self.credit_card = CreditCard('4111111111111111', self.year, 1, '911',
+            'Jeff', 'Schenck')
+
+    def sent(self):
+        url, body, headers = self.api.transport.send.call_args[0]
+        self.assertEqual(url, TEST_URL)
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        return body.decode('utf-8')
+
+    def test_request_name(self):
+        self.assertEqual(request_name('GetCustomerProfile'),
+            'getCustomerProfileRequest')
+        self.assertEqual(request_name('ARBCancelSubscription'),
+            'ARBCancelSubscriptionRequest')
+
+    def test_create_saved_profile(self):
+        self.api.transport.send.return_value = reply(dict(OK,
+            customerProfileId='100', customerPaymentProfileIdList=['200']))
+        payment = self.api.create_saved_payment(self.credit_card)
+        self.assertEqual(self.api.create_saved_profile('abc', [payment],
+            'joe@example.com'), ('100', ['200']))
+        self.assertEqual(self.sent(),
+            '{"createCustomerProfileRequest":{"merchantAuthentication":'
+            '{"name":"123","transactionKey":"456"},"profile":'
+            '{"merchantCustomerId":"abc","email":"joe@example.com",'
+            '"paymentProfiles":[{"customerType":"individual","billTo":'
+            '{"firstName":"Jeff","lastName":"Schenck"},"payment":'
+            '{"creditCard":{"cardNumber":"4111111111111111",'
+            '"expirationDate":"' + str(self.year) + '-01",'
+            '"cardCode":"911"}}}]},"validationMode":"none"}}')
+
+    def test_capture(self):
+        self.api.transport.send.return_value = reply(dict(OK,
+            directResponse=SUCCESS.getvalue().decode('ascii')))
+        self.assertEqual(self.api.capture('100', '200', 20, '911'),
+            PARSED_SUCCESS)
+        request = json.loads(self.sent())[
+            'createCustomerProfileTransactionRequest']
+        self.assertEqual(request['transaction'], {'profileTransAuthCapture':
+            {'amount': '20.00', 'customerProfileId': '100',
+                'customerPaymentProfileId': '200', 'cardCode': '911'}})
+        self.assertTrue('x_delim_char=%3B' in request['extraOptions'])
+        self.assertRaises(AuthorizeInvalidError, self.api.capture,
+            '100', '200', 20, 'abc')
+
+    def test_error_response(self):
+        self.api.transport.send.return_value = reply(ERROR)
+        try:
+            self.api.delete_saved_profile('100')
+        except AuthorizeResponseError as e:
+            self.assertEqual(e.full_response['response_code'], 'E00040')
+        else:
+            self.fail('AuthorizeResponseError not raised')
+
+    def test_connection_errors(self):
+        self.api.transport.send.return_value = reply(OK, code=500)
+        self.assertRaises(AuthorizeConnectionError,
+            self.api.delete_saved_profile, '100')
+        self.api.transport.send.return_value = Reply(200, {}, b'<html>')
+        self.assertRaises(AuthorizeConnectionError,
+            self.api.delete_saved_profile, '100')
+
+    @mock.patch('authorize.apis.jsonapi.urlopen')
+    def test_urlopen(self, urlopen):
+        urlopen.return_value = mock.Mock(read=lambda: reply(OK).body)
+        self.api.transport = None
+        self.api.delete_saved_payment('100', '200')
+        self.assertEqual(urlopen.call_args[0][0].get_full_url(), TEST_URL)
+        self.assertTrue(urlopen.return_value.close.called)
+
+    def test_update_subscription(self):
+        api = JSONRecurringAPI('123', '456')
+        api.transport = mock.Mock()
+        api.transport.send.return_value = reply(OK)
+        api.update_subscription('300', amount=25, occurrences=12)
+        request = json.loads(api.transport.send.call_args[0][1].decode(
+            'utf-8'))['ARBUpdateSubscriptionRequest']
+        self.assertEqual(request['subscriptionId'], '300')
+        self.assertEqual(request['subscription'], {'amount': '25.00',
+            'paymentSchedule': {'totalOccurrences': 12}})
+        self.assertRaises(AuthorizeInvalidError, api.create_subscription,
+            self.credit_card, 10, date.today())
@@ -9,6 +9,7 @@ from authorize.apis.recurring import PROD_URL, RecurringAPI, TEST_URL
 from authorize.data import CreditCard
 from authorize.exceptions import AuthorizeConnectionError, \
     AuthorizeInvalidError, AuthorizeResponseError
+from authorize.transport import default_transport
 
 
 class AttrDict(dict):
@@ -58,6 +59,8 @@ class RecurringAPITests(TestCase):
         self.assertEqual(self.Client.call_args, None)
         client_ = api.client
         self.assertEqual(self.Client.call_args[0][0], TEST_URL)
+        transport = self.Client.call_args[1]['transport']
+        self.assertTrue(transport.transport is default_transport())
         client_auth = api.client_auth
         self.assertEqual(client_auth.name, '123')
         self.assertEqual(client_auth.transactionKey, '456')
@@ -0,0 +1,225 @@
+from datetime import date, datetime
+
+from xml.etree.ElementTree import fromstring
+
+from six import BytesIO
+from unittest2 import TestCase
+import mock
+
+from authorize import AuthorizeClient
+from authorize.apis.reporting import element_to_dict, field_name, \
+    FIELD_NAMES, ReportingAPI, TEST_URL
+from authorize.breaker import CircuitBreaker
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeResponseError
+from authorize.limiter import Limit, RateLimiter
+from authorize.scheduler import Scheduler
+
+
+HEADER = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<{0} xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">'
+    b'<messages><resultCode>Ok</resultCode><message><code>I00001</code>'
+    b'<text>Successful.</text></message></messages>'
+)
+TRANSACTION = (
+    b'<transaction><transId>{0}</transId>'
+    b'<submitTimeUTC>2017-05-01T16:01:51Z</submitTimeUTC>'
+    b'<transactionStatus>settledSuccessfully</transactionStatus>'
+    b'<invoiceNumber>INV{0}</invoiceNumber>'
+    b'<accountType>Visa</accountType><accountNumber>XXXX1111</accountNumber>'
+    b'<settleAmount>20.00</settleAmount></transaction>'
+)
+
+
+def transaction_list(*ids):
+    name = b'getTransactionListResponse'
+    return BytesIO(HEADER.replace(b'{0}', name) + b'<transactions>' +
+        b''.join(TRANSACTION.replace(b'{0}', str(i).encode('ascii'))
+            for i in ids) +
+        b'</transactions><totalNumInResultSet>' +
+        str(len(ids)).encode('ascii') + b'</totalNumInResultSet></' + name +
+        b'>')
+
+
+BATCHES = (HEADER.replace(b'{0}', b'getSettledBatchListResponse') + (
+    b'<batchList><batch><batchId>111</batchId>'
+    b'<settlementTimeUTC>2017-05-02T06:00:00Z</settlementTimeUTC>'
+    b'<settlementState>settledSuccessfully</settlementState>'
+    b'<paymentMethod>creditCard</paymentMethod></batch>'
+    b'<batch><batchId>112</batchId>'
+    b'<settlementState>settledSuccessfully</settlementState></batch>'
+    b'</batchList></getSettledBatchListResponse>'))
+
+DETAILS = (HEADER.replace(b'{0}', b'getTransactionDetailsResponse') + (
+    b'<transaction><transId>2171062816</transId>'
+    b'<transactionType>authCaptureTransaction</transactionType>'
+    b'<responseCode>1</responseCode><authCode>IKRAGJ</authCode>'
+    b'<AVSResponse>Y</AVSResponse><cardCodeResponse>P</cardCodeResponse>'
+    b'<batch><batchId>111</batchId></batch>'
+    b'<order><invoiceNumber>INV1</invoiceNumber></order>'
+    b'<settleAmount>20.00</settleAmount>'
+    b'<lineItems><lineItem><itemId>1</itemId></lineItem>'
+    b'<lineItem><itemId>2</itemId></lineItem></lineItems>'
+    b'</transaction></getTransactionDetailsResponse>'))
+
+ERROR = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<ErrorResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">'
+    b'<messages><resultCode>Error</resultCode><message><code>E00007</code>'
+    b'<text>User authentication failed due to invalid authentication '
+    b'values.</text></message></messages></ErrorResponse>')
+
+
+class ReportingAPITests(TestCase):
+    def setUp(self):
+        self.patcher = mock.patch('authorize.apis.reporting.urlopen')
+        self.urlopen = self.patcher.start()
+        self.api = ReportingAPI('123', '456')
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def request_body(self, call=-1):
+        return self.urlopen.call_args_list[call][0][0].data.decode('utf-8')
+
+    def test_field_name(self):
+        self.assertEqual(field_name('{ns}transId'), 'transaction_id')
+        self.assertEqual(field_name('invoiceNumber'), 'invoice_number')
+        self.assertEqual(field_name('AVSResponse'), 'avs_response')
+        self.assertFalse('invoiceNumber' in FIELD_NAMES)
+
+    def test_batch_transactions_paged(self):
+        self.urlopen.side_effect = [transaction_list(1, 2),
+            transaction_list(3)]
+        transactions = self.api.batch_transactions('111', page_size=2)
+        self.assertEqual(self.urlopen.call_count, 0)
+        first = next(transactions)
+        self.assertEqual(self.urlopen.call_count, 1)
+        self.assertEqual(first, {
+            'transaction_id': '1',
+            'submitted': '2017-05-01T16:01:51Z',
+            'status': 'settledSuccessfully',
+            'invoice_number': 'INV1',
+            'account_type': 'Visa',
+            'account_number': 'XXXX1111',
+            'amount': '20.00',
+        })
+        ids = [t['transaction_id'] for t in transactions]
+        self.assertEqual(ids, ['2', '3'])
+        self.assertEqual(self.urlopen.call_count, 2)
+        self.assertEqual(self.urlopen.call_args[0][0].get_full_url(),
+            TEST_URL)
+        body = self.request_body()
+        self.assertTrue(body.startswith('<?xml'))
+        self.assertTrue('<getTransactionListRequest' in body)
+        self.assertTrue('<name>123</name><transactionKey>456'
+            '</transactionKey>' in body)
+        self.assertTrue('<batchId>111</batchId>' in body)
+        self.assertTrue('<paging><limit>2</limit><offset>2</offset>'
+            '</paging>' in body)
+
+    def test_unsettled_transactions(self):
+        self.urlopen.return_value = transaction_list()
+        self.assertEqual(list(self.api.unsettled_transactions()), [])
+        self.assertTrue('<getUnsettledTransactionListRequest' in
+            self.request_body())
+
+    def test_settled_batches(self):
+        self.urlopen.side_effect = lambda *args: BytesIO(BATCHES)
+        batches = list(self.api.settled_batches(date(2017, 1, 1),
+            datetime(2017, 2, 15, 12)))
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(batches[0]['batch_id'], '111')
+        self.assertEqual(batches[0]['settled'], '2017-05-02T06:00:00Z')
+        self.assertEqual(self.urlopen.call_count, 2)
+        first = self.request_body(0)
+        self.assertTrue('<firstSettlementDate>2017-01-01T00:00:00Z'
+            '</firstSettlementDate>' in first)
+        self.assertTrue('<lastSettlementDate>2017-01-31T23:59:59Z'
+            '</lastSettlementDate>' in first)
+        self.assertTrue('<firstSettlementDate>2017-02-01T00:00:00Z'
+            '</firstSettlementDate>' in self.request_body(1))
+
+    def test_transaction_details(self):
+        self.urlopen.return_value = BytesIO(DETAILS)
+        details = self.api.transaction_details('2171062816')
+        self.assertEqual(details['transaction_id'], '2171062816')
+        self.assertEqual(details['authorization_code'], 'IKRAGJ')
+        self.assertEqual(details['cvv_response'], 'P')
+        self.assertEqual(details['batch'], {'batch_id': '111'})
+        self.assertEqual(details['order']['invoice_number'], 'INV1')
+        self.assertEqual(details['line_items']['line_item'],
+            [{'item_id': '1'}, {'item_id': '2'}])
+
+    def test_error_response(self):
+        self.urlopen.return_value = BytesIO(ERROR)
+        try:
+            list(self.api.unsettled_transactions())
+        except AuthorizeResponseError as e:
+            self.assertEqual(e.full_response['response_code'], 'E00007')
+        else:
+            self.fail('AuthorizeResponseError not raised')
+
+    def test_connection_error(self):
+        self.urlopen.side_effect = IOError('Borked')
+        self.assertRaises(AuthorizeConnectionError, list,
+            self.api.batch_transactions('111'))
+
+    def test_invalid_response(self):
+        self.api.breaker = CircuitBreaker('reporting')
+        for body in (DETAILS[:200], b'<html><body>Bad gateway'):
+            self.urlopen.return_value = BytesIO(body)
+            self.assertRaises(AuthorizeConnectionError,
+                self.api.transaction_details, '2171062816')
+        self.assertEqual(self.api.breaker.stats()['failures'], 2)
+
+    def test_breaker_covers_read(self):
+        self.api.breaker = CircuitBreaker('reporting')
+        self.urlopen.return_value = BytesIO(DETAILS)
+        self.api.transaction_details('2171062816')
+        transactions = self.api.batch_transactions('111')
+        self.urlopen.return_value = transaction_list(1, 2)
+        next(transactions)
+        transactions.close()
+        stats = self.api.breaker.stats()
+        self.assertEqual((stats['calls'], stats['failures']), (2, 0))
+
+        class Broken(object):
+            def read(self, size=-1):
+                raise IOError('Connection reset')
+
+            def close(self):
+                pass
+        self.urlopen.return_value = Broken()
+        self.assertRaises(AuthorizeConnectionError, list,
+            self.api.unsettled_transactions())
+        self.assertEqual(self.api.breaker.stats()['failures'], 1)
+
+    def test_client(self):
+        self.urlopen.side_effect = [BytesIO(BATCHES), transaction_list(1, 2),
+            transaction_list(3)]
+        client = AuthorizeClient('123', '456')
+        transactions = list(client.settled_transactions(date(2017, 5, 1),
+            date(2017, 5, 2)))
+        self.assertEqual([(t['batch_id'], t['transaction_id'])
+            for t in transactions], [('111', '1'), ('111', '2'),
+            ('112', '3')])
+
+    def test_slots_released_between_pages(self):
+        # Details fetched while iterating must not wait on the list's slot
+        self.urlopen.side_effect = [BytesIO(BATCHES), BytesIO(DETAILS),
+            BytesIO(DETAILS)]
+        client = AuthorizeClient('123', '456',
+            scheduler=Scheduler(capacity=1),
+            limiter=RateLimiter({'reporting': Limit(max_in_flight=1)}))
+        details = [client.transaction(batch['batch_id']).details()
+            for batch in client.settled_batches(date(2017, 5, 1),
+                date(2017, 5, 2))]
+        self.assertEqual([d['transaction_id'] for d in details],
+            ['2171062816', '2171062816'])
+        self.assertEqual(client._reporting.scheduler.stats()['in_flight'], 0)
+
+    def test_element_to_dict_empty(self):
+        self.assertEqual(element_to_dict(fromstring(
+            '<a><firstName/></a>')), {'first_name': ''})
@@ -6,10 +6,12 @@ from six.moves.urllib.parse import parse_qsl, urlencode
 from unittest2 import TestCase
 import mock
 
-from authorize.apis.transaction import PROD_URL, TEST_URL, TransactionAPI
-from authorize.data import Address, CreditCard
-from authorize.exceptions import AuthorizeConnectionError, \
-    AuthorizeResponseError
+from authorize.apis.transaction import encode_fields, parse_response, \
+    PROD_URL, TEST_URL, TransactionAPI
+from authorize.breaker import CircuitBreaker
+from authorize.data import Address, CreditCard, Money
+from authorize.exceptions import AuthorizeCircuitOpenError, \
+    AuthorizeConnectionError, AuthorizeInvalidError, AuthorizeResponseError
 
 
 class MockResponse(BytesIO):
@@ -90,8 +92,10 @@ class TransactionAPITests(TestCase):
     def test_make_call(self, urlopen):
         urlopen.side_effect = self.success
         params = {'a': '1', 'b': '2'}
-        result = self.api._make_call(params)
+        result = self.api._make_call('AUTH_ONLY', params)
         self.assertEqual(urlopen.call_args[0][0], TEST_URL)
+        params.update(self.api.base_params)
+        params['x_type'] = 'AUTH_ONLY'
         self.assertTrue(_are_params_eq(
             urlopen.call_args[1]['data'], urlencode(params)
         ))
@@ -100,24 +104,57 @@ class TransactionAPITests(TestCase):
     @mock.patch('authorize.apis.transaction.urlopen')
     def test_make_call_with_unicode(self, urlopen):
         urlopen.side_effect = self.success
-        result = self.api._make_call({u('\xe3'): '1', 'b': u('\xe3')})
+        result = self.api._make_call(None, {u('\xe3'): '1', 'b': u('\xe3')})
         self.assertEqual(urlopen.call_args[0][0], TEST_URL)
         self.assertTrue(_are_params_eq(
-            urlopen.call_args[1]['data'], 'b=%C3%A3&%C3%A3=1'
+            urlopen.call_args[1]['data'],
+            urlencode(self.api.base_params) + '&b=%C3%A3&%C3%A3=1'
         ))
         self.assertEqual(result, PARSED_SUCCESS)
 
+    def test_parse_response_interned(self):
+        text = SUCCESS.getvalue().decode('ascii')
+        first = parse_response(text)
+        second = parse_response(''.join(list(text)))
+        self.assertEqual(first, second)
+        self.assertTrue(first['response_reason_text'] is
+            second['response_reason_text'])
+        self.assertFalse(first['transaction_id'] is second['transaction_id'])
+
+    def test_encode_fields(self):
+        self.assertEqual(encode_fields([]), b'')
+        self.assertEqual(encode_fields([
+            ('x_amount', '20.00'), ('x_email', None), ('x_address', 'a b&c'),
+            (u('\xe3'), u('\xe3')), ('x_trans_id', 123),
+        ]), b'&x_amount=20.00&x_address=a+b%26c&%C3%A3=%C3%A3&x_trans_id=123')
+
     @mock.patch('authorize.apis.transaction.urlopen')
     def test_make_call_connection_error(self, urlopen):
         urlopen.side_effect = IOError('Borked')
         self.assertRaises(AuthorizeConnectionError, self.api._make_call,
-                          {'a': '1', 'b': '2'})
+                          None, {'a': '1', 'b': '2'})
+
+    @mock.patch('authorize.apis.transaction.urlopen')
+    def test_make_call_circuit_open(self, urlopen):
+        urlopen.side_effect = IOError('Borked')
+        # Breakers are off by default
+        for _ in range(self.api.breaker.minimum_calls + 1):
+            self.assertRaises(AuthorizeConnectionError, self.api._make_call,
+                              None, {'a': '1', 'b': '2'})
+        self.api.breaker = CircuitBreaker('aim')
+        for _ in range(self.api.breaker.minimum_calls):
+            self.assertRaises(AuthorizeConnectionError, self.api._make_call,
+                              None, {'a': '1', 'b': '2'})
+        urlopen.reset_mock()
+        self.assertRaises(AuthorizeCircuitOpenError, self.api._make_call,
+                          None, {'a': '1', 'b': '2'})
+        self.assertFalse(urlopen.called)
 
     @mock.patch('authorize.apis.transaction.urlopen')
     def test_make_call_response_error(self, urlopen):
         urlopen.side_effect = self.error
         try:
-            self.api._make_call({'a': '1', 'b': '2'})
+            self.api._make_call(None, {'a': '1', 'b': '2'})
         except AuthorizeResponseError as e:
             self.assertTrue(str(e).startswith(
                 'This transaction has been declined.'
@@ -125,14 +162,17 @@ class TransactionAPITests(TestCase):
             self.assertEqual(e.full_response, PARSED_ERROR)
 
     def test_add_params(self):
-        self.assertEqual(self.api._add_params({}), {})
-        params = self.api._add_params({}, credit_card=self.credit_card)
+        def add_params(**kwargs):
+            fields = self.api._add_params([], **kwargs)
+            return dict(pair for pair in fields if pair[1] is not None)
+        self.assertEqual(add_params(), {})
+        params = add_params(credit_card=self.credit_card)
         self.assertEqual(params, {
             'x_card_num': '4111111111111111',
             'x_exp_date': '01-{0}'.format(self.year),
             'x_card_code': '911',
         })
-        params = self.api._add_params({}, address=self.address)
+        params = add_params(address=self.address)
         self.assertEqual(params, {
             'x_address': '45 Rose Ave',
             'x_city': 'Venice',
@@ -140,9 +180,7 @@ class TransactionAPITests(TestCase):
             'x_zip': '90291',
             'x_country': 'US',
         })
-        params = self.api._add_params(
-            {}, credit_card=self.credit_card, address=self.address
-        )
+        params = add_params(credit_card=self.credit_card, address=self.address)
         self.assertEqual(params, {
             'x_card_num': '4111111111111111',
             'x_exp_date': '01-{0}'.format(self.year),
@@ -170,6 +208,30 @@ class TransactionAPITests(TestCase):
         ))
         self.assertEqual(result, PARSED_SUCCESS)
 
+    @mock.patch('authorize.apis.transaction.urlopen')
+    def test_auth_body(self, urlopen):
+        urlopen.side_effect = self.success
+        self.api.auth(20, self.credit_card, self.address, 'a@example.com')
+        self.assertTrue(_are_params_eq(urlopen.call_args[1]['data'], (
+            'x_login=123&x_zip=90291&x_card_num=4111111111111111&'
+            'x_amount=20.00&x_tran_key=456&x_city=Venice&x_country=US&'
+            'x_version=3.1&x_state=CA&x_delim_char=%3B&'
+            'x_address=45+Rose+Ave&x_exp_date=01-{0}&x_test_request=FALSE'
+            '&x_card_code=911&x_type=AUTH_ONLY&x_delim_data=TRUE'
+            '&x_email=a%40example.com'.format(self.year)
+        )))
+
+    @mock.patch('authorize.apis.transaction.urlopen')
+    def test_auth_amounts(self, urlopen):
+        urlopen.side_effect = self.success
+        self.api.auth(Money(1999), self.credit_card)
+        self.assertTrue(b'&x_amount=19.99&' in urlopen.call_args[1]['data'])
+        self.api.auth(19.99, self.credit_card)
+        self.assertTrue(b'&x_amount=19.99&' in urlopen.call_args[1]['data'])
+        self.assertRaises(AuthorizeInvalidError, self.api.auth, 19.995,
+            self.credit_card)
+        self.assertEqual(urlopen.call_count, 2)
+
     @mock.patch('authorize.apis.transaction.urlopen')
     def test_capture(self, urlopen):
         urlopen.side_effect = self.success
@@ -0,0 +1,88 @@
+from datetime import date
+import os
+import shutil
+import tempfile
+
+from unittest2 import TestCase
+
+from authorize.bins import BinIndex, BinInfo, compile_csv, \
+    compile_ranges, default_index, set_default_index
+from authorize.data import CreditCard
+
+
+ROWS = [
+    {'start': '4', 'end': '4', 'brand': 'visa', 'lengths': '13-19'},
+    {'start': '400551', 'end': '400551', 'brand': 'visa',
+        'funding': 'debit', 'country': 'us', 'lengths': '16'},
+    {'start': '40055120', 'end': '40055129', 'brand': 'visa',
+        'funding': 'prepaid', 'country': 'US', 'lengths': '16'},
+    {'start': '51', 'end': '55', 'brand': 'mc', 'funding': 'credit',
+        'lengths': '16'},
+]
+CSV = u"""start,end,brand,funding,country,lengths
+{0}
+""".format('\n'.join('{start},{end},{brand},{funding},{country},{lengths}'
+    .format(**dict({'funding': '', 'country': ''}, **row)) for row in ROWS))
+
+
+class BinIndexTests(TestCase):
+    def setUp(self):
+        self.index = BinIndex(compile_ranges(ROWS))
+
+    def test_lookup(self):
+        visa = BinInfo('visa', min_length=13, max_length=19)
+        self.assertEqual(self.index.lookup('4111 1111 1111 1111'), visa)
+        self.assertEqual(self.index.lookup(400550), visa)
+        self.assertEqual(self.index.lookup('4005519200000004'),
+            BinInfo('visa', 'debit', 'US', 16, 16))
+        self.assertEqual(self.index.lookup('4005512'),
+            BinInfo('visa', 'prepaid', 'US', 16, 16))
+        self.assertEqual(self.index.lookup('400552'), visa)
+        self.assertEqual(self.index.lookup('5500000000000004').funding,
+            'credit')
+        self.assertEqual(self.index.lookup('3'), None)
+        self.assertEqual(self.index.lookup('56'), None)
+        self.assertEqual(self.index.lookup('9'), None)
+        self.assertRaises(ValueError, self.index.lookup, '')
+        # The overlapping ranges are split into non-overlapping ones
+        self.assertEqual(len(self.index), 6)
+
+    def test_lookup_many(self):
+        numbers = ['9', '4005512', '3', '5100', '4', '400551', '56', '4']
+        self.assertEqual(self.index.lookup_many(numbers),
+            [self.index.lookup(n) for n in numbers])
+        self.assertEqual(self.index.lookup_many([]), [])
+
+    def test_open(self):
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'bins.csv')
+            target = os.path.join(directory, 'bins.idx')
+            with open(source, 'w') as f:
+                f.write(CSV)
+            compile_csv(source, target)
+            index = BinIndex.open(target)
+            try:
+                self.assertEqual(index.lookup('4005519200000004').funding,
+                    'debit')
+                self.assertEqual(len(index), 6)
+            finally:
+                index.close()
+            self.assertEqual(BinIndex.from_csv(source).lookup('51').brand,
+                'mc')
+        finally:
+            shutil.rmtree(directory)
+        self.assertRaises(ValueError, BinIndex, b'NOTANINDEX' * 2)
+
+    def test_default_index(self):
+        self.assertEqual(default_index().lookup('6221260000000000').brand,
+            'discover')
+        set_default_index(self.index)
+        try:
+            card = CreditCard('4005519200000004',
+                date.today().year + 10, 1, '911')
+            self.assertEqual(card.bin_info.funding, 'debit')
+            self.assertEqual(card.card_type, 'visa')
+        finally:
+            set_default_index(None)
+        self.assertEqual(card.bin_info.funding, None)
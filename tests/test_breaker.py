@@ -0,0 +1,93 @@
+import mock
+from unittest2 import TestCase
+
+from authorize.breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+from authorize.exceptions import AuthorizeCircuitOpenError, \
+    AuthorizeConnectionError, AuthorizeResponseError
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('aim', window=10, minimum_calls=4,
+            failure_rate=0.5, reset_timeout=10, half_open_calls=2)
+
+    def call(self, error=None):
+        try:
+            with self.breaker.guard():
+                if error:
+                    raise error
+        except type(error):
+            pass
+
+    def test_opens_on_failure_rate(self):
+        self.call()
+        self.call(AuthorizeConnectionError('Borked'))
+        self.call()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.call(AuthorizeConnectionError('Borked'))
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertRaises(AuthorizeCircuitOpenError, self.breaker.guard)
+        stats = self.breaker.stats()
+        self.assertEqual(stats['failures'], 2)
+        self.assertEqual(stats['times_opened'], 1)
+        self.assertEqual(stats['rejected'], 1)
+
+    def test_disabled(self):
+        self.breaker = CircuitBreaker('aim', minimum_calls=1, enabled=False)
+        for _ in range(3):
+            self.call(AuthorizeConnectionError('Borked'))
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()['calls'], 0)
+
+    def test_response_errors_are_not_failures(self):
+        for _ in range(10):
+            self.call(AuthorizeResponseError('Declined'))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_unexpected_errors_are_failures(self):
+        for _ in range(4):
+            self.call(ValueError('Borked'))
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_opens_on_slow_calls(self):
+        self.breaker.slow_call_duration = 1
+        for _ in range(4):
+            self.breaker.record(2, False)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    @mock.patch('authorize.breaker.time')
+    def test_half_open_probes(self, time):
+        time.time.return_value = 100
+        for _ in range(4):
+            self.call(AuthorizeConnectionError('Borked'))
+        self.assertEqual(self.breaker.state, OPEN)
+
+        # Probes are let through after the reset timeout
+        time.time.return_value = 110
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        first = self.breaker.guard()
+        second = self.breaker.guard()
+        self.assertRaises(AuthorizeCircuitOpenError, self.breaker.guard)
+        with first:
+            pass
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with second:
+            pass
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()['calls'], 0)
+
+    @mock.patch('authorize.breaker.time')
+    def test_half_open_failure_reopens(self, time):
+        time.time.return_value = 100
+        for _ in range(4):
+            self.call(AuthorizeConnectionError('Borked'))
+        time.time.return_value = 110
+        self.call(AuthorizeConnectionError('Borked'))
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.stats()['times_opened'], 2)
+
+    def test_reset(self):
+        for _ in range(4):
+            self.call(AuthorizeConnectionError('Borked'))
+        self.breaker.reset()
+        self.assertEqual(self.breaker.state, CLOSED)
@@ -0,0 +1,169 @@
+from datetime import date
+import os
+import shutil
+import tempfile
+
+from unittest2 import TestCase
+import mock
+
+from authorize import Address, AuthorizeClient, CreditCard
+from authorize.cardindex import MemoryCardIndex, SQLiteCardIndex
+from authorize.stub import Gateway, StubTransport
+
+
+YEAR = date.today().year + 10
+NUMBER = '4111111111111111'
+
+
+class CardIndexTests(object):
+    def test_fingerprint(self):
+        fingerprint = self.index.fingerprint(CreditCard(NUMBER, YEAR, 1,
+            '911', 'Jeff', 'Schenck'))
+        self.assertFalse(NUMBER in fingerprint)
+        self.assertEqual(len(fingerprint), 64)
+        # Only the number and expiration date count
+        self.assertEqual(fingerprint, self.index.fingerprint(
+            CreditCard('4111 1111 1111 1111', YEAR, '01', '123')))
+        self.assertNotEqual(fingerprint, self.index.fingerprint(
+            CreditCard(NUMBER, YEAR, 2, '911')))
+        self.assertNotEqual(fingerprint, MemoryCardIndex('other')
+            .fingerprint(CreditCard(NUMBER, YEAR, 1, '911')))
+        self.assertEqual(fingerprint, self.index.fingerprint(
+            CreditCard(NUMBER, ' {0} '.format(YEAR), 1, '911')))
+
+    def test_find(self):
+        self.index.add('abc', 42, '1|2')
+        self.index.add('abc', None, '3|4')
+        self.assertEqual(self.index.find('abc', 42), '1|2')
+        self.assertEqual(self.index.find('abc', '42'), '1|2')
+        self.assertEqual(self.index.find('abc', None), '3|4')
+        self.assertEqual(self.index.find('abc', 43), None)
+        self.assertEqual(self.index.find('def', 42), None)
+
+    def test_first_add_wins(self):
+        self.assertEqual(self.index.add('abc', 42, '1|2'), '1|2')
+        self.assertEqual(self.index.add('abc', 42, '3|4'), '1|2')
+        self.assertEqual(self.index.find('abc', 42), '1|2')
+        self.assertEqual(self.index.profile(42), '1')
+
+    def test_profile(self):
+        self.index.add('abc', 42, '1|2')
+        self.index.add('def', 42, '1|5')
+        self.index.add('abc', None, '3|4')
+        self.assertEqual(self.index.profile(42), '1')
+        self.assertEqual(self.index.profile(None), None)
+        self.index.discard('1|2')
+        self.index.discard('1|5')
+        self.assertEqual(self.index.find('abc', 42), None)
+        self.assertEqual(self.index.profile(42), '1')
+        self.index.discard_profile(1)
+        self.assertEqual(self.index.profile(42), None)
+        self.assertEqual(self.index.find('abc', None), '3|4')
+
+    def test_key_required(self):
+        self.assertRaises(ValueError, MemoryCardIndex, '')
+
+
+class MemoryCardIndexTests(CardIndexTests, TestCase):
+    def setUp(self):
+        self.index = MemoryCardIndex('secret')
+
+
+class SQLiteCardIndexTests(CardIndexTests, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cards.db')
+        self.index = SQLiteCardIndex(self.path, b'secret')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared_between_indexes(self):
+        self.index.add('abc', 42, '1|2')
+        index = SQLiteCardIndex(self.path, 'secret')
+        self.assertEqual(index.find('abc', 42), '1|2')
+        self.assertEqual(index.profile(42), '1')
+
+
+class ClientCardIndexTests(TestCase):
+    def setUp(self):
+        self.gateway = Gateway()
+        self.index = MemoryCardIndex('secret')
+        self.client = AuthorizeClient('123', '456',
+            transport=StubTransport(self.gateway), card_index=self.index)
+        self.credit_card = CreditCard(NUMBER, YEAR, 1, '911', 'Jeff',
+            'Schenck')
+        self.address = Address('45 Rose Ave', 'Venice', 'CA', '90291')
+
+    def save(self, credit_card, customer_id=None):
+        return self.client.card(credit_card, self.address).save(
+            customer_id=customer_id)
+
+    def payments(self):
+        return sorted(len(profile['payments'])
+            for profile in self.gateway.profiles.values())
+
+    def test_same_card(self):
+        saved_card = self.save(self.credit_card, 42)
+        self.assertEqual(self.save(self.credit_card, 42).uid, saved_card.uid)
+        self.assertEqual(self.payments(), [1])
+        self.assertNotEqual(self.save(self.credit_card, 43).uid,
+            saved_card.uid)
+        self.assertEqual(self.payments(), [1, 1])
+
+    def test_new_card_same_customer(self):
+        saved_card = self.save(self.credit_card, 42)
+        other = self.save(CreditCard('5105105105105100', YEAR, 1, '911'), 42)
+        self.assertEqual(other.uid.split('|')[0],
+            saved_card.uid.split('|')[0])
+        self.assertNotEqual(other.uid, saved_card.uid)
+        self.assertEqual(self.payments(), [2])
+
+    def test_no_customer(self):
+        saved_card = self.save(self.credit_card)
+        self.assertNotEqual(self.save(self.credit_card).uid, saved_card.uid)
+        self.assertEqual(self.payments(), [1, 1])
+        self.assertEqual(self.index.find(
+            self.index.fingerprint(self.credit_card), None), None)
+
+    def test_email_kept(self):
+        saved_card = self.client.card(self.credit_card, self.address,
+            email='jeff@example.com').save(customer_id=42)
+        other = self.client.card(CreditCard('5105105105105100', YEAR, 1,
+            '911'), self.address, email='other@example.com').save(
+            customer_id=42)
+        profile = self.client.saved_profile(saved_card.uid.split('|')[0])
+        self.assertEqual(profile['email'], 'jeff@example.com')
+        self.assertEqual(len(profile['payments']), 2)
+        self.assertEqual(other.get_payment_info()['email'], 'jeff@example.com')
+
+    def test_saved_at_once(self):
+        # Another save of the same card indexes it between this save's
+        # lookup and its own add
+        saved_card = self.save(self.credit_card, 42)
+        with mock.patch.object(self.index, 'find', return_value=None):
+            self.assertEqual(self.save(self.credit_card, 42).uid,
+                saved_card.uid)
+            with mock.patch.object(self.index, 'profile',
+                    return_value=None):
+                self.assertEqual(self.save(self.credit_card, 42).uid,
+                    saved_card.uid)
+        self.assertEqual(self.payments(), [1])
+
+    def test_deleted(self):
+        saved_card = self.save(self.credit_card, 42)
+        saved_card.delete()
+        again = self.save(self.credit_card, 42)
+        self.assertNotEqual(again.uid, saved_card.uid)
+        self.assertEqual(self.payments(), [1])
+        # A profile deleted elsewhere is replaced by a new one
+        self.client._customer.delete_saved_profile(again.uid.split('|')[0])
+        other = self.save(CreditCard('5105105105105100', YEAR, 1, '911'), 42)
+        self.assertEqual(self.payments(), [1])
+        self.assertEqual(self.index.profile(42), other.uid.split('|')[0])
+
+    def test_without_index(self):
+        self.client.card_index = None
+        self.save(self.credit_card, 42)
+        self.save(self.credit_card, 42)
+        self.assertEqual(self.payments(), [1, 1])
@@ -6,6 +6,8 @@ from unittest2 import TestCase
 from authorize import Address, AuthorizeClient, CreditCard
 from authorize.client import AuthorizeCreditCard, AuthorizeRecurring, \
     AuthorizeSavedCard, AuthorizeTransaction
+from authorize.exceptions import AuthorizeInvalidError
+from authorize.limiter import RateLimiter
 from test_api_customer import PROFILE
 
 
@@ -59,6 +61,44 @@ class ClientTests(TestCase):
         self.assertEqual(self.recurring_api.call_args,
             (('123', '456', False, False), {}))
 
+    def test_authorize_client_breakers(self):
+        self.transaction_api.return_value.breaker.name = 'aim'
+        self.customer_api.return_value.breaker.name = 'cim'
+        self.recurring_api.return_value.breaker.name = 'arb'
+        client = AuthorizeClient('123', '456', breaker_options={
+            'failure_rate': 0.2})
+        breakers = client.breakers
+        self.assertEqual(sorted(breakers.keys()),
+            ['aim', 'arb', 'cim', 'reporting'])
+        self.assertTrue(breakers['aim'] is client._transaction.breaker)
+        self.assertEqual(breakers['aim'].failure_rate, 0.2)
+        self.assertTrue(breakers['reporting'].enabled)
+        client = AuthorizeClient('123', '456')
+        self.assertFalse(client.breakers['reporting'].enabled)
+
+    def test_authorize_client_backend(self):
+        client = AuthorizeClient('123', '456', backend='json',
+            base_url='http://localhost:8080')
+        self.assertEqual(client._customer.endpoint, 'cim')
+        self.assertEqual(client._recurring.url,
+            'http://localhost:8080/xml/v1/request.api')
+        self.assertRaises(ValueError, AuthorizeClient, '123', '456',
+            backend='rest')
+
+    def test_authorize_client_limiter(self):
+        limiter = RateLimiter()
+        client = AuthorizeClient('123', '456', limiter=limiter)
+        self.assertTrue(client._transaction.limiter is limiter)
+        self.assertTrue(client._customer.limiter is limiter)
+        self.assertTrue(client._recurring.limiter is limiter)
+
+    def test_saved_card_uid(self):
+        saved = self.client.saved_card('123|456')
+        self.assertEqual((saved._profile_id, saved._payment_id),
+            ('123', '456'))
+        self.assertRaises(ValueError, self.client.saved_card, '123')
+        self.assertRaises(ValueError, self.client.saved_card, '1|2|3')
+
     def test_authorize_client_payment_creators(self):
         self.assertTrue(isinstance(
             self.client.card(self.credit_card), AuthorizeCreditCard))
@@ -98,6 +138,54 @@ class ClientTests(TestCase):
         self.assertEqual(result.uid, '2171062816')
         self.assertEqual(result.full_response, TRANSACTION_RESULT)
 
+    def test_lean_mode(self):
+        self.client._transaction.capture.return_value = TRANSACTION_RESULT
+        client = AuthorizeClient('123', '456',
+            response_fields=('transaction_id', 'amount', 'missing'))
+        result = client.card(self.credit_card).capture(10)
+        self.assertEqual(result.full_response,
+            {'transaction_id': '2171062816', 'amount': '20.00'})
+        self.assertEqual(result.timing, None)
+        client.response_fields = ()
+        result = client.card(self.credit_card).capture(10)
+        self.assertEqual(result.full_response, None)
+
+    def test_slots(self):
+        for instance in (self.client.card(self.credit_card),
+                self.client.transaction('1'), self.client.saved_card('1|2'),
+                self.client.recurring('1')):
+            self.assertFalse(hasattr(instance, '__dict__'))
+
+    def test_authorize_credit_card_capture_idempotency_key(self):
+        self.client._transaction.capture.return_value = TRANSACTION_RESULT
+        card = AuthorizeCreditCard(self.client, self.credit_card)
+        result = card.capture(10, idempotency_key='order-1')
+        self.assertEqual(result.full_response, TRANSACTION_RESULT)
+        result = card.capture(10, idempotency_key='order-1')
+        self.assertEqual(result.uid, '2171062816')
+        self.assertEqual(result.full_response, TRANSACTION_RESULT)
+        self.assertEqual(self.client._transaction.capture.call_count, 1)
+        card.capture(10, idempotency_key='order-2')
+        card.capture(10)
+        self.assertEqual(self.client._transaction.capture.call_count, 3)
+
+    def test_idempotency_key_reused_for_another_request(self):
+        self.client._transaction.capture.return_value = TRANSACTION_RESULT
+        card = AuthorizeCreditCard(self.client, self.credit_card)
+        card.capture(10, idempotency_key='order-1')
+        # The same amount in another form is the same request
+        card.capture('10.00', idempotency_key='order-1')
+        self.assertRaises(AuthorizeInvalidError, card.capture, 11,
+            idempotency_key='order-1')
+        other = CreditCard('5105105105105100', date.today().year + 10, 1,
+            '911')
+        self.assertRaises(AuthorizeInvalidError,
+            AuthorizeCreditCard(self.client, other).capture, 10,
+            idempotency_key='order-1')
+        self.assertEqual(self.client._transaction.capture.call_count, 1)
+        stored = self.client.journal._responses['123:capture:order-1'][1]
+        self.assertFalse(self.credit_card.card_number in str(stored))
+
     def test_authorize_credit_card_save(self):
         self.client._customer.create_saved_profile.return_value = ('1', '2')
         card = AuthorizeCreditCard(self.client, self.credit_card)
@@ -187,6 +275,18 @@ class ClientTests(TestCase):
         self.assertTrue(isinstance(result, AuthorizeTransaction))
         self.assertEqual(result.uid, '2171062816')
 
+    def test_authorize_saved_card_capture_idempotency_key(self):
+        self.client._customer.capture.return_value = TRANSACTION_RESULT
+        saved = AuthorizeSavedCard(self.client, '1|2')
+        saved.capture(10, idempotency_key='order-1')
+        result = saved.capture(10, idempotency_key='order-1')
+        self.assertEqual(result.full_response, TRANSACTION_RESULT)
+        self.assertEqual(self.client._customer.capture.call_count, 1)
+
+        # Keys are scoped to the operation
+        saved.auth(10, idempotency_key='order-1')
+        self.assertEqual(self.client._customer.auth.call_count, 1)
+
     def test_authorize_saved_card_get_payment_info(self):
         address = Address('45 Rose Ave', 'Venice', 'CA', '90291')
         result_dict = {
@@ -1,8 +1,12 @@
 from datetime import date, datetime, timedelta
+from decimal import Decimal
+import pickle
+import re
 
 from unittest2 import TestCase
 
-from authorize.data import Address, CreditCard
+from authorize.data import Address, CARD_TYPES, CreditCard, mismatches, \
+    Money, total
 from authorize.exceptions import AuthorizeInvalidError
 
 
@@ -14,6 +18,9 @@ TEST_CARD_NUMBERS = [
     ('visa', '4007000000027'),
     ('visa', '4012888818888'),
     ('diners', '38000000000006'),
+    ('mc', '2223000048400011'),
+    ('jcb', '3088000000000017'),
+    ('amex', '340000000000009'),
 ]
 
 
@@ -48,6 +55,16 @@ class CreditCardTests(TestCase):
             credit_card = CreditCard(card_number, self.YEAR, 1, '911')
             self.assertEqual(credit_card.card_type, card_type)
 
+    def test_card_types_deprecated(self):
+        # The old patterns are still importable, though no longer used
+        for card_type, card_number in TEST_CARD_NUMBERS[:7]:
+            self.assertTrue(re.match(CARD_TYPES[card_type], card_number))
+
+    def test_credit_card_type_length(self):
+        # A valid Luhn number that is too long for an American Express card
+        self.assertRaises(AuthorizeInvalidError, CreditCard,
+            '3700000000000007', self.YEAR, 1, '911')
+
     def test_credit_card_expiration(self):
         credit_card = CreditCard('4111111111111111', self.YEAR, 1, '911')
         self.assertEqual(credit_card.expiration,
@@ -62,3 +79,41 @@ class AddressTests(TestCase):
     def test_basic_address(self):
         address = Address('45 Rose Ave', 'Venice', 'CA', '90291')
         repr(address)
+
+
+class MoneyTests(TestCase):
+    def test_parse(self):
+        for amount in (20, '20', '20.0', '20.000', 20.0, Decimal('2E+1'),
+                Money(2000)):
+            self.assertEqual(Money.parse(amount), Money(2000))
+        self.assertEqual(Money.parse(0.1 + 0.2).cents, 30)
+        self.assertEqual(Money.parse(' -3.5 ').cents, -350)
+        self.assertEqual(Money.parse(19.99).cents, 1999)
+
+    def test_parse_invalid(self):
+        for amount in ('1.005', 10.005, 'ten', '', None, True,
+                float('nan'), float('inf'), Decimal('Infinity')):
+            self.assertRaises(AuthorizeInvalidError, Money.parse, amount)
+        self.assertRaises(TypeError, Money, 12.5)
+
+    def test_money(self):
+        money = Money(1250)
+        self.assertEqual(str(money), '12.50')
+        self.assertEqual(str(-money), '-12.50')
+        self.assertEqual(str(Money(5)), '0.05')
+        self.assertEqual(repr(money), '<Money 12.50>')
+        self.assertEqual(money.to_decimal(), Decimal('12.50'))
+        self.assertEqual(money + Money(50), Money(1300))
+        self.assertEqual(money - Money(1250), Money(0))
+        self.assertTrue(Money(1) < money <= Money(1250))
+        self.assertFalse(Money(0))
+        self.assertNotEqual(money, 1250)
+        self.assertEqual(len(set([money, Money(1250)])), 1)
+        self.assertEqual(pickle.loads(pickle.dumps(money)), money)
+        self.assertRaises(AttributeError, setattr, money, 'cents', 1)
+        self.assertRaises(AttributeError, setattr, money, 'dollars', 1)
+
+    def test_bulk(self):
+        self.assertEqual(total([1, '2.50', 0.25, Money(25)]), Money(400))
+        self.assertEqual(total([]), Money(0))
+        self.assertEqual(mismatches([1, '2', 3], ['1.00', 2.01]), [1, 2])
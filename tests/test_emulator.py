@@ -0,0 +1,85 @@
+from datetime import date
+
+from six.moves.urllib.request import urlopen
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize.emulator import start_emulator
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeResponseError
+
+
+class EmulatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_emulator()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.error_rate = 0
+        self.server.drop_rate = 0
+        self.client = AuthorizeClient('123', '456',
+            base_url=self.server.base_url + '/')
+        self.credit_card = CreditCard('4111111111111111',
+            date.today().year + 10, 1, '911', 'Jeff', 'Schenck')
+
+    def test_urls(self):
+        self.assertEqual(self.client._transaction.url,
+            self.server.base_url + '/gateway/transact.dll')
+        self.assertEqual(self.client._customer.url,
+            self.server.base_url + '/soap/v1/Service.asmx?WSDL')
+        self.assertEqual(self.client._recurring.location,
+            self.server.base_url + '/soap/v1/Service.asmx')
+
+    def test_wsdl(self):
+        wsdl = urlopen(self.client._customer.url).read()
+        self.assertTrue(self.client._customer.location.encode('ascii') in
+            wsdl)
+
+    def test_transactions(self):
+        transaction = self.client.card(self.credit_card).auth(11)
+        transaction.settle()
+        self.assertRaises(AuthorizeResponseError, transaction.settle)
+        self.client.card(self.credit_card).capture(12).void()
+
+    def test_duplicate(self):
+        self.client.card(self.credit_card).capture(13)
+        try:
+            self.client.card(self.credit_card).capture(13)
+        except AuthorizeResponseError as e:
+            self.assertEqual(e.full_response['response_reason_code'], '11')
+        else:
+            self.fail('AuthorizeResponseError not raised')
+
+    def test_soap(self):
+        saved_card = self.client.card(self.credit_card).save()
+        saved_card.auth(14)
+        saved_card.delete()
+        recurring = self.client.card(self.credit_card).recurring(15,
+            date.today(), days=30)
+        recurring.delete()
+
+    def test_json_backend(self):
+        client = AuthorizeClient('123', '456', base_url=self.server.base_url,
+            backend='json')
+        self.assertEqual(client._customer.url,
+            self.server.base_url + '/xml/v1/request.api')
+        saved_card = client.card(self.credit_card).save()
+        saved_card.auth(18)
+        self.assertEqual(saved_card.get_payment_info()['first_name'], 'Jeff')
+        saved_card.delete()
+        recurring = client.card(self.credit_card).recurring(19,
+            date.today(), days=30)
+        recurring.delete()
+
+    def test_injected_errors(self):
+        self.server.error_rate = 1
+        self.assertRaises(AuthorizeConnectionError,
+            self.client.card(self.credit_card).auth, 16)
+        self.server.error_rate = 0
+        self.server.drop_rate = 1
+        self.assertRaises(AuthorizeConnectionError,
+            self.client.card(self.credit_card).auth, 17)
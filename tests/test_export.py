@@ -0,0 +1,139 @@
+from datetime import date
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+from unittest2 import skipUnless, TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize.exceptions import AuthorizeConnectionError
+from authorize.export import main, ProfileExporter, read_profiles
+from authorize.stub import StubTransport
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ProfileExporterTests(TestCase):
+    backend = 'soap'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.transport = StubTransport()
+        self.client = AuthorizeClient('123', '456',
+            transport=self.transport, backend=self.backend)
+        credit_card = CreditCard('4111111111111111', date.today().year + 10,
+            1, '911', 'Jeff', 'Schenck')
+        self.cards = [self.client.card(credit_card).save() for _ in range(5)]
+        self.ids = [card.uid.split('|')[0] for card in self.cards]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def profile_ids(self, path):
+        return sorted(r['profile_id'] for r in read_profiles(path))
+
+    def test_export(self):
+        path = self.path('profiles.jsonl')
+        counts = ProfileExporter(self.client, path, concurrency=3).run()
+        self.assertEqual(counts, {'fetched': 5, 'copied': 0, 'missing': 0})
+        self.assertEqual(self.profile_ids(path), self.ids)
+        record = next(read_profiles(path))
+        self.assertEqual(record['payments'][0]['number'], 'XXXX1111')
+        self.assertEqual(record['payments'][0]['last_name'], 'Schenck')
+        self.assertFalse(os.path.exists(path + '.partial'))
+
+    def test_adaptive(self):
+        path = self.path('profiles.jsonl')
+        exporter = ProfileExporter(self.client, path, concurrency=1,
+            max_concurrency=3)
+        counts = exporter.run()
+        self.assertEqual(counts['fetched'], 5)
+        self.assertEqual(self.profile_ids(path), self.ids)
+        self.assertEqual(exporter.controller.maximum, 3)
+        self.assertEqual(ProfileExporter(self.client, path,
+            concurrency=2).controller.stats()['limit'], 2)
+
+    def test_gzip(self):
+        path = self.path('profiles.jsonl.gz')
+        ProfileExporter(self.client, path, rate=1000).run()
+        self.assertEqual(self.profile_ids(path), self.ids)
+
+    def test_restart(self):
+        path = self.path('profiles.jsonl')
+        retrieve = self.client.saved_profile
+        calls = []
+
+        def flaky(profile_id):
+            calls.append(profile_id)
+            if len(calls) == 3:
+                raise AuthorizeConnectionError('Borked')
+            return retrieve(profile_id)
+        with mock.patch.object(self.client, 'saved_profile', flaky):
+            exporter = ProfileExporter(self.client, path, concurrency=1)
+            self.assertRaises(AuthorizeConnectionError, exporter.run)
+        # Simulate a record cut off as the process died
+        with open(path + '.partial', 'ab') as f:
+            f.write(b'{"profile_id": "20')
+        self.assertFalse(os.path.exists(path))
+        counts = ProfileExporter(self.client, path).run()
+        self.assertEqual(counts['fetched'], 3)
+        self.assertEqual(self.profile_ids(path), self.ids)
+
+    def test_incremental(self):
+        path = self.path('profiles.jsonl')
+        change_log = self.path('changes.jsonl')
+        open(change_log, 'w').close()
+        exporter = ProfileExporter(self.client, path, change_log=change_log)
+        exporter.run()
+        self.client._customer.delete_saved_profile(self.ids[0])
+        self.cards[1].update(first_name='Jeffrey')
+        with io.open(change_log, 'w', encoding='utf-8') as f:
+            f.write(u'{"profile_id": "%s", "time": "2999-01-01T00:00:00Z"}'
+                u'\n' % self.ids[1])
+        counts = exporter.run()
+        self.assertEqual(counts, {'fetched': 1, 'copied': 3, 'missing': 0})
+        self.assertEqual(self.profile_ids(path), self.ids[1:])
+        names = dict((r['profile_id'], r['payments'][0]['first_name'])
+            for r in read_profiles(path))
+        self.assertEqual(names[self.ids[1]], 'Jeffrey')
+        state = json.load(open(path + '.state'))
+        self.assertEqual(list(state), ['snapshot'])
+
+    def test_missing(self):
+        path = self.path('profiles.jsonl')
+        ids = self.client.saved_profile_ids()
+        self.client._customer.delete_saved_profile(self.ids[2])
+        with mock.patch.object(self.client, 'saved_profile_ids',
+                lambda: ids):
+            counts = ProfileExporter(self.client, path).run()
+        self.assertEqual(counts, {'fetched': 4, 'copied': 0, 'missing': 1})
+
+    @skipUnless(pyarrow, 'Requires pyarrow')
+    def test_parquet(self):
+        path = self.path('profiles.parquet')
+        ProfileExporter(self.client, path).run()
+        self.assertEqual(self.profile_ids(path), self.ids)
+
+    def test_bad_path(self):
+        self.assertRaises(ValueError, ProfileExporter, self.client,
+            self.path('profiles.csv'))
+
+
+class JSONProfileExporterTests(ProfileExporterTests):
+    backend = 'json'
+
+
+class MainTests(TestCase):
+    def test_requires_credentials(self):
+        with mock.patch.dict(os.environ, clear=True), \
+                mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, main, ['profiles.jsonl'])
@@ -0,0 +1,176 @@
+from datetime import date
+import logging
+import threading
+
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard, timing
+from authorize.exceptions import AuthorizeConnectionError
+from authorize.hedging import Hedger
+from authorize.scheduler import BATCH, current_priority, priority, \
+    Scheduler
+from authorize.stub import StubTransport
+from authorize.wirelog import get_wire_logger, set_wire_logger, WireLogger
+
+
+class SlowThenFast(object):
+    """Blocks the first call until released; later calls return at once."""
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, value):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            self.release.wait(5)
+            return 'slow'
+        if self.error:
+            raise self.error
+        return value
+
+
+class HedgerTests(TestCase):
+    def setUp(self):
+        self.hedger = Hedger(initial_delay=0.01, budget=0.5)
+
+    def test_fast_call_not_hedged(self):
+        self.assertEqual(self.hedger.call(lambda value: value, 'fast'),
+            'fast')
+        self.assertEqual(self.hedger.stats()['hedges'], 0)
+
+    def test_slow_call_hedged(self):
+        func = SlowThenFast()
+        self.assertEqual(self.hedger.call(func, 'fast'), 'fast')
+        func.release.set()
+        stats = self.hedger.stats()
+        self.assertEqual(stats['hedges'], 1)
+        self.assertEqual(stats['hedges_won'], 1)
+
+    def test_hedge_error_waits_for_primary(self):
+        func = SlowThenFast(error=AuthorizeConnectionError('Borked'))
+        timer = threading.Timer(0.1, func.release.set)
+        timer.start()
+        self.assertEqual(self.hedger.call(func, 'fast'), 'slow')
+        timer.join()
+
+    def test_all_errors_raised(self):
+        def fail():
+            raise AuthorizeConnectionError('Borked')
+        self.assertRaises(AuthorizeConnectionError, self.hedger.call, fail)
+
+    def test_base_exception_raised(self):
+        def exit():
+            raise SystemExit(1)
+        self.assertRaises(SystemExit, self.hedger.call, exit)
+
+    def test_budget(self):
+        self.hedger.budget = 0
+        self.hedger._tokens = 0
+        func = SlowThenFast()
+        timer = threading.Timer(0.1, func.release.set)
+        timer.start()
+        self.assertEqual(self.hedger.call(func, 'fast'), 'slow')
+        timer.join()
+        self.assertEqual(func.calls, 1)
+        self.assertEqual(self.hedger.stats()['hedges'], 0)
+
+    def test_delay_percentile(self):
+        self.hedger.min_samples = 10
+        self.assertEqual(self.hedger.delay, 0.01)
+        self.hedger._latencies.extend([i / 100.0 for i in range(1, 101)])
+        self.assertEqual(self.hedger.delay, 0.96)
+        self.hedger.min_delay = 2
+        self.assertEqual(self.hedger.delay, 2)
+
+    def test_workers_reused(self):
+        threads = []
+
+        def func():
+            threads.append(threading.current_thread())
+        self.hedger.call(func)
+        self.hedger.call(func)
+        self.assertEqual(len(set(threads)), 1)
+        self.assertFalse(threads[0] is threading.current_thread())
+
+    def test_idle_workers_exit(self):
+        self.hedger.idle_timeout = 0.01
+        threads = []
+        self.hedger.call(lambda: threads.append(threading.current_thread()))
+        threads[0].join(5)
+        self.assertFalse(threads[0].is_alive())
+        self.assertEqual(self.hedger._idle, 0)
+
+    def test_unhedgeable_call_inline(self):
+        self.hedger.budget = 0
+        self.hedger._tokens = 0
+        threads = []
+        self.hedger.call(lambda: threads.append(threading.current_thread()))
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(len(self.hedger._latencies), 1)
+
+    def test_priority_carried_over(self):
+        seen = []
+        with priority(BATCH):
+            self.hedger.call(lambda: seen.append(current_priority()))
+        self.assertEqual(seen, [BATCH])
+
+    def test_hedge_takes_its_own_slot(self):
+        func = SlowThenFast()
+        primary = lambda: func('primary')
+        slots = []
+
+        def hedge():
+            slots.append(True)
+            return func('hedge')
+        self.assertEqual(self.hedger.run(primary, hedge), 'hedge')
+        func.release.set()
+        self.assertEqual(slots, [True])
+
+
+class HedgedClientTests(TestCase):
+    def setUp(self):
+        self.client = AuthorizeClient('123', '456', transport=StubTransport(),
+            hedger=Hedger(initial_delay=5))
+        credit_card = CreditCard('4111111111111111', date.today().year + 10,
+            1, '911', 'Jeff', 'Schenck')
+        self.saved_card = self.client.card(credit_card,
+            email='joe@example.com').save()
+
+    def tearDown(self):
+        set_wire_logger(None)
+
+    def test_phases(self):
+        with timing.collect() as timings:
+            self.saved_card.get_payment_info()
+        call, = timings
+        self.assertEqual(call.operation, 'GetCustomerProfile')
+        self.assertEqual(list(call.phases),
+            ['wait', 'build', 'network', 'parse'])
+        self.assertEqual(self.client._customer.hedger.stats()['calls'], 1)
+
+    def test_wire_log(self):
+        logger = logging.getLogger('authorize.wire.hedging')
+        logger.propagate = False
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        set_wire_logger(WireLogger(sample_rate=1, logger=logger,
+            max_body=100000))
+        self.saved_card.get_payment_info()
+        get_wire_logger().flush()
+        logger.removeHandler(handler)
+        message = records[0].getMessage()
+        self.assertTrue('GetCustomerProfile' in message)
+        self.assertTrue('joe@example.com' in message)
+
+    def test_scheduler(self):
+        scheduler = Scheduler(capacity=4)
+        self.client._customer.scheduler = scheduler
+        self.saved_card.get_payment_info()
+        self.assertEqual(scheduler.stats()['in_flight'], 0)
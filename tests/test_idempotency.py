@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import mock
+from unittest2 import TestCase
+
+from authorize.exceptions import AuthorizeError, AuthorizeInvalidError, \
+    AuthorizeResponseError
+from authorize.idempotency import MemoryJournal, PENDING, SQLiteJournal, \
+    StoreJournal
+
+
+RESPONSE = {'response_code': '1', 'transaction_id': '2171062816'}
+
+
+class FakeStore(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def add(self, key, value, timeout):
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def set(self, key, value, timeout):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class JournalTests(object):
+    def test_execute_stores_response(self):
+        call = mock.Mock(return_value=RESPONSE)
+        self.assertEqual(self.journal.execute('key', call), RESPONSE)
+        self.assertEqual(self.journal.execute('key', call), RESPONSE)
+        self.assertEqual(call.call_count, 1)
+
+    def test_execute_different_keys(self):
+        call = mock.Mock(return_value=RESPONSE)
+        self.journal.execute('key1', call)
+        self.journal.execute('key2', call)
+        self.assertEqual(call.call_count, 2)
+
+    def test_execute_error_releases_key(self):
+        call = mock.Mock(side_effect=AuthorizeResponseError('Declined'))
+        self.assertRaises(AuthorizeResponseError, self.journal.execute,
+            'key', call)
+        call.side_effect = None
+        call.return_value = RESPONSE
+        self.assertEqual(self.journal.execute('key', call), RESPONSE)
+        self.assertEqual(call.call_count, 2)
+
+    def test_execute_waits_for_in_flight(self):
+        self.assertEqual(self.journal.claim('key'), None)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            self.journal.execute('key', mock.Mock(return_value={}))))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertEqual(results, [])
+        self.journal.record('key', RESPONSE)
+        waiter.join(5)
+        self.assertEqual(results, [RESPONSE])
+
+    def test_execute_fingerprint(self):
+        call = mock.Mock(return_value=RESPONSE)
+        self.assertEqual(self.journal.execute('key', call, 'abc'), RESPONSE)
+        self.assertEqual(self.journal.execute('key', call, 'abc'), RESPONSE)
+        self.assertEqual(self.journal.execute('key', call), RESPONSE)
+        self.assertRaises(AuthorizeInvalidError, self.journal.execute,
+            'key', call, 'def')
+        self.assertEqual(call.call_count, 1)
+
+    def test_claim_timeout(self):
+        self.journal.wait_timeout = 0.1
+        self.assertEqual(self.journal.claim('key'), None)
+        self.assertRaises(AuthorizeError, self.journal.claim, 'key')
+
+
+class MemoryJournalTests(JournalTests, TestCase):
+    def setUp(self):
+        self.journal = MemoryJournal()
+
+    def test_expired_response(self):
+        self.journal.ttl = -1
+        call = mock.Mock(return_value=RESPONSE)
+        self.journal.execute('key', call)
+        self.journal.execute('key', call)
+        self.assertEqual(call.call_count, 2)
+
+    def test_sweeps_expired_responses(self):
+        self.journal.ttl = -1
+        self.journal.execute('key1', mock.Mock(return_value=RESPONSE))
+        self.journal.sweep_interval = 0
+        self.journal._next_sweep = 0
+        self.journal.execute('key2', mock.Mock(return_value=RESPONSE))
+        self.assertEqual(list(self.journal._responses), ['key2'])
+
+
+class SQLiteJournalTests(JournalTests, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal.db')
+        self.journal = SQLiteJournal(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared_between_journals(self):
+        call = mock.Mock(return_value=RESPONSE)
+        self.journal.execute('key', call)
+        self.assertEqual(SQLiteJournal(self.path).execute('key', call),
+            RESPONSE)
+        self.assertEqual(call.call_count, 1)
+
+    def test_abandoned_claim(self):
+        self.journal.lock_timeout = 0
+        self.assertEqual(self.journal.claim('key'), None)
+        self.assertEqual(self.journal.claim('key'), None)
+
+
+class StoreJournalTests(JournalTests, TestCase):
+    def setUp(self):
+        self.store = FakeStore()
+        self.journal = StoreJournal(self.store)
+
+    def test_store_keys(self):
+        self.journal.claim('key')
+        self.assertEqual(self.store.values,
+            {'authorize:journal:key': PENDING})
+        self.journal.release('key')
+        self.assertEqual(self.store.values, {})
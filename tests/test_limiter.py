@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import mock
+from unittest2 import TestCase
+
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeResponseError
+from authorize.limiter import AdaptiveConcurrency, FileBackend, Limit, \
+    MemoryBackend, RateLimiter
+
+
+class RateLimiterTests(TestCase):
+    def test_unlimited_slot(self):
+        limiter = RateLimiter({'cim': Limit(rate=1)})
+        backend = limiter.backend = mock.Mock()
+        with limiter.slot('aim', 'AUTH_CAPTURE'):
+            pass
+        self.assertFalse(backend.method_calls)
+
+    def test_matching_limits(self):
+        endpoint = Limit(rate=10)
+        operation = Limit(max_in_flight=2)
+        limiter = RateLimiter({'aim': endpoint,
+            'aim.AUTH_CAPTURE': operation})
+        backend = limiter.backend = mock.Mock()
+        backend.reserve.return_value = 0
+        with limiter.slot('aim', 'AUTH_CAPTURE'):
+            self.assertEqual(backend.method_calls, [
+                mock.call.reserve('aim', endpoint),
+                mock.call.enter('aim.AUTH_CAPTURE', operation),
+            ])
+        self.assertEqual(backend.leave.call_args, (('aim.AUTH_CAPTURE',), {}))
+
+    @mock.patch('authorize.limiter.time')
+    def test_rate_waits(self, time_):
+        time_.time.return_value = 100
+        limiter = RateLimiter({'aim': Limit(rate=2, burst=2)})
+        for _ in range(4):
+            with limiter.slot('aim'):
+                pass
+        self.assertEqual(time_.sleep.call_args_list,
+            [mock.call(0.5), mock.call(1.0)])
+
+    def test_slot_released_on_error(self):
+        limiter = RateLimiter({'aim': Limit(max_in_flight=1)})
+        try:
+            with limiter.slot('aim'):
+                raise ValueError('Borked')
+        except ValueError:
+            pass
+        with limiter.slot('aim'):
+            pass
+
+
+class AdaptiveConcurrencyTests(TestCase):
+    def call(self, controller, latency, error=None):
+        with mock.patch('authorize.limiter.default_timer') as timer:
+            timer.side_effect = [10.0, 10.0 + latency]
+            try:
+                with controller.slot():
+                    if error:
+                        raise error
+            except type(error):
+                pass
+
+    def test_increases_while_latency_holds(self):
+        controller = AdaptiveConcurrency(initial=2, maximum=4)
+        for _ in range(20):
+            self.call(controller, 0.1)
+        self.assertEqual(controller.limit, 4)
+        stats = controller.stats()
+        self.assertEqual(stats['increases'], 2)
+        self.assertAlmostEqual(stats['baseline'], 0.1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_backs_off_on_latency(self):
+        controller = AdaptiveConcurrency(initial=10)
+        self.call(controller, 0.1)
+        self.call(controller, 0.15)
+        self.assertEqual(controller.limit, 10)
+        self.call(controller, 0.5)
+        self.assertEqual(controller.limit, 7)
+        self.assertEqual(controller.decreases, 1)
+
+    def test_backs_off_on_connection_errors(self):
+        controller = AdaptiveConcurrency(initial=10, minimum=2)
+        self.call(controller, 0.1, AuthorizeResponseError('Declined'))
+        self.assertEqual(controller.limit, 10)
+        for _ in range(5):
+            self.call(controller, 0.1, AuthorizeConnectionError('Throttled'))
+        self.assertEqual(controller.limit, 2)
+
+    def test_backs_off_once_per_burst(self):
+        controller = AdaptiveConcurrency(initial=10)
+        slots = [controller.slot() for _ in range(3)]
+        for slot in slots:
+            slot.__enter__()
+        error = AuthorizeConnectionError('Throttled')
+        for slot in slots:
+            slot.__exit__(type(error), error, None)
+        self.assertEqual(controller.limit, 7)
+        self.assertEqual(controller.decreases, 1)
+
+    def test_waits_for_a_slot(self):
+        controller = AdaptiveConcurrency(initial=1, maximum=1)
+        entered = []
+        with controller.slot():
+            waiter = threading.Thread(target=lambda: entered.append(
+                controller.slot().__enter__()))
+            waiter.start()
+            time.sleep(0.05)
+            self.assertEqual(entered, [])
+        waiter.join()
+        self.assertEqual(len(entered), 1)
+
+
+class BackendTests(object):
+    def test_reserve(self):
+        limit = Limit(rate=10, burst=2)
+        self.assertEqual(self.backend.reserve('aim', limit), 0)
+        self.assertEqual(self.backend.reserve('aim', limit), 0)
+        self.assertTrue(0 < self.backend.reserve('aim', limit) <= 0.1)
+
+    def test_max_in_flight(self):
+        limit = Limit(max_in_flight=1)
+        self.backend.enter('aim', limit)
+        entered = []
+        waiter = threading.Thread(target=lambda: entered.append(
+            self.backend.enter('aim', limit)))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertEqual(entered, [])
+        self.backend.leave('aim')
+        waiter.join(5)
+        self.assertEqual(entered, [None])
+        self.backend.leave('aim')
+
+
+class MemoryBackendTests(BackendTests, TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+
+
+class FileBackendTests(BackendTests, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = FileBackend(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared_between_backends(self):
+        limit = Limit(max_in_flight=2)
+        self.backend.enter('aim', limit)
+        other = FileBackend(self.directory)
+        other.enter('aim', limit)
+        other.poll_interval = 0
+        with mock.patch('authorize.limiter.time.sleep') as sleep:
+            sleep.side_effect = RuntimeError('Would block')
+            self.assertRaises(RuntimeError, other.enter, 'aim', limit)
+
+    @mock.patch('authorize.limiter._is_running')
+    def test_reclaims_exited_processes(self, is_running):
+        is_running.return_value = False
+        limit = Limit(max_in_flight=1)
+        with open(os.path.join(self.directory, 'aim.limit'), 'w') as f:
+            f.write('{"in_flight": {"1": 1}}')
+        self.backend.enter('aim', limit)
+        self.assertEqual(is_running.call_args, ((1,), {}))
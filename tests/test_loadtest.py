@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+from six import StringIO
+from unittest2 import TestCase
+
+from authorize.loadtest import LoadTest, main, make_client, parse_mix, \
+    percentile, Report
+
+
+class LoadTestTests(TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('auth=3, capture'),
+            [('auth', 3.0), ('capture', 1.0)])
+        self.assertRaises(ValueError, parse_mix, 'refund=1')
+        self.assertRaises(ValueError, parse_mix, 'auth=0')
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_report(self):
+        report = Report([
+            ('auth', 0.010, None),
+            ('auth', 0.030, 'AuthorizeResponseError: Declined'),
+            ('save', 0.020, None),
+        ], 2.0).to_dict()
+        self.assertEqual(report['requests'], 3)
+        self.assertEqual(report['errors'], 1)
+        self.assertEqual(report['throughput'], 1.5)
+        self.assertEqual(report['latency_ms']['max'], 30.0)
+        self.assertEqual(report['operations']['auth']['requests'], 2)
+        self.assertEqual(report['error_breakdown'],
+            {'AuthorizeResponseError: Declined': 1})
+
+    def test_concurrency(self):
+        client = make_client('stub', 'login', 'key')
+        mix = parse_mix('auth,capture,save,saved_capture,recurring')
+        report = LoadTest(client, mix, concurrency=3, requests=30).run()
+        data = report.to_dict()
+        self.assertEqual(data['requests'], 30)
+        self.assertEqual(data['errors'], 0)
+        self.assertTrue('total' in report.format())
+
+    def test_rate(self):
+        client = make_client('stub', 'login', 'key')
+        report = LoadTest(client, [('auth', 1)], concurrency=2, rate=200,
+            requests=10).run()
+        self.assertEqual(len(report.results), 10)
+
+    def test_errors(self):
+        client = make_client('stub', 'login', 'key')
+        test = LoadTest(client, [('saved_capture', 1)], concurrency=1,
+            requests=2)
+        test.setup = lambda: setattr(test, 'saved_card', '1|2')
+        report = test.run().to_dict()
+        self.assertEqual(report['errors'], 2)
+        self.assertEqual(list(report['error_breakdown'].values()), [2])
+
+    def test_main(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'report.json')
+            with mock.patch('sys.stdout', StringIO()) as stdout:
+                self.assertEqual(main(['--requests', '5', '--mix', 'auth',
+                    '--json', path]), 0)
+            self.assertTrue('5 requests' in stdout.getvalue())
+            with open(path) as f:
+                self.assertEqual(json.load(f)['requests'], 5)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_production_guard(self):
+        with mock.patch('sys.stderr', StringIO()):
+            self.assertRaises(SystemExit, main, ['--endpoint', 'production'])
@@ -0,0 +1,116 @@
+from datetime import datetime
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+
+from unittest2 import TestCase
+
+from authorize.reconcile import AMOUNT_MISMATCH, EXTRA, MATCHED, MISSING, \
+    parse_time, read_records, reconcile, Reconciler
+
+
+TRANSACTIONS = [
+    {'transaction_id': '1001', 'amount': '20.00',
+        'submitted': '2017-05-01T16:00:00Z', 'status': 'settledSuccessfully'},
+    {'transaction_id': '1002', 'invoice_number': 'INV2', 'amount': '15.00',
+        'submitted': '2017-05-01T16:05:00Z', 'status': 'settledSuccessfully'},
+    {'transaction_id': '1003', 'amount': '9.99',
+        'submitted': '2017-05-01T16:10:00Z', 'status': 'settledSuccessfully'},
+    {'transaction_id': '1004', 'amount': '30.00',
+        'submitted': '2017-05-01T16:20:00Z', 'status': 'settledSuccessfully'},
+    {'transaction_id': '1005', 'amount': '5.00',
+        'submitted': '2017-05-01T16:30:00Z', 'status': 'voided'},
+]
+LEDGER = [
+    {'transaction_id': '1001', 'amount': '20.00'},
+    {'invoice_number': 'INV2', 'amount': '15'},
+    {'amount': Decimal('9.99'), 'time': datetime(2017, 5, 1, 16, 12)},
+    {'transaction_id': '1004', 'amount': '25.00'},
+    {'transaction_id': '1006', 'amount': '12.00'},
+]
+
+
+class ReconcileTests(TestCase):
+    def check(self, results):
+        summary = [(r.status, r.matched_on,
+            (r.transaction or r.record).get('transaction_id'))
+            for r in results]
+        self.assertEqual(summary, [
+            (MATCHED, 'transaction_id', '1001'),
+            (MATCHED, 'invoice_number', '1002'),
+            (MATCHED, 'amount', '1003'),
+            (AMOUNT_MISMATCH, 'transaction_id', '1004'),
+            (EXTRA, None, '1005'),
+            (MISSING, None, '1006'),
+        ])
+        self.assertEqual(results[3].difference, Decimal('5.00'))
+        self.assertEqual(results[3].to_dict()['difference'], '5.00')
+
+    def test_reconcile(self):
+        reconciler = Reconciler()
+        self.check(list(reconciler.reconcile(TRANSACTIONS, LEDGER)))
+        self.assertEqual(reconciler.counts, {MATCHED: 3, AMOUNT_MISMATCH: 1,
+            EXTRA: 1, MISSING: 1})
+
+    def test_spill(self):
+        self.check(list(reconcile(TRANSACTIONS, LEDGER, spill_threshold=2)))
+
+    def test_streaming(self):
+        results = reconcile(iter(TRANSACTIONS), iter(LEDGER))
+        self.assertEqual(next(results).status, MATCHED)
+
+    def test_time_tolerance(self):
+        ledger = [{'amount': '9.99', 'time': '2017-05-01T16:20:01Z'}]
+        statuses = [r.status for r in reconcile(TRANSACTIONS[2:3], ledger,
+            tolerance=300)]
+        self.assertEqual(statuses, [EXTRA, MISSING])
+        ledger = [
+            {'amount': '9.99', 'time': '2017-05-01T16:14:00Z', 'n': 1},
+            {'amount': '9.99', 'time': '2017-05-01T16:09:00Z', 'n': 2},
+        ]
+        for spill_threshold in (None, 0):
+            result = next(reconcile(TRANSACTIONS[2:3], ledger,
+                spill_threshold=spill_threshold))
+            self.assertEqual(result.record['n'], 2)
+
+    def test_zero_tolerance(self):
+        ledger = [
+            {'amount': '9.99', 'time': '2017-05-01T16:10:01Z', 'n': 1},
+            {'amount': '9.99', 'time': '2017-05-01T16:10:00Z', 'n': 2},
+        ]
+        for spill_threshold in (None, 0):
+            results = list(reconcile(TRANSACTIONS[2:3], ledger, tolerance=0,
+                spill_threshold=spill_threshold))
+            self.assertEqual([(r.status, r.record['n']) for r in results],
+                [(MATCHED, 2), (MISSING, 1)])
+        self.assertRaises(ValueError, Reconciler, tolerance=-1)
+
+    def test_statuses(self):
+        results = list(reconcile(TRANSACTIONS, LEDGER,
+            statuses=['settledSuccessfully']))
+        self.assertFalse(EXTRA in [r.status for r in results])
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('1970-01-01T00:01:00Z'), 60)
+        self.assertEqual(parse_time('1970-01-01T01:00:00.5+01:00'), 0.5)
+        self.assertEqual(parse_time('1970-01-01 00:00:10'), 10)
+        self.assertEqual(parse_time(datetime(1970, 1, 1, 0, 0, 30)), 30)
+        self.assertEqual(parse_time(None), None)
+        self.assertRaises(ValueError, parse_time, 'yesterday')
+
+    def test_read_records(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'ledger.csv')
+            with open(path, 'w') as f:
+                f.write('transaction_id,amount\n1001,20.00\n')
+            self.assertEqual(list(read_records(path)),
+                [{'transaction_id': '1001', 'amount': '20.00'}])
+            path = os.path.join(directory, 'ledger.jsonl')
+            with open(path, 'w') as f:
+                f.write('{"transaction_id": "1001"}\n\n')
+            self.assertEqual(list(read_records(path)),
+                [{'transaction_id': '1001'}])
+        finally:
+            shutil.rmtree(directory)
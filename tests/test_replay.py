@@ -0,0 +1,125 @@
+from datetime import date
+import os
+import shutil
+import tempfile
+
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize.apis.transaction import TEST_URL
+from authorize.exceptions import AuthorizeConnectionError
+from authorize.replay import operation_name, read_recording, \
+    RecordingTransport, ReplayTransport
+from authorize.stub import StubTransport
+from authorize.transport import Reply, Transport
+from test_api_transaction import SUCCESS
+
+
+class FakeTransport(Transport):
+    def __init__(self, reply):
+        self.reply = reply
+        self.sent = []
+
+    def open(self, url, headers=None):
+        self.sent.append((url, None))
+        return self.reply
+
+    def send(self, url, body, headers=None):
+        self.sent.append((url, body))
+        return self.reply
+
+
+class OperationNameTests(TestCase):
+    def test_operation_name(self):
+        self.assertEqual(operation_name('a=1&x_type=AUTH_ONLY', {}),
+            'AUTH_ONLY')
+        self.assertEqual(operation_name('<xml/>', {'SOAPAction':
+            '"https://api.authorize.net/soap/v1/CreateCustomerProfile"'}),
+            'CreateCustomerProfile')
+        self.assertEqual(operation_name('<?xml version="1.0"?>'
+            '<getTransactionListRequest xmlns="AnetApi">', {}),
+            'getTransactionListRequest')
+        self.assertEqual(operation_name('{"createCustomerProfileRequest":'
+            '{}}', {}), 'createCustomerProfileRequest')
+        self.assertEqual(operation_name('', None), None)
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'traffic.jsonl.gz')
+        self.credit_card = CreditCard('4111111111111111',
+            date.today().year + 10, 1, '911')
+        self.reply = Reply(200, {'content-type': 'text/plain'},
+            SUCCESS.getvalue())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self):
+        inner = FakeTransport(self.reply)
+        with RecordingTransport(self.path, inner) as recorder:
+            client = AuthorizeClient('123', 'secret', transport=recorder)
+            client.card(self.credit_card).auth(20)
+            recorder.open('https://example.com/service?WSDL')
+        return inner
+
+    def test_record(self):
+        inner = self.record()
+        self.assertEqual(inner.sent[0][0], TEST_URL)
+        self.assertTrue(b'x_card_num=4111111111111111' in inner.sent[0][1])
+        auth, wsdl = list(read_recording(self.path))
+        self.assertEqual(auth['method'], 'POST')
+        self.assertEqual(auth['operation'], 'AUTH_ONLY')
+        self.assertEqual(auth['code'], 200)
+        self.assertTrue('x_card_num=XXXX1111' in auth['request'])
+        self.assertTrue('x_card_code=XXXX' in auth['request'])
+        self.assertTrue('x_tran_key=XXXX' in auth['request'])
+        self.assertFalse('secret' in auth['request'])
+        self.assertEqual(auth['response'], SUCCESS.getvalue().decode('ascii'))
+        self.assertTrue(auth['duration'] >= 0)
+        self.assertEqual(wsdl['method'], 'GET')
+        self.assertEqual(wsdl['operation'], None)
+
+    def test_replay(self):
+        self.record()
+        replay = ReplayTransport(self.path, speed=None)
+        client = AuthorizeClient('123', 'other', transport=replay)
+        for i in range(3):
+            result = client.card(self.credit_card).auth(20)
+            self.assertEqual(result.uid, '2171062816')
+        reply = replay.open('https://example.com/service?WSDL')
+        self.assertEqual(reply.body, SUCCESS.getvalue())
+
+    def test_replay_exhausted(self):
+        self.record()
+        replay = ReplayTransport(self.path, speed=None, loop=False)
+        client = AuthorizeClient('123', 'other', transport=replay)
+        client.card(self.credit_card).auth(20)
+        self.assertRaises(AuthorizeConnectionError,
+            client.card(self.credit_card).capture, 20)
+        self.assertRaises(AuthorizeConnectionError,
+            client.card(self.credit_card).auth, 20)
+
+    def test_json_backend(self):
+        with RecordingTransport(self.path, StubTransport()) as recorder:
+            client = AuthorizeClient('123', 'secret', transport=recorder,
+                backend='json')
+            uid = client.card(self.credit_card).save().uid
+        create, = read_recording(self.path)
+        self.assertEqual(create['operation'], 'createCustomerProfileRequest')
+        self.assertFalse('secret' in create['request'])
+        self.assertFalse('"cardCode":"911"' in create['request'])
+        self.assertFalse('4111111111111111' in create['request'])
+        self.assertTrue('"transactionKey":"XXXX"' in create['request'])
+        self.assertTrue('"cardCode":"XXXX"' in create['request'])
+        replay = ReplayTransport(self.path, speed=None)
+        client = AuthorizeClient('123', 'other', transport=replay,
+            backend='json')
+        self.assertEqual(client.card(self.credit_card).save().uid, uid)
+
+    def test_http_error(self):
+        client = AuthorizeClient('123', '456',
+            transport=FakeTransport(Reply(503, {}, b'Unavailable')))
+        self.assertRaises(AuthorizeConnectionError,
+            client.card(self.credit_card).auth, 20)
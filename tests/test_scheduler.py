@@ -0,0 +1,160 @@
+from datetime import date
+import threading
+import time
+
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeQueueFullError
+from authorize.scheduler import BATCH, current_priority, INTERACTIVE, \
+    priority, Scheduler
+from authorize.stub import StubTransport
+
+
+class PriorityTests(TestCase):
+    def test_nested(self):
+        self.assertEqual(current_priority(), INTERACTIVE)
+        with priority(BATCH):
+            self.assertEqual(current_priority(), BATCH)
+            with priority(INTERACTIVE):
+                self.assertEqual(current_priority(), INTERACTIVE)
+            self.assertEqual(current_priority(), BATCH)
+        self.assertEqual(current_priority(), INTERACTIVE)
+
+    def test_per_thread(self):
+        seen = []
+        with priority(BATCH):
+            thread = threading.Thread(
+                target=lambda: seen.append(current_priority()))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [INTERACTIVE])
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, priority, 'urgent')
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.order = []
+        self.threads = []
+
+    def tearDown(self):
+        self.join()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def hold(self, scheduler):
+        # Takes the only place, returning an event that gives it back
+        held = threading.Event()
+        release = threading.Event()
+
+        def run():
+            with scheduler.slot('holder'):
+                held.set()
+                release.wait()
+        self.start(run)
+        held.wait()
+        return release
+
+    def start(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        self.threads.append(thread)
+
+    def queue(self, scheduler, merchant, name=INTERACTIVE):
+        # Queues a call, waiting until it is in line so the order is known
+        queued = sum(scheduler.stats()['queued'].values())
+
+        def run():
+            with priority(name), scheduler.slot(merchant):
+                self.order.append((merchant, name))
+        self.start(run)
+        while sum(scheduler.stats()['queued'].values()) == queued:
+            time.sleep(0.001)
+
+    def test_unlimited(self):
+        scheduler = Scheduler()
+        with scheduler.slot('a'), scheduler.slot('a'):
+            pass
+        self.assertEqual(scheduler.stats()['in_flight'], 0)
+
+    def test_interactive_first(self):
+        scheduler = Scheduler(capacity=1)
+        release = self.hold(scheduler)
+        self.queue(scheduler, 'a', BATCH)
+        self.queue(scheduler, 'b', BATCH)
+        self.queue(scheduler, 'a')
+        self.assertEqual(scheduler.stats()['queued'],
+            {INTERACTIVE: 1, BATCH: 2})
+        release.set()
+        self.join()
+        self.assertEqual(self.order,
+            [('a', INTERACTIVE), ('a', BATCH), ('b', BATCH)])
+        stats = scheduler.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['waits'][BATCH]['count'], 2)
+        self.assertTrue(stats['waits'][BATCH]['max'] > 0)
+        self.assertTrue(stats['waits'][BATCH]['total'] >=
+            stats['waits'][BATCH]['max'])
+
+    def test_fair_share(self):
+        scheduler = Scheduler(capacity=1)
+        release = self.hold(scheduler)
+        for merchant in 'aaab':
+            self.queue(scheduler, merchant)
+        release.set()
+        self.join()
+        self.assertEqual([merchant for merchant, _ in self.order],
+            ['a', 'b', 'a', 'a'])
+
+    def test_weights(self):
+        scheduler = Scheduler(capacity=1, weights={'a': 2})
+        release = self.hold(scheduler)
+        for merchant in 'aaaabb':
+            self.queue(scheduler, merchant)
+        release.set()
+        self.join()
+        self.assertEqual([merchant for merchant, _ in self.order],
+            ['a', 'b', 'a', 'a', 'b', 'a'])
+
+    def test_queue_full(self):
+        scheduler = Scheduler(capacity=1, max_queue=1)
+        release = self.hold(scheduler)
+        self.queue(scheduler, 'a', BATCH)
+        with priority(BATCH):
+            self.assertRaises(AuthorizeQueueFullError,
+                scheduler.slot('a').__enter__)
+        self.queue(scheduler, 'a')
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+        self.assertTrue(issubclass(AuthorizeQueueFullError,
+            AuthorizeConnectionError))
+        release.set()
+
+
+class ClientSchedulerTests(TestCase):
+    def test_shared(self):
+        scheduler = Scheduler(capacity=2)
+        client = AuthorizeClient('123', '456', transport=StubTransport(),
+            scheduler=scheduler)
+        other = AuthorizeClient('789', '456', transport=StubTransport(),
+            scheduler=scheduler)
+        for api in client._apis + other._apis:
+            self.assertTrue(api.scheduler is scheduler)
+        credit_card = CreditCard('4111111111111111', date.today().year + 10,
+            1, '911', 'Jeff', 'Schenck')
+        client.card(credit_card).auth(20)
+        with priority(BATCH):
+            other.card(credit_card).save()
+        waits = scheduler.stats()['waits']
+        self.assertEqual(waits[INTERACTIVE]['count'], 1)
+        self.assertEqual(waits[BATCH]['count'], 1)
+
+    def test_default(self):
+        client = AuthorizeClient('123', '456')
+        self.assertEqual(client._transaction.scheduler.capacity, None)
+        self.assertFalse(client._customer.scheduler is
+            client._transaction.scheduler)
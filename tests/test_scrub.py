@@ -0,0 +1,38 @@
+from unittest2 import TestCase
+
+from authorize.scrub import scrub
+
+
+class ScrubTests(TestCase):
+    def test_form(self):
+        self.assertEqual(
+            scrub('x_tran_key=secret&x_card_num=4111111111111111'
+                '&x_card_code=911&x_trans_id=2171062816&x_amount=20.00'),
+            'x_tran_key=XXXX&x_card_num=XXXX1111&x_card_code=XXXX'
+            '&x_trans_id=2171062816&x_amount=20.00')
+
+    def test_xml(self):
+        self.assertEqual(
+            scrub('<ns1:transactionKey>secret</ns1:transactionKey>'
+                '<cardNumber>5105105105105100</cardNumber>'
+                '<cardCode>123</cardCode>'
+                '<cardNumber>XXXX1111</cardNumber>'),
+            '<ns1:transactionKey>XXXX</ns1:transactionKey>'
+            '<cardNumber>XXXX5100</cardNumber>'
+            '<cardCode>XXXX</cardCode>'
+            '<cardNumber>XXXX1111</cardNumber>')
+
+    def test_json(self):
+        self.assertEqual(
+            scrub('{"merchantAuthentication":{"name":"123",'
+                '"transactionKey":"secret"},"creditCard":{'
+                '"cardNumber":"4111111111111111", "cardCode" : "911"}}'),
+            '{"merchantAuthentication":{"name":"123",'
+            '"transactionKey":"XXXX"},"creditCard":{'
+            '"cardNumber":"XXXX1111", "cardCode" : "XXXX"}}')
+
+    def test_bare_numbers(self):
+        self.assertEqual(scrub('1;1;1;This transaction has been approved.'
+            ';4111111111111111;2149186775'),
+            '1;1;1;This transaction has been approved.;XXXX1111'
+            ';2149186775')
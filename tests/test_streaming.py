@@ -0,0 +1,170 @@
+from datetime import date
+
+from six import BytesIO
+from unittest2 import TestCase
+
+from authorize import Address, AuthorizeClient, CreditCard
+from authorize.apis.streaming import read_result
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeError, AuthorizeResponseError
+from authorize.stub import Gateway, StubTransport
+
+
+ENVELOPE = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<soap:Body><GetCustomerProfileResponse '
+    b'xmlns="https://api.authorize.net/soap/v1/">'
+    b'<GetCustomerProfileResult>'
+    b'<resultCode>Ok</resultCode>'
+    b'<messages><MessagesTypeMessage><code>I00001</code>'
+    b'<text>Successful.</text></MessagesTypeMessage></messages>'
+    b'<profile><email>joe@example.com</email><paymentProfiles>'
+    b'<CustomerPaymentProfileMaskedType>'
+    b'<billTo><firstName>Jeff</firstName></billTo>'
+    b'<customerPaymentProfileId>1</customerPaymentProfileId>'
+    b'<payment><creditCard><cardNumber>XXXX1111</cardNumber></creditCard>'
+    b'</payment></CustomerPaymentProfileMaskedType>'
+    b'<CustomerPaymentProfileMaskedType>'
+    b'<billTo><firstName>Jane</firstName><zip>90291</zip></billTo>'
+    b'<customerPaymentProfileId>2</customerPaymentProfileId>'
+    b'<payment><creditCard><cardNumber>XXXX0027</cardNumber></creditCard>'
+    b'</payment></CustomerPaymentProfileMaskedType>'
+)
+CLOSE = (
+    b'</paymentProfiles></profile></GetCustomerProfileResult>'
+    b'</GetCustomerProfileResponse></soap:Body></soap:Envelope>'
+)
+
+
+class Chunks(object):
+    # A file object returning one chunk per read, to see how far a reader got
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+
+    def read(self, size=-1):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+class ReadResultTests(TestCase):
+    def test_payment(self):
+        result = read_result(BytesIO(ENVELOPE + CLOSE), payment_id=2)
+        self.assertEqual(result['resultCode'], 'Ok')
+        self.assertEqual(result['code'], 'I00001')
+        self.assertEqual(result['text'], 'Successful.')
+        self.assertEqual(result['email'], 'joe@example.com')
+        self.assertEqual(result['payment'], {'number': 'XXXX0027',
+            'billTo': {'firstName': 'Jane', 'zip': '90291'}})
+
+    def test_missing_payment(self):
+        result = read_result(BytesIO(ENVELOPE + CLOSE), payment_id=3)
+        self.assertFalse('payment' in result)
+
+    def test_stops_early(self):
+        source = Chunks(ENVELOPE, b'<not closed', CLOSE)
+        result = read_result(source, payment_id=1)
+        self.assertEqual(result['payment']['number'], 'XXXX1111')
+        self.assertEqual(source.chunks, [b'<not closed', CLOSE])
+
+    def test_fields_and_lists(self):
+        source = BytesIO(
+            b'<Envelope><Body><Response><Result>'
+            b'<resultCode>Error</resultCode><messages><MessagesTypeMessage>'
+            b'<code>E00039</code><text>Duplicate.</text>'
+            b'</MessagesTypeMessage></messages>'
+            b'<customerProfileId>7</customerProfileId>'
+            b'<customerPaymentProfileIdList><long>8</long><long>9</long>'
+            b'</customerPaymentProfileIdList>'
+            b'<ignored><customerProfileId>0</customerProfileId></ignored>'
+            b'</Result></Response></Body></Envelope>')
+        result = read_result(source, fields=['customerProfileId'],
+            lists=['customerPaymentProfileIdList'])
+        self.assertEqual(result, {
+            'resultCode': 'Error',
+            'code': 'E00039',
+            'text': 'Duplicate.',
+            'customerProfileId': '7',
+            'customerPaymentProfileIdList': ['8', '9'],
+        })
+
+    def test_fault(self):
+        source = BytesIO(
+            b'<soap:Envelope xmlns:soap="urn:soap"><soap:Body><soap:Fault>'
+            b'<faultcode>soap:Client</faultcode>'
+            b'<faultstring>Bad.</faultstring>'
+            b'</soap:Fault></soap:Body></soap:Envelope>')
+        self.assertRaises(IOError, read_result, source)
+
+
+class StreamingClientTests(TestCase):
+    def setUp(self):
+        self.gateway = Gateway()
+        self.client = AuthorizeClient('123', '456',
+            transport=StubTransport(self.gateway), streaming=True)
+        self.credit_card = CreditCard('4111111111111111',
+            date.today().year + 10, 1, '911', 'Jeff', 'Schenck')
+
+    def test_enabled(self):
+        self.assertTrue(self.client._customer.streaming)
+        self.assertTrue(self.client._recurring.streaming)
+        client = AuthorizeClient('123', '456', backend='json',
+            streaming=True)
+        self.assertFalse(hasattr(client._customer, 'streaming'))
+
+    def test_saved_card(self):
+        address = Address('45 Rose Ave', 'Venice', 'CA', '90291')
+        saved_card = self.client.card(self.credit_card, address,
+            'joe@example.com').save()
+        profile_id, payment_id = saved_card.uid.split('|')
+        self.assertEqual(self.client.saved_profile_ids(), [profile_id])
+        transaction = saved_card.auth(10)
+        self.assertEqual(transaction.full_response['amount'], '10.00')
+        transaction = saved_card.capture(10)
+        self.assertEqual(transaction.full_response['amount'], '10.00')
+        info = self.client._customer.retrieve_saved_payment(profile_id,
+            payment_id)
+        self.client._customer.streaming = False
+        expected = self.client._customer.retrieve_saved_payment(profile_id,
+            payment_id)
+        self.client._customer.streaming = True
+        self.assertEqual(vars(info.pop('address')),
+            vars(expected.pop('address')))
+        self.assertEqual(info, expected)
+        info = self.client._customer.retrieve_saved_payment(profile_id,
+            payment_id)
+        self.assertEqual(info['number'], 'XXXX1111')
+        self.assertEqual(info['email'], 'joe@example.com')
+        self.assertEqual(info['address'].zip_code, '90291')
+        self.assertRaises(AuthorizeError,
+            self.client._customer.retrieve_saved_payment, profile_id, 0)
+        saved_card.update(first_name='Jeffrey', email='jeff@example.com')
+        info = self.client._customer.retrieve_saved_payment(profile_id,
+            payment_id)
+        self.assertEqual(info['first_name'], 'Jeffrey')
+        self.assertEqual(info['email'], 'jeff@example.com')
+        saved_card.delete()
+        try:
+            saved_card.capture(10)
+        except AuthorizeResponseError as e:
+            self.assertEqual(e.full_response['response_code'], 'E00040')
+        else:
+            self.fail('AuthorizeResponseError not raised')
+
+    def test_recurring(self):
+        recurring = self.client.card(self.credit_card).recurring(10,
+            date.today(), months=1)
+        recurring.update(amount=20)
+        subscription = self.gateway.subscriptions[int(recurring.uid)]
+        self.assertEqual(str(subscription['amount']), '20.00')
+        recurring.delete()
+        self.assertRaises(AuthorizeResponseError, recurring.delete)
+
+    def test_connection_error(self):
+        class Broken(StubTransport):
+            def send(self, url, body, headers=None):
+                if b'DeleteCustomerProfile' in body:
+                    return StubTransport.send(self, url, b'not xml', headers)
+                return StubTransport.send(self, url, body, headers)
+        self.client._customer.transport = Broken(self.gateway)
+        self.assertRaises(AuthorizeConnectionError,
+            self.client._customer.delete_saved_profile, '1')
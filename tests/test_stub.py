@@ -0,0 +1,90 @@
+from datetime import date
+import json
+
+from unittest2 import TestCase
+
+from authorize import Address, AuthorizeClient, CreditCard
+from authorize.exceptions import AuthorizeResponseError
+from authorize.stub import DECLINED_CARD, Gateway, StubTransport
+
+
+class StubTests(TestCase):
+    backend = 'soap'
+
+    def setUp(self):
+        self.gateway = Gateway()
+        self.client = AuthorizeClient('123', '456',
+            transport=StubTransport(self.gateway), backend=self.backend)
+        self.credit_card = CreditCard('4111111111111111',
+            date.today().year + 10, 1, '911', 'Jeff', 'Schenck')
+
+    def test_transactions(self):
+        transaction = self.client.card(self.credit_card).auth(20)
+        self.assertEqual(transaction.full_response['amount'], '20.00')
+        self.assertEqual(transaction.full_response['transaction_type'],
+            'auth_only')
+        transaction.settle(10)
+        self.assertEqual(self.gateway.transactions[transaction.uid]['status'],
+            'captured')
+        credit = transaction.credit('1111', 5)
+        self.assertEqual(credit.full_response['transaction_type'], 'credit')
+        self.assertRaises(AuthorizeResponseError, transaction.credit,
+            '1111', 6)
+
+    def test_declined(self):
+        credit_card = CreditCard(DECLINED_CARD, date.today().year + 10, 1,
+            '911')
+        try:
+            self.client.card(credit_card).capture(20)
+        except AuthorizeResponseError as e:
+            self.assertEqual(e.full_response['response_code'], '2')
+        else:
+            self.fail('AuthorizeResponseError not raised')
+
+    def test_unknown_transaction(self):
+        self.assertRaises(AuthorizeResponseError,
+            self.client.transaction('123').void)
+
+    def test_saved_card(self):
+        address = Address('45 Rose Ave', 'Venice', 'CA', '90291')
+        saved_card = self.client.card(self.credit_card, address,
+            'joe@example.com').save()
+        profile_id, payment_id = saved_card.uid.split('|')
+        transaction = saved_card.capture(10)
+        self.assertEqual(transaction.full_response['amount'], '10.00')
+        info = self.client._customer.retrieve_saved_payment(profile_id,
+            payment_id)
+        self.assertEqual(info['number'], 'XXXX1111')
+        self.assertEqual(info['first_name'], 'Jeff')
+        self.assertEqual(info['email'], 'joe@example.com')
+        self.assertEqual(info['address'].zip_code, '90291')
+        saved_card.delete()
+        self.assertRaises(AuthorizeResponseError, saved_card.capture, 10)
+
+    def test_recurring(self):
+        recurring = self.client.card(self.credit_card).recurring(10,
+            date.today(), months=1)
+        recurring.update(amount=20)
+        subscription = self.gateway.subscriptions[int(recurring.uid)]
+        self.assertEqual(str(subscription['amount']), '20.00')
+        recurring.delete()
+        self.assertRaises(AuthorizeResponseError, recurring.delete)
+
+    def test_unknown_operation(self):
+        code, body = self.gateway.handle_soap(
+            b'<Envelope xmlns="http://schemas.xmlsoap.org/soap/envelope/">'
+            b'<Body><Unknown/></Body></Envelope>')
+        self.assertEqual(code, 500)
+        self.assertTrue('Unknown operation' in body)
+        code, body = self.gateway.handle_soap(b'not xml')
+        self.assertEqual(code, 500)
+
+
+class JSONStubTests(StubTests):
+    backend = 'json'
+
+    def test_malformed_json(self):
+        code, body = self.gateway.handle_json(b'{"a": 1, "b": 2}')
+        self.assertEqual(code, 400)
+        code, body = self.gateway.handle_json(b'{"unknownRequest": {}}')
+        self.assertEqual(json.loads(body)['messages']['resultCode'], 'Error')
@@ -0,0 +1,143 @@
+from datetime import date
+import logging
+
+import mock
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize.emulator import start_emulator
+from authorize.exceptions import AuthorizeConnectionError, \
+    AuthorizeResponseError
+from authorize.timing import add_listener, CallTiming, collect, mark, \
+    remove_listener, SlowCallLog, timed
+from authorize.transport import InstrumentedTransport
+from test_api_transaction import ERROR, SUCCESS
+
+
+class CallTimingTests(TestCase):
+    def test_phases(self):
+        with collect() as timings:
+            with timed('aim', 'AUTH_ONLY') as timing:
+                mark('build')
+                mark('network')
+                mark('network')
+            mark('ignored')
+        self.assertEqual(timings, [timing])
+        self.assertEqual(list(timing.phases), ['build', 'network'])
+        self.assertTrue(sum(timing.phases.values()) <= timing.total)
+        self.assertEqual(timing.error, None)
+        self.assertEqual(timing.to_dict()['operation'], 'AUTH_ONLY')
+        self.assertTrue('build=0.000s' in timing.format())
+
+    def test_slow_call_log(self):
+        logger = mock.Mock(spec=logging.Logger)
+        timing = CallTiming('cim', 'GetCustomerProfile')
+        timing.mark('network')
+        SlowCallLog(threshold=10, logger=logger)(timing)
+        self.assertFalse(logger.warning.called)
+        SlowCallLog(threshold=0, logger=logger)(timing)
+        args = logger.warning.call_args[0]
+        self.assertEqual(args[1:3], ('cim', 'GetCustomerProfile'))
+        self.assertTrue(args[-1].startswith('network='))
+
+
+class ClientTimingTests(TestCase):
+    def setUp(self):
+        self.patcher = mock.patch('authorize.apis.transaction.urlopen')
+        self.urlopen = self.patcher.start()
+        self.urlopen.side_effect = lambda *args, **kwargs: (
+            SUCCESS.seek(0) or SUCCESS)
+        self.client = AuthorizeClient('123', '456')
+        self.credit_card = CreditCard('4111111111111111',
+            date.today().year + 10, 1, '911')
+        self.timings = []
+        add_listener(self.timings.append)
+
+    def tearDown(self):
+        remove_listener(self.timings.append)
+        self.patcher.stop()
+
+    def test_transaction_timing(self):
+        transaction = self.client.card(self.credit_card).auth(20)
+        timing = transaction.timing
+        self.assertEqual((timing.endpoint, timing.operation),
+            ('aim', 'AUTH_ONLY'))
+        self.assertEqual(list(timing.phases),
+            ['build', 'wait', 'network', 'parse'])
+        self.assertEqual(self.timings, [timing])
+
+    def test_journal_hit(self):
+        card = self.client.card(self.credit_card)
+        self.assertNotEqual(card.capture(20, idempotency_key='a').timing,
+            None)
+        self.assertEqual(card.capture(20, idempotency_key='a').timing, None)
+        self.assertEqual(self.client.transaction('1').timing, None)
+
+    def test_failing_listener(self):
+        def fail(timing):
+            raise ValueError('Broken listener')
+        add_listener(fail)
+        try:
+            with mock.patch('authorize.timing.log') as log:
+                card = self.client.card(self.credit_card)
+                first = card.capture(20, idempotency_key='order-1')
+                second = card.capture(20, idempotency_key='order-1')
+        finally:
+            remove_listener(fail)
+        self.assertEqual(first.full_response['response_code'], '1')
+        self.assertEqual(second.full_response, first.full_response)
+        # The journal kept the response, so the card was charged once
+        self.assertEqual(self.urlopen.call_count, 1)
+        stored = self.client.journal.claim('123:capture:order-1')
+        self.assertEqual(stored['transaction_id'],
+            first.full_response['transaction_id'])
+        self.assertEqual(log.exception.call_count, 1)
+        self.assertEqual(len(self.timings), 1)
+
+    def test_error_timing(self):
+        self.urlopen.side_effect = lambda *args, **kwargs: (
+            ERROR.seek(0) or ERROR)
+        try:
+            self.client.card(self.credit_card).auth(20)
+        except AuthorizeResponseError as e:
+            self.assertTrue(e.timing is self.timings[0])
+            self.assertTrue(e.timing.error is e)
+            self.assertEqual(list(e.timing.phases)[-1], 'parse')
+        else:
+            self.fail('AuthorizeResponseError not raised')
+        self.urlopen.side_effect = IOError('Borked')
+        try:
+            self.client.card(self.credit_card).auth(20)
+        except AuthorizeConnectionError as e:
+            self.assertEqual(list(e.timing.phases), ['build', 'wait'])
+        else:
+            self.fail('AuthorizeConnectionError not raised')
+
+
+class InstrumentedTransportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_emulator()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_phases(self):
+        client = AuthorizeClient('123', '456', base_url=self.server.base_url,
+            transport=InstrumentedTransport(timeout=10))
+        credit_card = CreditCard('4111111111111111', date.today().year + 10,
+            1, '911')
+        transaction = client.card(credit_card).auth(20)
+        self.assertEqual(list(transaction.timing.phases), ['build', 'wait',
+            'dns', 'connect', 'first_byte', 'transfer', 'network', 'parse'])
+        saved = client.card(credit_card).save()
+        transaction = saved.capture(20)
+        self.assertEqual(transaction.timing.endpoint, 'cim')
+        self.assertEqual(list(transaction.timing.phases), ['wait', 'build',
+            'dns', 'connect', 'first_byte', 'transfer', 'network', 'parse'])
+
+    def test_connection_error(self):
+        transport = InstrumentedTransport(timeout=10)
+        self.assertRaises(IOError, transport.send,
+            'http://127.0.0.1:1/gateway/transact.dll', b'', {})
@@ -0,0 +1,83 @@
+from datetime import date
+
+import mock
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize import tracing
+from authorize.tracing import mark, RecordingTracer, set_tracer, span, \
+    traced
+from test_api_transaction import SUCCESS
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        self.tracer = RecordingTracer()
+        set_tracer(self.tracer)
+
+    def tearDown(self):
+        set_tracer(None)
+
+    def test_no_tracer(self):
+        set_tracer(None)
+        with span('outer') as outer:
+            outer.set_attribute('a', 1)
+            mark('build')
+        self.assertTrue(outer is tracing._NULL_SPAN)
+        self.assertEqual(self.tracer.spans, [])
+
+    def test_nested_spans(self):
+        with span('outer', a=1):
+            with span('aim', 'AUTH_ONLY') as inner:
+                inner.set_attribute('b', 2)
+        inner, outer = self.tracer.spans
+        self.assertEqual(outer.name, 'outer')
+        self.assertEqual(outer.parent, None)
+        self.assertEqual(outer.attributes, {'a': 1})
+        self.assertEqual(inner.name, 'aim.AUTH_ONLY')
+        self.assertTrue(inner.parent is outer)
+        self.assertEqual(inner.attributes, {'b': 2})
+
+    def test_phases(self):
+        with span('aim'):
+            mark('build')
+            mark('network')
+        build, network, call = self.tracer.spans
+        self.assertEqual([build.name, network.name], ['build', 'network'])
+        self.assertTrue(build.parent is call)
+        self.assertEqual(build.start_time, call.start_time)
+        self.assertEqual(build.end_time, network.start_time)
+        self.assertTrue(network.end_time <= call.end_time)
+
+    def test_error(self):
+        try:
+            with span('aim'):
+                raise ValueError('Borked')
+        except ValueError:
+            pass
+        self.assertTrue(isinstance(self.tracer.spans[0].error, ValueError))
+
+    def test_traced(self):
+        @traced('Thing.method')
+        def method(value):
+            """Docs."""
+            with span('inner'):
+                return value
+        self.assertEqual(method(1), 1)
+        self.assertEqual(method.__doc__, 'Docs.')
+        inner, outer = self.tracer.spans
+        self.assertEqual(outer.name, 'Thing.method')
+        self.assertTrue(inner.parent is outer)
+
+    @mock.patch('authorize.apis.transaction.urlopen')
+    def test_client_spans(self, urlopen):
+        urlopen.side_effect = lambda *args, **kwargs: SUCCESS.seek(0) or \
+            SUCCESS
+        client = AuthorizeClient('123', '456')
+        credit_card = CreditCard('4111111111111111', date.today().year + 10,
+            1, '911')
+        client.card(credit_card).auth(10)
+        names = [s.name for s in self.tracer.spans]
+        self.assertEqual(names, ['build', 'wait', 'network', 'parse',
+            'aim.AUTH_ONLY', 'AuthorizeCreditCard.auth'])
+        self.assertTrue(self.tracer.spans[4].parent is self.tracer.spans[5])
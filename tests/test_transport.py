@@ -0,0 +1,256 @@
+import gzip
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+
+from six import BytesIO
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from suds.transport import Request, TransportError
+from unittest2 import SkipTest, TestCase
+
+import mock
+
+from authorize.transport import DNSCache, PooledTransport, Reply, \
+    SudsTransport, Transport
+
+
+class EchoServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    # Answers with the request body, or the path of GET requests, gzipped
+    # if asked, and records the client port of each request
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._respond(self.path.encode('ascii'))
+
+    def do_POST(self):
+        self._respond(self.rfile.read(int(self.headers['Content-Length'])))
+
+    def _respond(self, body):
+        self.server.ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buffer = BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+                f.write(body)
+            body = buffer.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path.endswith('close'):
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StaticTransport(Transport):
+    def __init__(self, reply):
+        self.reply = reply
+
+    def open(self, url, headers=None):
+        return self.reply
+
+    def send(self, url, body, headers=None):
+        self.sent = (url, body, headers)
+        return self.reply
+
+
+class ReplyTests(TestCase):
+    def test_text(self):
+        reply = Reply(200, {'content-type': 'text/xml; charset="UTF-8"'},
+            u'caf\xe9'.encode('utf-8'))
+        self.assertEqual(reply.charset, 'utf-8')
+        self.assertEqual(reply.text(), u'caf\xe9')
+        reply = Reply(200, {}, b'caf\xe9')
+        self.assertEqual(reply.charset, None)
+        self.assertEqual(reply.text(), u'caf\xe9')
+
+
+class SudsTransportTests(TestCase):
+    def test_send(self):
+        transport = StaticTransport(Reply(200, {}, b'<xml/>'))
+        request = Request('https://example.com/', b'<request/>')
+        request.headers = {'SOAPAction': '"Op"'}
+        reply = SudsTransport(transport).send(request)
+        self.assertEqual(reply.code, 200)
+        self.assertEqual(reply.message, b'<xml/>')
+        self.assertEqual(transport.sent, ('https://example.com/',
+            b'<request/>', {'SOAPAction': '"Op"'}))
+
+    def test_fault(self):
+        transport = StaticTransport(Reply(500, {}, b'<fault/>'))
+        request = Request('https://example.com/', b'<request/>')
+        try:
+            SudsTransport(transport).send(request)
+        except TransportError as e:
+            self.assertEqual(e.httpcode, 500)
+            self.assertEqual(e.fp.read(), b'<fault/>')
+        else:
+            self.fail('TransportError not raised')
+
+    def test_open(self):
+        transport = StaticTransport(Reply(200, {}, b'<wsdl/>'))
+        request = Request('https://example.com/?WSDL')
+        self.assertEqual(SudsTransport(transport).open(request).read(),
+            b'<wsdl/>')
+        transport.reply = Reply(404, {}, b'')
+        self.assertRaises(TransportError, SudsTransport(transport).open,
+            request)
+
+
+def start_server(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+class PooledTransportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = EchoServer(('127.0.0.1', 0), EchoHandler)
+        cls.thread = start_server(cls.server)
+        cls.url = 'http://127.0.0.1:{0}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def setUp(self):
+        self.server.ports = []
+        self.transport = PooledTransport()
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_reuses_connections(self):
+        for body in (b'one', b'two', b'three'):
+            reply = self.transport.send(self.url + '/soap', body)
+            self.assertEqual(reply.body, body)
+        self.assertEqual(self.transport.open(self.url + '/wsdl?x=1').text(),
+            u'/wsdl?x=1')
+        self.assertEqual(len(set(self.server.ports)), 1)
+
+    def test_gzip(self):
+        reply = self.transport.send(self.url, b'<xml/>' * 100)
+        self.assertEqual(reply.body, b'<xml/>' * 100)
+        self.assertFalse('content-encoding' in reply.headers)
+        self.transport.compress = False
+        self.assertEqual(self.transport.send(self.url, b'<xml/>').body,
+            b'<xml/>')
+
+    def test_closed_connections(self):
+        self.transport.open(self.url + '/close')
+        self.transport.open(self.url + '/')
+        self.transport.close()
+        self.transport.open(self.url + '/')
+        self.assertEqual(len(set(self.server.ports)), 3)
+
+    def test_idle_timeout(self):
+        self.transport.idle_timeout = -1
+        self.transport.open(self.url + '/')
+        self.transport.open(self.url + '/')
+        self.assertEqual(len(set(self.server.ports)), 2)
+
+    def test_connection_error(self):
+        self.assertRaises(IOError, self.transport.open,
+            'http://127.0.0.1:1/')
+
+    def test_fork(self):
+        self.transport.open(self.url + '/')
+        with mock.patch('authorize.transport.os.getpid',
+                return_value=os.getpid() + 1):
+            self.transport.open(self.url + '/')
+            self.transport.open(self.url + '/')
+        self.assertEqual(len(set(self.server.ports)), 2)
+
+    def test_dns_cache(self):
+        self.transport.open(self.url + '/close')
+        self.transport.open(self.url + '/')
+        stats = self.transport.stats()
+        self.assertEqual((stats['dns_misses'], stats['dns_hits']), (1, 1))
+
+
+class DNSCacheTests(TestCase):
+    def test_resolve(self):
+        cache = DNSCache(ttl=60)
+        with mock.patch('socket.getaddrinfo') as getaddrinfo:
+            getaddrinfo.return_value = ['address']
+            self.assertEqual(cache.resolve('example.com', 443), ['address'])
+            self.assertEqual(cache.resolve('example.com', 443), ['address'])
+            self.assertEqual(getaddrinfo.call_count, 1)
+            cache.resolve('example.com', 80)
+            cache.forget('example.com', 443)
+            cache.resolve('example.com', 443)
+            self.assertEqual(getaddrinfo.call_count, 3)
+            expired = DNSCache(ttl=-1)
+            expired.resolve('example.com', 443)
+            expired.resolve('example.com', 443)
+            self.assertEqual(getaddrinfo.call_count, 5)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+
+class TLSResumptionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not hasattr(ssl.SSLSocket, 'session'):
+            raise SkipTest('Requires TLS session support')
+        cls.directory = tempfile.mkdtemp()
+        cls.cert = os.path.join(cls.directory, 'cert.pem')
+        key = os.path.join(cls.directory, 'key.pem')
+        try:
+            subprocess.check_call(['openssl', 'req', '-x509', '-newkey',
+                'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                '-addext', 'subjectAltName=DNS:localhost', '-keyout', key,
+                '-out', cls.cert], stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(cls.directory)
+            raise SkipTest('Requires openssl')
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cls.cert, key)
+        cls.server = EchoServer(('127.0.0.1', 0), EchoHandler)
+        cls.server.socket = context.wrap_socket(cls.server.socket,
+            server_side=True)
+        cls.thread = start_server(cls.server)
+        cls.url = 'https://localhost:{0}'.format(
+            cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.server.ports = []
+
+    def test_resumption(self):
+        context = ssl.create_default_context(cafile=self.cert)
+        transport = PooledTransport(context=context)
+        for _ in range(3):
+            reply = transport.send(self.url + '/close', b'hello')
+            self.assertEqual(reply.body, b'hello')
+        stats = transport.stats()
+        self.assertEqual(stats['handshakes'], 1)
+        self.assertEqual(stats['resumed'], 2)
+        self.assertEqual(len(set(self.server.ports)), 3)
+
+    def test_bad_certificate(self):
+        transport = PooledTransport()
+        self.assertRaises(IOError, transport.open, self.url + '/')
@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import mock
+from unittest2 import TestCase
+
+from authorize.apis.customer import CustomerAPI
+from authorize.apis.recurring import RecurringAPI
+from authorize.data import CreditCard, Money
+from authorize.exceptions import AuthorizeInvalidError
+from authorize.validation import validate, validate_batch, VALIDATORS
+
+
+class ValidationTests(TestCase):
+    def setUp(self):
+        year = date.today().year + 10
+        self.credit_card = CreditCard('4111111111111111', year, 1, '911',
+            'Jeff', 'Schenck')
+        self.start = date.today() + timedelta(days=7)
+
+    def test_validate(self):
+        validate('aim.AUTH_ONLY', amount=0)
+        validate('aim.AUTH_CAPTURE', amount=Money(1))
+        validate('aim.PRIOR_AUTH_CAPTURE', amount=None)
+        validate('cim.AUTH_ONLY', amount='20.00', cvv='1234')
+        for operation, args in [
+                ('aim.AUTH_CAPTURE', {'amount': 0}),
+                ('aim.AUTH_ONLY', {'amount': '-1'}),
+                ('aim.CREDIT', {}),
+                ('cim.AUTH_CAPTURE', {'amount': 20, 'cvv': '91'}),
+                ('cim.CREDIT', {'amount': 10.005}),
+                ('arb.ARBUpdateSubscription', {'occurrences': 10000}),
+                ('arb.ARBUpdateSubscription',
+                    {'start': date.today() - timedelta(days=1)})]:
+            self.assertRaises(AuthorizeInvalidError, validate, operation,
+                **args)
+
+    def test_validate_batch(self):
+        rows = [
+            {'credit_card': self.credit_card, 'amount': 10,
+                'start': self.start, 'months': 1},
+            {'credit_card': self.credit_card, 'amount': 0,
+                'start': self.start, 'days': 3, 'trial_amount': 5},
+            {'credit_card': self.credit_card, 'amount': '9.99',
+                'start': self.start, 'days': 30, 'occurrences': 12,
+                'trial_amount': 5, 'trial_occurrences': 2},
+        ]
+        self.assertEqual(validate_batch('arb.ARBCreateSubscription', rows), [
+            (1, [
+                'The amount must be at least 0.01.',
+                'The interval days must be an integer value between 7 and '
+                    '365.',
+                'To indicate a trial period, you must provide both a trial '
+                    'amount and occurrences.',
+            ]),
+        ])
+        self.assertEqual(repr(VALIDATORS['aim.CREDIT']),
+            '<Validator aim.CREDIT>')
+
+    def test_fails_before_building_requests(self):
+        # An invalid call never touches the SOAP client, which would load
+        # the WSDL and build the request objects
+        with mock.patch.object(RecurringAPI, 'client',
+                new_callable=mock.PropertyMock) as client:
+            api = RecurringAPI('123', '456')
+            self.assertRaises(AuthorizeInvalidError, api.create_subscription,
+                self.credit_card, 10, self.start, days=400)
+            self.assertRaises(AuthorizeInvalidError, api.update_subscription,
+                '1', amount='ten')
+            self.assertFalse(client.called)
+        with mock.patch.object(CustomerAPI, 'client',
+                new_callable=mock.PropertyMock) as client:
+            api = CustomerAPI('123', '456')
+            self.assertRaises(AuthorizeInvalidError, api.auth, '1', '2',
+                20, 'abc')
+            self.assertRaises(AuthorizeInvalidError, api.credit, '1', '2',
+                -20)
+            self.assertFalse(client.called)
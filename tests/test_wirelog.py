@@ -0,0 +1,117 @@
+from datetime import date
+import json
+import logging
+import threading
+
+from unittest2 import TestCase
+
+from authorize import AuthorizeClient, CreditCard
+from authorize.exceptions import AuthorizeResponseError
+from authorize.stub import DECLINED_CARD, StubTransport
+from authorize.timing import CallTiming
+from authorize.wirelog import capture, get_wire_logger, \
+    set_wire_logger, WireLogger
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class WireLoggerTests(TestCase):
+    def setUp(self):
+        self.handler = ListHandler()
+        self.logger = logging.getLogger('authorize.wire.test')
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.client = AuthorizeClient('123', '456',
+            transport=StubTransport())
+        self.credit_card = CreditCard('4111111111111111',
+            date.today().year + 10, 1, '911', 'Jeff', 'Schenck')
+
+    def tearDown(self):
+        set_wire_logger(None)
+        self.logger.removeHandler(self.handler)
+
+    def install(self, **options):
+        wire_logger = WireLogger(logger=self.logger, **options)
+        set_wire_logger(wire_logger)
+        self.assertTrue(get_wire_logger() is wire_logger)
+        return wire_logger
+
+    def records(self):
+        get_wire_logger().flush()
+        return [json.loads(r.getMessage()) for r in self.handler.records]
+
+    def test_sampled(self):
+        self.install(sample_rate=1)
+        self.client.card(self.credit_card).auth(20)
+        record, = self.records()
+        self.assertEqual((record['endpoint'], record['operation']),
+            ('aim', 'AUTH_ONLY'))
+        self.assertTrue('x_card_num=XXXX1111' in record['request'])
+        self.assertFalse('4111111111111111' in record['request'])
+        self.assertFalse('456' in record['request'])
+        self.assertTrue('approved' in record['response'])
+        self.assertEqual(self.handler.records[0].levelno, logging.INFO)
+
+    def test_soap(self):
+        self.install(sample_rate=1, max_body=100000)
+        self.client.card(self.credit_card).save()
+        records = self.records()
+        self.assertEqual([r['operation'] for r in records],
+            ['CreateCustomerProfile'])
+        self.assertTrue('cardNumber>XXXX1111<' in records[0]['request'])
+        self.assertTrue('<customerProfileId>' in records[0]['response'])
+
+    def test_errors_and_slow_calls(self):
+        self.install(sample_rate=0, slow=60)
+        self.client.card(self.credit_card).auth(20)
+        credit_card = CreditCard(DECLINED_CARD, date.today().year + 10, 1,
+            '911')
+        self.assertRaises(AuthorizeResponseError,
+            self.client.card(credit_card).capture, 20)
+        get_wire_logger().slow = 0
+        self.client.card(self.credit_card).auth(21)
+        records = self.records()
+        self.assertEqual(len(records), 2)
+        self.assertTrue(records[0]['error'].startswith(
+            'AuthorizeResponseError'))
+        self.assertEqual(self.handler.records[0].levelno, logging.WARNING)
+        self.assertEqual(records[1]['error'], None)
+
+    def test_truncated(self):
+        self.install(sample_rate=1, max_body=20)
+        self.client.card(self.credit_card).auth(20)
+        record = self.records()[0]
+        self.assertEqual(len(record['request']), 20)
+        self.assertTrue(record['request_size'] > 20)
+
+    def test_dropped(self):
+        wire_logger = self.install(sample_rate=1, queue_size=1)
+        release = threading.Event()
+        writing = threading.Event()
+        write = wire_logger.write
+
+        def blocked(call, bodies):
+            writing.set()
+            release.wait()
+            write(call, bodies)
+        wire_logger.write = blocked
+        wire_logger(CallTiming('aim', 'AUTH_ONLY'))
+        writing.wait()
+        wire_logger(CallTiming('aim', 'AUTH_ONLY'))
+        wire_logger(CallTiming('aim', 'AUTH_ONLY'))
+        self.assertEqual(wire_logger.dropped, 1)
+        release.set()
+        self.assertEqual(len(self.records()), 2)
+
+    def test_not_installed(self):
+        capture('request', b'ignored')
+        self.client.card(self.credit_card).auth(20)
+        self.assertEqual(self.handler.records, [])